@@ -0,0 +1,119 @@
+from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max
+from django.utils.functional import cached_property
+
+from catalog.models import Category, Product, ProductImage, ProductItem
+from catalog.signals import stock_changed
+
+
+def estimate_count(queryset):
+    """
+    Cheap row count estimate of the table of an unfiltered queryset: the
+    planner statistics on PostgreSQL, MAX(id) elsewhere. Both only read
+    metadata or one index entry, and may be off after deletes.
+    """
+    model = queryset.model
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+                           [model._meta.db_table])
+            row = cursor.fetchone()
+        if row and row[0] > 0:
+            return int(row[0])
+
+    return model._default_manager.using(queryset.db).aggregate(
+        max_pk=Max('pk'))['max_pk'] or 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator which does not COUNT(*) large unfiltered tables. Below
+    EXACT_COUNT_LIMIT rows, and for filtered or searched lists, the count
+    is exact.
+    """
+    EXACT_COUNT_LIMIT = 10000
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is None or query.where:
+            return super().count
+
+        estimate = estimate_count(self.object_list)
+        if estimate < self.EXACT_COUNT_LIMIT:
+            return super().count
+        return estimate
+
+
+class CatalogAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    # Filtered lists would run a second COUNT(*) of the whole table for
+    # "x results (y total)".
+    show_full_result_count = False
+
+
+class ProductItemInline(admin.TabularInline):
+    model = ProductItem
+    fields = ['size', 'quantity']
+    extra = 0
+
+
+class ProductImageInline(admin.TabularInline):
+    model = ProductImage
+    fields = ['image_large', 'sort']
+    extra = 0
+
+
+@admin.register(Category)
+class CategoryAdmin(CatalogAdmin):
+    list_display = ['name', 'slug', 'sort', 'products_count', 'in_stock_count']
+    prepopulated_fields = {'slug': ['name']}
+
+
+@admin.register(Product)
+class ProductAdmin(CatalogAdmin):
+    list_display = ['name', 'category', 'price', 'discount', 'effective_price', 'date_added']
+    list_select_related = ['category']
+    list_filter = ['category']
+    search_fields = ['name']
+    prepopulated_fields = {'slug': ['name']}
+    inlines = [ProductItemInline, ProductImageInline]
+
+    def save_formset(self, request, form, formset, change):
+        if formset.model is not ProductItem:
+            return super().save_formset(request, form, formset, change)
+
+        # Save the size/quantity grid with one statement per kind of change
+        # instead of one save() and counter update per row.
+        items = formset.save(commit=False)
+        if formset.deleted_objects:
+            ProductItem.objects.filter(
+                pk__in=[item.pk for item in formset.deleted_objects]).delete()
+        ProductItem.objects.bulk_create([item for item in items if item.pk is None])
+        ProductItem.objects.bulk_update(
+            [item for item in items if item.pk is not None], ['size', 'quantity'])
+
+        if items:
+            stock_changed.send(sender=ProductItem, item_ids=list(
+                ProductItem.objects.filter(product=form.instance).values_list('pk', flat=True)))
+
+
+@admin.register(ProductItem)
+class ProductItemAdmin(CatalogAdmin):
+    list_display = ['__str__', 'size', 'quantity']
+    list_editable = ['quantity']
+    list_select_related = ['product']
+    list_filter = ['size']
+    search_fields = ['product__name']
+    autocomplete_fields = ['product']
+
+
+@admin.register(ProductImage)
+class ProductImageAdmin(CatalogAdmin):
+    list_display = ['__str__', 'sort']
+    list_select_related = ['product']
+    search_fields = ['product__name']
+    autocomplete_fields = ['product']
@@ -0,0 +1,177 @@
+import math
+import random
+import threading
+import time
+from collections import Counter, OrderedDict
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+
+VERSION_KEY = 'catalog:version'
+
+# Scopes of cached responses, versioned on their own so that a change only
+# invalidates the responses showing the changed objects.
+CATEGORIES_SCOPE = 'categories'
+
+
+def category_scope(category_id):
+    return f'category:{category_id}'
+
+
+def product_scope(product_id):
+    return f'product:{product_id}'
+
+
+def get_version(*scopes):
+    """Return the version of all cached catalog responses and of the scopes."""
+    keys = [VERSION_KEY, *(f'{VERSION_KEY}:{scope}' for scope in scopes)]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            version = uuid4().hex
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+            versions[key] = version
+    return ':'.join(versions[key] for key in keys)
+
+
+def bump_version(scopes=None):
+    """Invalidate cached catalog responses of the scopes, or all of them, in every process."""
+    if scopes is None:
+        cache.set(VERSION_KEY, uuid4().hex, None)
+    else:
+        cache.set_many({f'{VERSION_KEY}:{scope}': uuid4().hex for scope in scopes}, None)
+
+
+class TieredCache:
+    """
+    Two-tier cache: a size-limited per-process LRU in front of a shared
+    Django cache backend.
+
+    Only one thread per process and, through an add() lock in the shared
+    backend, one process at a time recomputes a missing key; the others
+    wait for its result. Hot keys are recomputed shortly before they
+    expire with a probability growing as expiry nears (XFetch), while the
+    current value is still served to everybody else.
+    """
+
+    def __init__(self, backend, max_entries=512, lock_timeout=10, wait_timeout=5, poll_interval=0.05, beta=1.0):
+        self.backend = backend
+        self.max_entries = max_entries
+        self.lock_timeout = lock_timeout
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.beta = beta
+        self.counters = Counter()
+        self._local = OrderedDict()
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'local_hits': self.counters['local_hits'],
+                'shared_hits': self.counters['shared_hits'],
+                'misses': self.counters['misses'],
+                'waits': self.counters['waits'],
+                'early_refreshes': self.counters['early_refreshes'],
+                'local_entries': len(self._local),
+            }
+
+    def get_or_set(self, key, compute, timeout):
+        entry = self._get(key)
+        if entry is not None and not self._should_refresh(entry):
+            return entry[0]
+
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = threading.Event()
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            if entry is not None:
+                return entry[0]
+            self._count('waits')
+            flight.wait(self.wait_timeout)
+            entry = self._get(key)
+            return entry[0] if entry is not None else compute()
+
+        try:
+            return self._compute(key, compute, timeout, entry)
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.set()
+
+    def _compute(self, key, compute, timeout, stale):
+        lock_key = f'{key}:lock'
+        locked = self.backend.add(lock_key, 1, self.lock_timeout)
+        if not locked:
+            if stale is not None:
+                return stale[0]
+
+            # Another process is computing the value, wait for it to appear.
+            self._count('waits')
+            deadline = time.monotonic() + self.wait_timeout
+            while time.monotonic() < deadline:
+                time.sleep(self.poll_interval)
+                entry = self._get_shared(key)
+                if entry is not None:
+                    return entry[0]
+
+        self._count('misses' if stale is None else 'early_refreshes')
+        try:
+            start = time.time()
+            value = compute()
+            delta = time.time() - start
+            entry = (value, delta, time.time() + timeout)
+            self.backend.set(key, entry, timeout)
+            self._set_local(key, entry)
+        finally:
+            if locked:
+                self.backend.delete(lock_key)
+        return value
+
+    def _should_refresh(self, entry):
+        _, delta, expiry = entry
+        return time.time() - delta * self.beta * math.log(1 - random.random()) >= expiry
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is not None:
+                if entry[2] > time.time():
+                    self._local.move_to_end(key)
+                    self.counters['local_hits'] += 1
+                    return entry
+                del self._local[key]
+
+        entry = self._get_shared(key)
+        if entry is not None:
+            self._set_local(key, entry)
+        return entry
+
+    def _get_shared(self, key):
+        entry = self.backend.get(key)
+        if entry is not None:
+            self._count('shared_hits')
+        return entry
+
+    def _set_local(self, key, entry):
+        with self._lock:
+            self._local[key] = entry
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+
+catalog_cache = TieredCache(
+    cache, max_entries=settings.CATALOG_CACHE_LOCAL_ENTRIES)
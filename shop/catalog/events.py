@@ -0,0 +1,272 @@
+"""
+Live stock updates as Server-Sent Events, served by shop.asgi outside of the
+Django request stack:
+
+    GET /api/v1/stock/events/?ids=1,2,3
+
+The stream starts with the sizes and quantities of the products, as in the
+availability API, and continues with a `stock` event whenever they change:
+
+    event: stock
+    data: {"1": [{"size": 48, "quantity": 2}]}
+
+A comment line is sent every STOCK_EVENTS_HEARTBEAT seconds so proxies keep
+idle connections open. Opening a connection takes a token of the request
+throttle of catalog.throttling, and a client address holds at most
+STOCK_EVENTS_MAX_CONNECTIONS_PER_IP connections to a worker.
+
+All connections of a worker share one broadcaster. While anybody listens,
+it follows the catalog change log, which every process appends to, every
+STOCK_EVENTS_POLL_INTERVAL seconds, or as soon as this process commits a
+stock change or a client connects to products nobody listens to yet. It
+reads the log CHANGES_BATCH entries at a time, the stock of changed
+subscribed products only, and the current stock of all new connections at
+once. It keeps the stock of subscribed products, so connections to them
+start without a query. A connection itself is a coroutine and a small
+subscriber object without queries of its own, so a worker holds thousands
+of idle ones.
+"""
+
+import asyncio
+import json
+import logging
+import math
+from collections import Counter
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Max
+from rest_framework.exceptions import ValidationError
+
+from catalog.models import CatalogChange, ProductItem
+from catalog.throttling import TokenBucketThrottle, client_address
+
+logger = logging.getLogger(__name__)
+
+PATH = '/api/v1/stock/events/'
+MAX_IDS = 100
+CHANGES_BATCH = 1000
+
+
+def read_stock(product_ids):
+    """Sizes and quantities of products by product id, as in the availability API."""
+    stock = {product_id: [] for product_id in product_ids}
+    items = ProductItem.objects.filter(product_id__in=product_ids).values_list(
+        'product_id', 'size', 'quantity')
+    for product_id, size, quantity in sorted(items):
+        stock[product_id].append({'size': size, 'quantity': quantity})
+    return stock
+
+
+def read_revision():
+    return CatalogChange.objects.aggregate(revision=Max('pk'))['revision'] or 0
+
+
+def read_changes(since, product_ids, new_product_ids):
+    """
+    Return the last revision read, the stock of subscribed products with
+    items changed or deleted after `since`, the stock of newly subscribed
+    products and whether more changes are left to read.
+    """
+    product_ids = set(product_ids)
+    changes = list(CatalogChange.objects.filter(
+        pk__gt=since, object_type=CatalogChange.TYPE_PRODUCT_ITEM
+    ).order_by('pk').values_list('pk', 'product_id')[:CHANGES_BATCH])
+    revision = changes[-1][0] if changes else since
+    changed = {product_id for _, product_id in changes if product_id in product_ids}
+
+    # Read after the changes, so that no change is missed in between.
+    snapshot = read_stock(new_product_ids) if new_product_ids else {}
+    return revision, read_stock(changed) if changed else {}, snapshot, len(changes) == CHANGES_BATCH
+
+
+class Subscriber:
+    __slots__ = ('product_ids', 'pending', 'event')
+
+    def __init__(self, product_ids):
+        self.product_ids = product_ids
+        # Only the latest stock of a product is kept until it is sent.
+        self.pending = {}
+        self.event = asyncio.Event()
+
+    def publish(self, stock):
+        self.pending.update(stock)
+        self.event.set()
+
+    def take(self):
+        pending, self.pending = self.pending, {}
+        self.event.clear()
+        return pending
+
+
+class StockBroadcaster:
+    """
+    Publishes stock to subscribers of one event loop: the current stock of
+    products to their new subscribers and changed stock to all of them. A
+    single task polls the database for all subscribers while there are any.
+    """
+
+    def __init__(self):
+        self.subscribers = {}
+        # The latest stock of subscribed products.
+        self.stock = {}
+        self._new = []
+        self._loop = None
+        self._task = None
+        self._wake = None
+
+    def subscribe(self, subscriber):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._wake = asyncio.Event()
+            self._task = loop.create_task(self._poll())
+            self.stock = {}
+
+        for product_id in subscriber.product_ids:
+            self.subscribers.setdefault(product_id, set()).add(subscriber)
+        if all(product_id in self.stock for product_id in subscriber.product_ids):
+            subscriber.publish({product_id: self.stock[product_id] for product_id in subscriber.product_ids})
+        else:
+            self._new.append(subscriber)
+            self._wake.set()
+
+    def unsubscribe(self, subscriber):
+        for product_id in subscriber.product_ids:
+            subscribers = self.subscribers.get(product_id)
+            if subscribers is not None:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self.subscribers[product_id]
+                    self.stock.pop(product_id, None)
+
+    def wake(self):
+        """Poll right away, callable from any thread."""
+        loop, wake = self._loop, self._wake
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(wake.set)
+
+    async def _poll(self):
+        revision = None
+        while self.subscribers:
+            new, self._new = self._new, []
+            more = False
+            try:
+                if revision is None:
+                    revision = await sync_to_async(read_revision)()
+                revision, changed, snapshot, more = await sync_to_async(read_changes)(
+                    revision, list(self.subscribers),
+                    list({product_id for subscriber in new for product_id in subscriber.product_ids}))
+            except Exception:
+                logger.exception('Reading stock changes failed')
+                self._new = new + self._new
+            else:
+                for product_id, sizes in [*changed.items(), *snapshot.items()]:
+                    if product_id in self.subscribers:
+                        self.stock[product_id] = sizes
+                for subscriber in new:
+                    subscriber.publish({
+                        product_id: snapshot[product_id] for product_id in subscriber.product_ids})
+                for product_id, sizes in changed.items():
+                    for subscriber in self.subscribers.get(product_id, ()):
+                        subscriber.publish({product_id: sizes})
+
+            if more:
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), settings.STOCK_EVENTS_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+        self._new = []
+
+
+broadcaster = StockBroadcaster()
+# Open connections by client address.
+connections = Counter()
+
+
+def parse_product_ids(query_string):
+    # catalog.views imports catalog.signals, which imports this module.
+    from catalog.views import parse_ids
+
+    values = parse_qs(query_string.decode('latin-1')).get('ids', [''])
+    return parse_ids(values[-1], MAX_IDS)
+
+
+def format_event(stock):
+    data = json.dumps({str(product_id): sizes for product_id, sizes in stock.items()},
+                      separators=(',', ':'))
+    return f'event: stock\ndata: {data}\n\n'.encode()
+
+
+async def send_response(send, status, headers, body):
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def stock_events(scope, receive, send):
+    """ASGI application streaming stock changes of the products in `ids`."""
+    headers = [(b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no')]
+    request_headers = dict(scope['headers'])
+    origin = request_headers.get(b'origin', b'').decode('latin-1')
+    if origin in settings.CORS_ALLOWED_ORIGINS:
+        headers.append((b'access-control-allow-origin', origin.encode('latin-1')))
+
+    if scope['method'] != 'GET':
+        await send_response(send, 405, [*headers, (b'allow', b'GET')], b'')
+        return
+    try:
+        product_ids = parse_product_ids(scope['query_string'])
+    except ValidationError as e:
+        await send_response(send, 400, [*headers, (b'content-type', b'application/json')],
+                            json.dumps(e.detail).encode())
+        return
+
+    address = client_address({
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else None,
+        'HTTP_X_FORWARDED_FOR': request_headers.get(b'x-forwarded-for', b'').decode('latin-1') or None,
+    })
+    if connections[address] >= settings.STOCK_EVENTS_MAX_CONNECTIONS_PER_IP:
+        await send_response(send, 429, [*headers, (b'content-type', b'application/json')],
+                            b'{"detail":"Too many connections."}')
+        return
+    wait = TokenBucketThrottle.take(address)
+    if wait:
+        await send_response(send, 429, [
+            *headers, (b'content-type', b'application/json'), (b'retry-after', str(math.ceil(wait)).encode())
+        ], b'{"detail":"Request was throttled."}')
+        return
+
+    connections[address] += 1
+    subscriber = Subscriber(product_ids)
+    broadcaster.subscribe(subscriber)
+    disconnected = asyncio.ensure_future(wait_for_disconnect(receive, subscriber))
+    try:
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            *headers, (b'content-type', b'text/event-stream; charset=utf-8')]})
+
+        while not disconnected.done():
+            try:
+                await asyncio.wait_for(subscriber.event.wait(), settings.STOCK_EVENTS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                body = b': heartbeat\n\n'
+            else:
+                if disconnected.done():
+                    break
+                body = format_event(subscriber.take())
+            await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+    finally:
+        broadcaster.unsubscribe(subscriber)
+        disconnected.cancel()
+        connections[address] -= 1
+        if not connections[address]:
+            del connections[address]
+
+
+async def wait_for_disconnect(receive, subscriber):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+    # Stop waiting for changes.
+    subscriber.event.set()
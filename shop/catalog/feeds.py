@@ -0,0 +1,93 @@
+"""
+Yandex Market Language (YML) offer feed of the catalog for marketplaces.
+
+The feed is generated as a stream of text chunks. Products are read in
+primary key order, chunk_size at a time, with their items and images
+prefetched, so every chunk costs the same three queries and memory does
+not grow with the catalog. Every size of a product is an offer of the
+product's group_id, as marketplaces expect for clothing.
+"""
+
+from xml.sax.saxutils import escape, quoteattr
+
+from django.conf import settings
+from django.utils import timezone
+
+from catalog import storefront
+from catalog.models import Category, Product
+
+CHUNK_SIZE = 500
+# Marketplaces accept at most 10 pictures per offer.
+MAX_PICTURES = 10
+
+
+def iter_products(chunk_size=CHUNK_SIZE):
+    """Yield lists of products with their category, items and images."""
+    last_pk = 0
+    while True:
+        products = list(Product.objects.filter(pk__gt=last_pk).order_by('pk').select_related(
+            'category').prefetch_related('product_items', 'product_images')[:chunk_size])
+        if not products:
+            return
+        yield products
+        last_pk = products[-1].pk
+
+
+def element(tag, value, **attrs):
+    attrs = ''.join(f' {name}={quoteattr(str(attr))}' for name, attr in attrs.items())
+    return f'<{tag}{attrs}>{escape(str(value))}</{tag}>'
+
+
+def render_offers(product, build_absolute_uri):
+    pictures = [
+        build_absolute_uri(image.image_large.url)
+        for image in product.product_images.all()
+        if image.image_large
+    ][:MAX_PICTURES]
+    common = [
+        element('name', product.name),
+        element('url', storefront.product_url(product.category.slug, product.slug)),
+        element('price', product.new_price),
+        *([element('oldprice', product.price)] if product.discount else []),
+        element('currencyId', 'RUR'),
+        element('categoryId', product.category_id),
+        *(element('picture', url) for url in pictures),
+        element('description', product.description),
+    ]
+
+    for item in sorted(product.product_items.all(), key=lambda item: item.size):
+        yield ''.join([
+            f'<offer id="{item.id}" group_id="{product.id}" '
+            f'available="{"true" if item.quantity > 0 else "false"}">',
+            *common,
+            element('param', item.size, name='Размер'),
+            f'<count>{item.quantity}</count>',
+            '</offer>\n',
+        ])
+
+
+def yml_feed(build_absolute_uri, chunk_size=CHUNK_SIZE):
+    """
+    Yield the YML document in chunks. `build_absolute_uri` turns media
+    paths into the absolute URLs of pictures.
+    """
+    date = timezone.localtime().isoformat(timespec='minutes')
+    yield ''.join([
+        '<?xml version="1.0" encoding="UTF-8"?>\n',
+        f'<yml_catalog date="{date}">\n<shop>\n',
+        element('name', settings.SHOP_NAME), '\n',
+        element('company', settings.SHOP_COMPANY), '\n',
+        element('url', settings.SHOP_URL), '\n',
+        '<currencies><currency id="RUR" rate="1"/></currencies>\n',
+        '<categories>\n',
+        *(element('category', name, id=pk) + '\n'
+          for pk, name in Category.objects.values_list('pk', 'name').iterator()),
+        '</categories>\n<offers>\n',
+    ])
+
+    for products in iter_products(chunk_size):
+        yield ''.join(
+            offer for product in products
+            for offer in render_offers(product, build_absolute_uri))
+
+    yield '</offers>\n</shop>\n</yml_catalog>\n'
@@ -0,0 +1,156 @@
+import re
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+
+from catalog import cache, surrogate
+from catalog.models import Product, ProductItem, SimilarProduct
+
+TOKEN_RE = re.compile(r'\w\w+')
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the similar products of every product from TF-IDF vectors of their texts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=6,
+                            help='similar products kept per product, both within and across categories')
+        parser.add_argument('--chunk-size', type=int, default=256,
+                            help='products whose similarities are computed at once')
+        parser.add_argument('--max-df', type=float, default=0.8,
+                            help='ignore terms in more than this share of the products')
+
+    def handle(self, *args, **options):
+        try:
+            import numpy as np
+            from scipy import sparse
+        except ImportError:
+            raise CommandError('build_similar needs numpy and scipy: pip install numpy scipy')
+
+        start = time.monotonic()
+        in_stock = ProductItem.objects.filter(product=OuterRef('pk'), quantity__gt=0)
+        products = list(Product.objects.annotate(in_stock=Exists(in_stock)).order_by('pk').values_list(
+            'pk', 'category_id', 'in_stock', 'name', 'description', 'detail'))
+        if not products:
+            self.stdout.write('no products')
+            return
+
+        ids = np.array([row[0] for row in products])
+        # Small category numbers are cheaper to compare than their ids.
+        categories = np.unique([row[1] for row in products], return_inverse=True)[1].astype(np.int32)
+        candidates = np.flatnonzero([row[2] for row in products])
+        vectors = self.tfidf(np, sparse, [' '.join(row[3:]) for row in products], options['max_df'])
+        candidate_vectors = vectors[candidates].T.tocsr()
+        candidate_ids = ids[candidates]
+        candidate_categories = categories[candidates]
+        # The column of each product among the candidates, -1 if it is none.
+        own_columns = np.full(len(products), -1, dtype=np.int32)
+        own_columns[candidates] = np.arange(len(candidates))
+        product_ids = ids.tolist()
+
+        # (product_id, similar_id, same_category, rank, score) rows.
+        similar = []
+        top_k = options['top_k']
+        for chunk_start in range(0, len(products), options['chunk_size']):
+            rows = np.arange(chunk_start, min(chunk_start + options['chunk_size'], len(products)))
+            # Sparse, a product only scores with candidates sharing a term.
+            scores = vectors[rows] @ candidate_vectors
+            counts = np.diff(scores.indptr)
+            same = np.repeat(categories[rows], counts) == candidate_categories[scores.indices]
+            # A product is not similar to itself.
+            not_own = scores.indices != np.repeat(own_columns[rows], counts)
+
+            # Scores of the other group are zeroed, cheaper than selecting.
+            for same_category, group_scores in ((True, np.where(same & not_own, scores.data, 0)),
+                                                (False, np.where(same, 0, scores.data))):
+                for row, begin, end in zip(rows.tolist(), scores.indptr[:-1].tolist(), scores.indptr[1:].tolist()):
+                    row_scores = group_scores[begin:end]
+                    best = self.top(np, row_scores, top_k)
+                    similar.extend(
+                        (product_ids[row], similar_id, same_category, rank, score)
+                        for rank, (similar_id, score) in enumerate(zip(
+                            candidate_ids[scores.indices[begin:end][best]].tolist(), row_scores[best].tolist()))
+                        if score > 0)
+
+        changed = self.save(similar)
+        self.stdout.write(
+            f'{len(similar)} similar products for {len(products)} products, '
+            f'{len(changed)} changed, in {time.monotonic() - start:.1f}s')
+
+    def top(self, np, scores, k):
+        """Positions of the k highest scores, highest first."""
+        if len(scores) > k:
+            best = np.argpartition(-scores, k - 1)[:k]
+        else:
+            best = np.arange(len(scores))
+        return best[np.argsort(-scores[best], kind='stable')]
+
+    def tfidf(self, np, sparse, texts, max_df):
+        """
+        L2-normalized rows of sublinear TF times smoothed IDF. Terms of more
+        than max_df of the texts tell little and make every pair of texts
+        score, they are left out.
+        """
+        vocabulary = {}
+        indptr, indices, counts = [0], [], []
+        for text in texts:
+            terms = {}
+            for token in TOKEN_RE.findall(text.lower()):
+                term = vocabulary.setdefault(token, len(vocabulary))
+                terms[term] = terms.get(term, 0) + 1
+            indices.extend(terms)
+            counts.extend(terms.values())
+            indptr.append(len(indices))
+
+        matrix = sparse.csr_matrix(
+            (np.array(counts, dtype=np.float32), indices, indptr),
+            shape=(len(texts), max(len(vocabulary), 1)))
+        matrix.data = 1 + np.log(matrix.data)
+
+        document_frequency = np.bincount(matrix.indices, minlength=matrix.shape[1])
+        idf = np.log((1 + len(texts)) / (1 + document_frequency)) + 1
+        idf[document_frequency > max_df * len(texts)] = 0
+        matrix = matrix @ sparse.diags(idf.astype(np.float32))
+        matrix.eliminate_zeros()
+
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        return sparse.csr_matrix(sparse.diags(1 / norms) @ matrix)
+
+    def save(self, similar):
+        """Replace all rows, returning the ids of products whose lists changed."""
+        def lists(rows):
+            result = {}
+            for product_id, similar_id, same_category in rows:
+                result.setdefault(product_id, []).append((similar_id, same_category))
+            return result
+
+        # Plain queries, model instances cost more than the similarities.
+        table = connection.ops.quote_name(SimilarProduct._meta.db_table)
+        product_column, similar_column, same_column, rank_column, score_column = (
+            connection.ops.quote_name(SimilarProduct._meta.get_field(name).column)
+            for name in ('product', 'similar', 'same_category', 'rank', 'score'))
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT {product_column}, {similar_column}, {same_column} FROM {table} '
+                           f'ORDER BY {product_column}, {same_column} DESC, {rank_column}')
+            old = lists((product_id, similar_id, bool(same_category))
+                        for product_id, similar_id, same_category in cursor.fetchall())
+        new = lists(row[:3] for row in similar)
+        changed = {product_id for product_id in old.keys() | new.keys()
+                   if old.get(product_id) != new.get(product_id)}
+
+        sql = (f'INSERT INTO {table} ({product_column}, {similar_column}, {same_column}, {rank_column}, '
+               f'{score_column}) VALUES (%s, %s, %s, %s, %s)')
+        # Checking the foreign keys of every row slows SQLite down several
+        # times, they are checked once at the end, as loaddata does.
+        with connection.constraint_checks_disabled(), transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {table}')
+            cursor.executemany(sql, similar)
+            connection.check_constraints(table_names=[SimilarProduct._meta.db_table])
+
+        # Raw inserts send no signals.
+        cache.bump_version()
+        surrogate.purge_queue.add(map(surrogate.product_key, changed))
+        return changed
@@ -0,0 +1,33 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from catalog.models import CatalogChange
+
+
+class Command(BaseCommand):
+    help = 'Delete catalog changes older than --days which a newer change of the same object supersedes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7)
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        newer = CatalogChange.objects.filter(
+            object_type=OuterRef('object_type'), object_id=OuterRef('object_id'),
+            pk__gt=OuterRef('pk'))
+        superseded = CatalogChange.objects.filter(
+            Exists(newer),
+            date_created__lt=timezone.now() - timedelta(days=options['days']))
+
+        # Short batches keep the write lock free for concurrent catalog edits.
+        deleted = 0
+        while True:
+            pks = list(superseded.order_by('pk').values_list('pk', flat=True)[:options['batch_size']])
+            if not pks:
+                break
+            deleted += CatalogChange.objects.filter(pk__in=pks).delete()[0]
+
+        self.stdout.write(f'deleted {deleted} changes')
@@ -0,0 +1,47 @@
+"""
+Write the YML offer feed of catalog.feeds to a static file, e.g. from cron,
+for marketplaces to fetch without hitting Django. The feed is streamed to a
+temporary file which atomically replaces the previous one.
+"""
+
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from catalog import feeds
+
+
+class Command(BaseCommand):
+    help = 'Export the YML offer feed to a file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', type=str,
+                            help='file to write the feed to')
+        parser.add_argument('--host', type=str, default=None,
+                            help='host name used for absolute media URLs')
+        parser.add_argument('--secure', action='store_true',
+                            help='build https media URLs')
+        parser.add_argument('--chunk-size', type=int, default=feeds.CHUNK_SIZE,
+                            help='products read per query')
+
+    def handle(self, *args, **options):
+        origin = '{}://{}'.format(
+            'https' if options['secure'] else 'http', options['host'] or settings.ALLOWED_HOSTS[0])
+
+        output = os.path.abspath(options['output'])
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(output), prefix='.', suffix='.tmp')
+        size = 0
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                for chunk in feeds.yml_feed(lambda path: origin + path, options['chunk_size']):
+                    size += f.write(chunk)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, output)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        self.stdout.write(f'written {size} characters to {output}')
@@ -0,0 +1,195 @@
+"""
+Pre-render the catalog API into a directory tree which can be served by
+nginx without hitting Django, e.g.:
+
+    location /api/v1/ {
+        set $snapshot $uri/index.json;
+        if ($arg_page ~ "^[0-9]+$") {
+            set $snapshot $uri/page-$arg_page.json;
+        }
+        # Listings are exported in the default order, sorted ones
+        # fall through to Django.
+        if ($arg_sort) {
+            set $snapshot "";
+        }
+        try_files $snapshot @django;
+    }
+
+Without --category/--product the whole tree is regenerated and files of
+removed objects are deleted. With them only the affected files are
+regenerated, including the listings a deleted or moved product was in
+according to the previous snapshot. Files are replaced atomically and left untouched when their
+content has not changed.
+"""
+
+import os
+import re
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from catalog.models import Category, Product
+from catalog.renderer import CatalogRenderer
+
+PAGE_FILE_RE = re.compile(r'^page-(\d+)\.json$')
+
+
+class Command(BaseCommand):
+    help = 'Export the catalog API responses as static JSON files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output_dir', type=str,
+                            help='directory to write the snapshot to')
+        parser.add_argument('--host', type=str, default=None,
+                            help='host name used for absolute media URLs')
+        parser.add_argument('--secure', action='store_true',
+                            help='build https media URLs')
+        parser.add_argument('--category', action='append', default=[], dest='categories', metavar='SLUG',
+                            help='regenerate the listing of a changed category')
+        parser.add_argument('--product', action='append', default=[], dest='products', metavar='SLUG',
+                            help='regenerate the detail and the listing of a changed product')
+
+    def handle(self, *args, **options):
+        self.output_dir = options['output_dir']
+        self.renderer = CatalogRenderer(
+            options['host'] or settings.ALLOWED_HOSTS[0], secure=options['secure'])
+        self.written = set()
+        self.stats = {'written': 0, 'unchanged': 0, 'removed': 0}
+
+        if options['categories'] or options['products']:
+            self.export_changes(options['categories'], options['products'])
+        else:
+            self.export_all()
+
+        self.stdout.write(
+            'written {written}, unchanged {unchanged}, removed {removed}'.format(**self.stats))
+
+    def export_all(self):
+        self.export_category_list()
+
+        for category in Category.objects.all():
+            self.export_product_list(category)
+
+        for product in Product.objects.select_related('category').iterator():
+            self.export_product_detail(product)
+
+        for root, _, files in os.walk(self.output_dir):
+            for name in files:
+                file_path = os.path.join(root, name)
+                if name.endswith('.json') and file_path not in self.written:
+                    self.remove(file_path)
+
+    def export_changes(self, category_slugs, product_slugs):
+        category_slugs = set(category_slugs)
+
+        for slug in product_slugs:
+            try:
+                product = Product.objects.select_related(
+                    'category').get(slug=slug)
+            except Product.DoesNotExist:
+                product = None
+            else:
+                self.export_product_detail(product)
+                category_slugs.add(product.category.slug)
+
+            # The previous snapshot tells the categories a deleted or moved
+            # product was listed in.
+            for category_slug in self.snapshot_categories(slug):
+                if product is None or category_slug != product.category.slug:
+                    self.remove_product_detail(category_slug, slug)
+                    category_slugs.add(category_slug)
+
+        self.export_category_list()
+
+        for slug in category_slugs:
+            try:
+                category = Category.objects.get(slug=slug)
+            except Category.DoesNotExist:
+                self.remove_product_list(slug)
+            else:
+                self.export_product_list(category)
+
+    def export_category_list(self):
+        path, response = self.renderer.category_list()
+        self.write(path, 1, response.content)
+
+    def export_product_list(self, category):
+        last_page = 0
+        for path, page, response in self.renderer.product_list_pages(category):
+            if response.status_code != 200:
+                break
+            self.write(path, page, response.content)
+            last_page = page
+
+        directory = os.path.dirname(self.file_path(path, 1, make_dirs=False))
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                match = PAGE_FILE_RE.match(name)
+                if match and int(match.group(1)) > last_page:
+                    self.remove(os.path.join(directory, name))
+
+    def export_product_detail(self, product):
+        path, response = self.renderer.product_detail(product)
+        self.write(path, 1, response.content)
+
+    def remove_product_list(self, category_slug):
+        directory = os.path.join(self.categories_dir(), category_slug, 'products')
+        if not os.path.isdir(directory):
+            return
+        for name in os.listdir(directory):
+            if name.endswith('.json'):
+                self.remove(os.path.join(directory, name))
+
+    def categories_dir(self):
+        return os.path.join(self.output_dir, 'api', 'v1', 'categories')
+
+    def snapshot_categories(self, product_slug):
+        """Return slugs of the categories with a detail of the product in the snapshot."""
+        categories_dir = self.categories_dir()
+        if not os.path.isdir(categories_dir):
+            return []
+        return [
+            category_slug for category_slug in os.listdir(categories_dir)
+            if os.path.exists(self.product_detail_path(category_slug, product_slug))
+        ]
+
+    def product_detail_path(self, category_slug, product_slug):
+        return os.path.join(
+            self.categories_dir(), category_slug, 'products', product_slug, 'index.json')
+
+    def remove_product_detail(self, category_slug, product_slug):
+        self.remove(self.product_detail_path(category_slug, product_slug))
+
+    def file_path(self, path, page, make_dirs=True):
+        directory = os.path.join(self.output_dir, *path.strip('/').split('/'))
+        if make_dirs:
+            os.makedirs(directory, exist_ok=True)
+        name = 'index.json' if page == 1 else f'page-{page}.json'
+        return os.path.join(directory, name)
+
+    def write(self, path, page, content):
+        file_path = self.file_path(path, page)
+        self.written.add(file_path)
+
+        if os.path.exists(file_path):
+            with open(file_path, 'rb') as f:
+                if f.read() == content:
+                    self.stats['unchanged'] += 1
+                    return
+
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(file_path), prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        self.stats['written'] += 1
+
+    def remove(self, file_path):
+        os.remove(file_path)
+        self.stats['removed'] += 1
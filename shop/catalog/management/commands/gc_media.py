@@ -0,0 +1,49 @@
+import os
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from catalog.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = 'Delete product image files which no ProductImage references.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-period', type=int, default=24 * 60 * 60,
+                            help='keep files modified less than this many seconds ago')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='only print the files which would be deleted')
+
+    def handle(self, *args, **options):
+        referenced = set()
+        images = ProductImage.objects.values_list(
+            'image_large', 'image_medium', 'image_small')
+        for names in images.iterator():
+            referenced.update(name for name in names if name)
+
+        root = default_storage.path('product_images')
+        deadline = time.time() - options['grace_period']
+        deleted = 0
+        freed = 0
+
+        for directory, _, files in os.walk(root):
+            for file_name in files:
+                path = os.path.join(directory, file_name)
+                name = os.path.relpath(
+                    path, default_storage.location).replace(os.sep, '/')
+
+                stat = os.stat(path)
+                if name in referenced or stat.st_mtime > deadline:
+                    continue
+
+                if options['verbosity'] > 1 or options['dry_run']:
+                    self.stdout.write(name)
+                if not options['dry_run']:
+                    os.remove(path)
+                deleted += 1
+                freed += stat.st_size
+
+        action = 'would delete' if options['dry_run'] else 'deleted'
+        self.stdout.write(f'{action} {deleted} files, {freed} bytes')
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from catalog.profiling import make_token
+
+
+class Command(BaseCommand):
+    help = 'Print a signed token which enables profiling of a single catalog request.'
+
+    def handle(self, *args, **options):
+        self.stdout.write(make_token())
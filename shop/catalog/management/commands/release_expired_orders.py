@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from catalog.stock import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Return the stock of expired order reservations.'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'released {release_expired()} orders')
@@ -0,0 +1,91 @@
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.urls import reverse
+
+from catalog.models import Category, Product
+from catalog.pagination import ProductPagination
+from catalog.renderer import CatalogRenderer
+
+
+class RateLimiter:
+    """Space calls evenly so that at most `rate` of them start per second."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_time)
+            self.next_time = start + self.interval
+        time.sleep(start - now)
+
+
+class Command(BaseCommand):
+    help = 'Fill the catalog cache ahead of traffic, e.g. after an import or a deploy.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', type=str, default=None,
+                            help='host name the site is served under')
+        parser.add_argument('--secure', action='store_true',
+                            help='warm https responses')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='number of concurrent renders')
+        parser.add_argument('--rate', type=float, default=20,
+                            help='maximum renders per second, 0 for unlimited')
+
+    def handle(self, *args, **options):
+        self.renderer = CatalogRenderer(
+            options['host'] or settings.ALLOWED_HOSTS[0], secure=options['secure'])
+        self.limiter = RateLimiter(options['rate'])
+
+        pages = list(self.iter_pages())
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            statuses = list(executor.map(self.warm, pages))
+        elapsed = time.monotonic() - start
+
+        failed = 0
+        for (path, query), status in zip(pages, statuses):
+            if status != 200:
+                failed += 1
+                self.stderr.write(f'failed {path} {query or ""} with status {status}')
+        self.stdout.write(
+            f'warmed {len(pages) - failed}/{len(pages)} pages in {elapsed:.1f}s')
+
+    def iter_pages(self):
+        """Yield (path, query) in the order visitors are most likely to need them."""
+        categories = list(Category.objects.all())
+
+        yield reverse('category-list'), None
+
+        for category in categories:
+            yield reverse('product-list', args=[category.slug]), None
+
+        products = Product.objects.select_related('category').order_by(
+            'category__sort', 'category_id', '-date_added', '-id')
+        for product in products.iterator():
+            yield reverse('product-detail', args=[product.category.slug, product.slug]), None
+
+        for category in categories:
+            pages = math.ceil(category.in_stock_count / ProductPagination.page_size)
+            for page in range(2, pages + 1):
+                yield reverse('product-list', args=[category.slug]), {'page': page}
+
+    def warm(self, page):
+        path, query = page
+        self.limiter.wait()
+        try:
+            return self.renderer.render(path, query).status_code
+        finally:
+            connection.close()
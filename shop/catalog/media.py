@@ -0,0 +1,172 @@
+import mimetypes
+import posixpath
+import re
+from pathlib import Path
+from urllib.parse import quote
+
+from django.conf import settings
+from django.conf.urls.static import static
+from django.core.exceptions import ImproperlyConfigured, SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotAllowed
+from django.urls import re_path
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from django.views.static import serve
+
+# Media files are content addressed (or uuid named), a name never changes content.
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+class FileRange:
+    """
+    Read `length` bytes of an open file starting at `start`.
+
+    fileno() and tell() are passed through, so a WSGI file_wrapper which
+    uses sendfile() (gunicorn does) still sends the range without copying
+    it through Python.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+def parse_range(header, size):
+    """
+    Return the (start, end) of a single `bytes=` range, both inclusive, or
+    None when the whole file should be sent. Multiple ranges are answered
+    with the whole file, which RFC 7233 allows.
+    """
+    match = RANGE_RE.match(header or '')
+    if not match or match.groups() == ('', ''):
+        return None
+
+    start, end = match.groups()
+    if not start:
+        if int(end) == 0:
+            raise RangeNotSatisfiable
+        return max(size - int(end), 0), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start > end:
+        if start >= size:
+            raise RangeNotSatisfiable
+        return None
+    return start, end
+
+
+def media_path(document_root, path):
+    try:
+        full_path = Path(safe_join(document_root, path))
+    except SuspiciousFileOperation:
+        raise Http404
+    # Hidden names are temporary files of catalog.storage.
+    if full_path.name.startswith('.') or not full_path.is_file():
+        raise Http404
+    return full_path
+
+
+def accel_response(path):
+    response = HttpResponse()
+    response['X-Accel-Redirect'] = quote(
+        settings.MEDIA_ACCEL_REDIRECT_PREFIX + path)
+    # Let nginx pick the type for the internal location.
+    del response['Content-Type']
+    return response
+
+
+def file_response(request, full_path):
+    stat = full_path.stat()
+    etag = quote_etag(f'{stat.st_size:x}-{stat.st_mtime_ns:x}')
+    last_modified = int(stat.st_mtime)
+
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified)
+    if response is None:
+        byte_range = None
+        if_range = request.headers.get('If-Range')
+        if if_range is None or if_range in (etag, http_date(last_modified)):
+            try:
+                byte_range = parse_range(request.headers.get('Range'), stat.st_size)
+            except RangeNotSatisfiable:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{stat.st_size}'
+                return response
+
+        start, end = byte_range or (0, stat.st_size - 1)
+        content_type, encoding = mimetypes.guess_type(str(full_path))
+        response = FileResponse(
+            FileRange(full_path.open('rb'), start, end - start + 1),
+            content_type=content_type or 'application/octet-stream')
+        response['Content-Length'] = end - start + 1
+        if encoding:
+            response['Content-Encoding'] = encoding
+        if byte_range:
+            response.status_code = 206
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def serve_media(request, path, document_root=None, show_indexes=False):
+    mode = settings.MEDIA_SERVE_MODE
+    if mode == 'static':
+        response = serve(request, path, document_root, show_indexes)
+    elif request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+    else:
+        path = posixpath.normpath(path).lstrip('/')
+        full_path = media_path(document_root, path)
+        if mode == 'accel':
+            response = accel_response(path)
+        elif mode == 'sendfile':
+            response = file_response(request, full_path)
+        else:
+            raise ImproperlyConfigured(f'Unknown MEDIA_SERVE_MODE {mode!r}.')
+
+    if response.status_code in (200, 206, 304):
+        patch_cache_control(
+            response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    return response
+
+
+def media_urlpatterns():
+    """
+    URL patterns for MEDIA_URL. The 'static' mode is only served with
+    DEBUG, the production modes always are.
+    """
+    if settings.MEDIA_SERVE_MODE == 'static':
+        return static(settings.MEDIA_URL, view=serve_media,
+                      document_root=settings.MEDIA_ROOT)
+    return [
+        re_path(r'^%s(?P<path>.*)$' % re.escape(settings.MEDIA_URL.lstrip('/')),
+                serve_media, {'document_root': settings.MEDIA_ROOT}),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.2.25 on 2026-10-19 15:38
+
+from django.db import migrations, models
+from django.db.models import Count, Exists, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_products(apps, schema_editor):
+    Category = apps.get_model('catalog', 'Category')
+    Product = apps.get_model('catalog', 'Product')
+    ProductItem = apps.get_model('catalog', 'ProductItem')
+
+    products = Product.objects.filter(
+        category=OuterRef('pk')).order_by().values('category')
+    in_stock = products.filter(Exists(ProductItem.objects.filter(
+        product=OuterRef('pk'), quantity__gt=0)))
+
+    Category.objects.update(
+        products_count=Coalesce(Subquery(
+            products.annotate(count=Count('pk')).values('count')), 0),
+        in_stock_count=Coalesce(Subquery(
+            in_stock.annotate(count=Count('pk')).values('count')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='in_stock_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='products_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_products, migrations.RunPython.noop),
+    ]
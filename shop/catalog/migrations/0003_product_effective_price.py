@@ -0,0 +1,35 @@
+# Generated by Django 3.2.25 on 2026-10-19 15:38
+
+from django.db import migrations, models
+
+
+def fill_effective_price(apps, schema_editor):
+    Product = apps.get_model('catalog', 'Product')
+
+    products = []
+    for product in Product.objects.only('price', 'discount').iterator():
+        product.effective_price = product.price - \
+            product.price * product.discount // 100
+        products.append(product)
+    Product.objects.bulk_update(
+        products, ['effective_price'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0002_category_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='effective_price',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_effective_price, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'effective_price'], name='catalog_pro_categor_149659_idx'),
+        ),
+    ]
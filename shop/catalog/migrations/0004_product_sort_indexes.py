@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-19 15:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0003_product_effective_price'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'date_added'], name='catalog_pro_categor_9ec3a3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'discount'], name='catalog_pro_categor_790f4d_idx'),
+        ),
+    ]
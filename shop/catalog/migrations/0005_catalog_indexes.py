@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-19 15:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0004_product_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='productimage',
+            options={'ordering': ['product_id', 'sort']},
+        ),
+        migrations.AlterField(
+            model_name='category',
+            name='sort',
+            field=models.IntegerField(db_index=True, default=0),
+        ),
+        migrations.AddIndex(
+            model_name='productimage',
+            index=models.Index(fields=['product', 'sort'], name='catalog_pro_product_7033d7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='productitem',
+            index=models.Index(fields=['product', 'quantity'], name='catalog_pro_product_9de13c_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.25 on 2026-10-19 15:50
+
+import catalog.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0006_order'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productimage',
+            name='image_large',
+            field=models.ImageField(blank=True, max_length=255, null=True, upload_to=catalog.models.ProductImage.get_file_path, validators=[catalog.models.validate_image_pixels], verbose_name='Large image'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 3.2.25 on 2026-10-19 16:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_order_line_items(apps, schema_editor):
+    OrderLine = apps.get_model('catalog', 'OrderLine')
+
+    lines = []
+    for line in OrderLine.objects.select_related('product_item__product').iterator():
+        product = line.product_item.product
+        line.product_name = product.name
+        line.size = line.product_item.size
+        line.price = product.effective_price
+        lines.append(line)
+    OrderLine.objects.bulk_update(
+        lines, ['product_name', 'size', 'price'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0009_similar_product'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='client',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='orderline',
+            name='price',
+            field=models.PositiveIntegerField(default=0),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='orderline',
+            name='product_name',
+            field=models.CharField(default='', max_length=50),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='orderline',
+            name='size',
+            field=models.IntegerField(choices=[(48, 48), (50, 50), (52, 52), (54, 54), (56, 56), (58, 58), (60, 60)], default=48),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_order_line_items, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='orderline',
+            name='product_item',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='order_lines', to='catalog.productitem'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['client', 'status'], name='catalog_ord_client_1ea802_idx'),
+        ),
+    ]
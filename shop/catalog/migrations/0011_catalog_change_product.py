@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-19 16:30
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def fill_product_id(apps, schema_editor):
+    CatalogChange = apps.get_model('catalog', 'CatalogChange')
+
+    # Changes of objects deleted before are left without a product.
+    for object_type, model_name in [('product_item', 'ProductItem'), ('product_image', 'ProductImage')]:
+        model = apps.get_model('catalog', model_name)
+        CatalogChange.objects.filter(object_type=object_type).update(product_id=Subquery(
+            model.objects.filter(pk=OuterRef('object_id')).values('product_id')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0010_order_client_line_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='catalogchange',
+            name='product_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(fill_product_id, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.25 on 2026-10-19 16:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0011_catalog_change_product'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='address',
+            field=models.CharField(blank=True, max_length=45),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['address', 'status'], name='catalog_ord_address_b9e796_idx'),
+        ),
+    ]
@@ -1,23 +1,55 @@
 import os
+import warnings
 
-from io import BytesIO
 from PIL import Image
+from tempfile import SpooledTemporaryFile
 from uuid import uuid4
 
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.core.files import File
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, Exists, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django_cleanup import cleanup
+
+from catalog.querycache import CachingQuerySet
 
 
 class Category(models.Model):
     name = models.CharField(max_length=50, unique=True)
     description = models.TextField()
     slug = models.SlugField(unique=True, db_index=True)
-    sort = models.IntegerField(default=0)
+    sort = models.IntegerField(default=0, db_index=True)
+    products_count = models.PositiveIntegerField(default=0, editable=False)
+    in_stock_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = CachingQuerySet.as_manager()
 
     class Meta:
         ordering = ['sort']
 
+    @classmethod
+    def update_counters(cls, category_ids):
+        """
+        Recount products of the given categories in a single UPDATE.
+
+        The counters are recomputed from the product and stock rows rather
+        than incremented, so concurrent or repeated updates always converge.
+        """
+        products = Product.objects.filter(
+            category=OuterRef('pk')).order_by().values('category')
+        in_stock = products.filter(Exists(ProductItem.objects.filter(
+            product=OuterRef('pk'), quantity__gt=0)))
+
+        cls.objects.filter(pk__in=category_ids).update(
+            products_count=Coalesce(Subquery(
+                products.annotate(count=Count('pk')).values('count')), 0),
+            in_stock_count=Coalesce(Subquery(
+                in_stock.annotate(count=Count('pk')).values('count')), 0),
+        )
+
     def __str__(self):
         return self.name
 
@@ -33,6 +65,9 @@ class Product(models.Model):
     discount = models.PositiveIntegerField(
         default=0, validators=[MinValueValidator(0), MaxValueValidator(100)])
     date_added = models.DateTimeField(auto_now_add=True)
+    effective_price = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = CachingQuerySet.as_manager()
 
     @property
     def new_price(self):
@@ -42,12 +77,67 @@ class Product(models.Model):
 
     class Meta:
         ordering = ['-date_added']
+        indexes = [
+            models.Index(fields=['category', 'date_added']),
+            models.Index(fields=['category', 'effective_price']),
+            models.Index(fields=['category', 'discount']),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Stored copy of new_price which the database can sort and filter on.
+        # QuerySet.update() of price or discount must set it as well.
+        self.effective_price = self.new_price
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {
+                *kwargs['update_fields'], 'effective_price'}
+
+        # Keep the category counters updated by signals in one transaction.
+        with transaction.atomic(using=kwargs.get('using')):
+            super(Product, self).save(*args, **kwargs)
 
     def __str__(self):
         return self.name
 
 
+def open_image(file):
+    """
+    Open an image lazily, only its header is read. Images with more than
+    PRODUCT_IMAGE_MAX_PIXELS pixels, and anything Pillow considers a
+    decompression bomb, raise ValidationError before they are decoded.
+    """
+    file.seek(0)
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', Image.DecompressionBombWarning)
+        try:
+            img = Image.open(file)
+        except (Image.DecompressionBombWarning, Image.DecompressionBombError):
+            raise ValidationError('The image is too large.', code='image_too_large')
+
+    if img.width * img.height > settings.PRODUCT_IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'The image has %(pixels)d pixels, at most %(limit)d are allowed.',
+            code='image_too_large',
+            params={'pixels': img.width * img.height,
+                    'limit': settings.PRODUCT_IMAGE_MAX_PIXELS})
+    return img
+
+
+def validate_image_pixels(file):
+    with open_image(file):
+        pass
+    file.seek(0)
+
+
+# Content addressed files may be shared between images, so they are not
+# deleted with an image but collected by the gc_media command.
+@cleanup.ignore
 class ProductImage(models.Model):
+    # Largest first, each thumbnail is made from the previous one.
+    THUMBNAIL_SIZES = [
+        ('image_medium', (310, 466)),
+        ('image_small', (85, 124)),
+    ]
+
     def get_file_path(self, filename):
         extension = filename.split('.')[-1]
         filename = f'{uuid4()}.{extension}'
@@ -56,34 +146,51 @@ class ProductImage(models.Model):
     product = models.ForeignKey(
         Product, related_name='product_images', on_delete=models.CASCADE)
     image_large = models.ImageField(
-        verbose_name='Large image', upload_to=get_file_path, max_length=255, blank=True, null=True)
+        verbose_name='Large image', upload_to=get_file_path, max_length=255, blank=True, null=True,
+        validators=[validate_image_pixels])
     image_medium = models.ImageField(
         verbose_name='Medium image', upload_to=get_file_path, max_length=255, blank=True, null=True)
     image_small = models.ImageField(
         verbose_name='Small image', upload_to=get_file_path, max_length=255, blank=True, null=True)
     sort = models.IntegerField(default=0)
 
+    objects = CachingQuerySet.as_manager()
+
     class Meta:
-        ordering = ['product__name', 'sort']
+        ordering = ['product_id', 'sort']
+        indexes = [
+            models.Index(fields=['product', 'sort']),
+        ]
 
     def save(self, *args, **kwargs):
-        if self.image_large:
-            self.image_medium = self.make_thumbnail(
-                self.image_large, (310, 466))
-            self.image_small = self.make_thumbnail(self.image_large, (85, 124))
+        # Stored images keep their thumbnails, only new uploads are decoded.
+        if self.image_large and (not self.image_large._committed
+                                 or not self.image_medium or not self.image_small):
+            self.make_thumbnails()
 
         super(ProductImage, self).save(*args, **kwargs)
 
+    def make_thumbnails(self):
+        with open_image(self.image_large) as img:
+            # JPEG is decoded at the smallest scale (1/2 to 1/8) that still
+            # covers the largest thumbnail instead of at full resolution.
+            img.draft('RGB', self.THUMBNAIL_SIZES[0][1])
+            img = img.convert('RGB')
+            for field, size in self.THUMBNAIL_SIZES:
+                setattr(self, field, self.make_thumbnail(
+                    img, size, self.image_large.name))
+        self.image_large.seek(0)
+
     @staticmethod
-    def make_thumbnail(image, size):
-        img = Image.open(image)
-        img.convert('RGB')
+    def make_thumbnail(img, size, name):
         img.thumbnail(size)
 
-        thumb_io = BytesIO()
+        # Small thumbnails stay in memory, larger ones spill to disk.
+        thumb_io = SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
         img.save(thumb_io, 'JPEG', quality=95)
 
-        thumbnail = File(thumb_io, name=image.name)
+        thumbnail = File(thumb_io, name=os.path.splitext(name)[0] + '.jpg')
         return thumbnail
 
     def __str__(self):
@@ -106,5 +213,130 @@ class ProductItem(models.Model):
     size = models.IntegerField(choices=SIZE_CHOICES, default=48)
     quantity = models.PositiveIntegerField(default=0)
 
+    objects = CachingQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'quantity']),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Keep the category counters updated by signals in one transaction.
+        with transaction.atomic(using=kwargs.get('using')):
+            super(ProductItem, self).save(*args, **kwargs)
+
     def __str__(self):
         return f'{self.product.name} : {self.size} : {self.quantity}'
+
+
+class SimilarProduct(models.Model):
+    """Precomputed recommendations, rebuilt by the build_similar command."""
+    product = models.ForeignKey(
+        Product, related_name='similar_products', on_delete=models.CASCADE)
+    similar = models.ForeignKey(
+        Product, related_name='+', on_delete=models.CASCADE)
+    same_category = models.BooleanField()
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    objects = CachingQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['product_id', '-same_category', 'rank']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['product', 'same_category', 'rank'], name='unique_similar_product_rank'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id} : {self.similar_id} : {self.score:.3f}'
+
+
+class Order(models.Model):
+    STATUS_RESERVED = 'reserved'
+    STATUS_CONFIRMED = 'confirmed'
+    STATUS_RELEASED = 'released'
+    STATUS_CHOICES = [
+        (STATUS_RESERVED, 'Reserved'),
+        (STATUS_CONFIRMED, 'Confirmed'),
+        (STATUS_RELEASED, 'Released')
+    ]
+
+    token = models.UUIDField(default=uuid4, unique=True, editable=False)
+    # The user or session which reserved the order, see catalog.stock.
+    client = models.CharField(max_length=64, blank=True)
+    # The client address, whose reservations are limited too.
+    address = models.CharField(max_length=45, blank=True)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=STATUS_RESERVED)
+    date_created = models.DateTimeField(auto_now_add=True)
+    reserved_until = models.DateTimeField()
+
+    class Meta:
+        ordering = ['-date_created']
+        indexes = [
+            models.Index(fields=['status', 'reserved_until']),
+            models.Index(fields=['client', 'status']),
+            models.Index(fields=['address', 'status']),
+        ]
+
+    def __str__(self):
+        return f'{self.token} : {self.status}'
+
+
+class OrderLine(models.Model):
+    order = models.ForeignKey(
+        Order, related_name='order_lines', on_delete=models.CASCADE)
+    # Products and sizes can be deleted, the line keeps a copy of them.
+    product_item = models.ForeignKey(
+        ProductItem, related_name='order_lines', null=True, on_delete=models.SET_NULL)
+    product_name = models.CharField(max_length=50)
+    size = models.IntegerField(choices=ProductItem.SIZE_CHOICES)
+    price = models.PositiveIntegerField()
+    quantity = models.PositiveIntegerField(
+        validators=[MinValueValidator(1)])
+
+    def __str__(self):
+        return f'{self.order_id} : {self.product_item_id} : {self.quantity}'
+
+
+class CatalogChange(models.Model):
+    """
+    Append-only log of created, updated and deleted catalog objects, written
+    by catalog.signals. The id is the revision clients sync from.
+    """
+    TYPE_CATEGORY = 'category'
+    TYPE_PRODUCT = 'product'
+    TYPE_PRODUCT_ITEM = 'product_item'
+    TYPE_PRODUCT_IMAGE = 'product_image'
+    TYPE_CHOICES = [
+        (TYPE_CATEGORY, 'Category'),
+        (TYPE_PRODUCT, 'Product'),
+        (TYPE_PRODUCT_ITEM, 'Product item'),
+        (TYPE_PRODUCT_IMAGE, 'Product image')
+    ]
+
+    ACTION_CREATED = 'created'
+    ACTION_UPDATED = 'updated'
+    ACTION_DELETED = 'deleted'
+    ACTION_CHOICES = [
+        (ACTION_CREATED, 'Created'),
+        (ACTION_UPDATED, 'Updated'),
+        (ACTION_DELETED, 'Deleted')
+    ]
+
+    object_type = models.CharField(max_length=20, choices=TYPE_CHOICES)
+    object_id = models.BigIntegerField()
+    # The product of an item or image, known after they are deleted.
+    product_id = models.BigIntegerField(null=True, blank=True)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    date_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['object_type', 'object_id']),
+        ]
+
+    def __str__(self):
+        return f'{self.id} : {self.action} {self.object_type} {self.object_id}'
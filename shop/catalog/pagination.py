@@ -15,12 +15,15 @@ class ProductPagination(pagination.PageNumberPagination):
             return None
         return self.page.previous_page_number()
 
-    def get_paginated_response(self, data, category):
-        return Response({
+    def get_paginated_data(self, data, category):
+        return {
             'category': {
                 **category,
                 'products': data,
                 'prev_page_number': self.get_previous_page_number(),
                 'next_page_number': self.get_next_page_number(),
             }
-        })
+        }
+
+    def get_paginated_response(self, data, category):
+        return Response(self.get_paginated_data(data, category))
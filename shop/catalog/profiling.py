@@ -0,0 +1,132 @@
+import cProfile
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from uuid import uuid4
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+from django.urls import Resolver404, resolve
+
+TOKEN_SALT = 'catalog.profiling'
+USED_TOKEN_KEY = 'catalog:profiling:used:{}'
+TOKEN_HEADER = 'HTTP_X_PROFILE_TOKEN'
+TOKEN_PARAM = 'profile'
+PROFILED_MODULE = 'catalog.views'
+
+
+def make_token():
+    """Return a signed token which enables profiling of a single request."""
+    return signing.TimestampSigner(salt=TOKEN_SALT).sign(uuid4().hex)
+
+
+def check_token(token):
+    """Return whether the token is valid and unused, and use it up."""
+    try:
+        nonce = signing.TimestampSigner(salt=TOKEN_SALT).unsign(
+            token, max_age=settings.PROFILING_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    # The nonce is remembered until the token expires anyway.
+    return cache.add(USED_TOKEN_KEY.format(nonce), True,
+                     timeout=settings.PROFILING_TOKEN_MAX_AGE)
+
+
+class StackSampler:
+    """Periodically sample the call stack of a thread in collapsed format."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(
+                    f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(names))] += 1
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+class ProfilingMiddleware:
+    """
+    Profile a single request to a catalog view when it carries a valid token
+    in the X-Profile-Token header or the ``profile`` query parameter.
+
+    The profile is saved to PROFILING_ROOT in pstats format (``.prof``) and
+    as collapsed stacks (``.folded``) suitable for flamegraph.pl or speedscope.
+    The file names are returned in the X-Profile-Stats and
+    X-Profile-Flamegraph response headers.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = self.get_token(request)
+        if token is None or not self.is_profiled(request, token):
+            return self.get_response(request)
+
+        return self.profile(request)
+
+    @staticmethod
+    def get_token(request):
+        token = request.META.get(TOKEN_HEADER)
+        if token is None and TOKEN_PARAM in request.META.get('QUERY_STRING', ''):
+            token = request.GET.get(TOKEN_PARAM)
+        return token
+
+    @staticmethod
+    def is_profiled(request, token):
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return False
+        return match.func.__module__ == PROFILED_MODULE and check_token(token)
+
+    def profile(self, request):
+        sampler = StackSampler(
+            threading.get_ident(), settings.PROFILING_SAMPLE_INTERVAL)
+        profiler = cProfile.Profile()
+
+        sampler.start()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+            sampler.stop()
+
+        os.makedirs(settings.PROFILING_ROOT, exist_ok=True)
+        name = f'{time.strftime("%Y%m%d-%H%M%S")}-{uuid4().hex[:8]}'
+        profiler.dump_stats(os.path.join(
+            settings.PROFILING_ROOT, f'{name}.prof'))
+        sampler.dump(os.path.join(settings.PROFILING_ROOT, f'{name}.folded'))
+
+        response['X-Profile-Stats'] = f'{name}.prof'
+        response['X-Profile-Flamegraph'] = f'{name}.folded'
+        return response
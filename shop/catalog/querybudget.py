@@ -0,0 +1,189 @@
+import logging
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connection
+from django.http import JsonResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.views import APIView
+
+logger = logging.getLogger(__name__)
+
+# SQLite calls the progress handler every this many virtual machine instructions.
+PROGRESS_HANDLER_INSTRUCTIONS = 1000
+# Progress handler calls closer than this are taken for one statement
+# stepping, their time is spent fetching rows outside of execute().
+PROGRESS_HANDLER_GAP = 0.01
+
+
+class QueryBudgetExceeded(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'The request took too long, try again later.'
+    default_code = 'query_budget_exceeded'
+
+
+def view_name(match):
+    if match is None:
+        return None
+    return match.view_name or f'{match.func.__module__}.{match.func.__qualname__}'
+
+
+def get_budget(match):
+    """
+    Seconds of database time allowed to the view of a resolved URL:
+    DB_TIME_BUDGETS by URL name, the db_time_budget attribute of the API
+    view or DB_TIME_BUDGET. Views of other frameworks, e.g. the admin,
+    have no budget.
+    """
+    if match.url_name in settings.DB_TIME_BUDGETS:
+        return settings.DB_TIME_BUDGETS[match.url_name]
+    view = getattr(match.func, 'view_class', None)
+    if view is None or not issubclass(view, APIView):
+        return None
+    return getattr(view, 'db_time_budget', settings.DB_TIME_BUDGET)
+
+
+class QueryBudget:
+    """
+    Execute wrapper timing the queries of a request. Queries are refused
+    once the budget is spent. On SQLite a progress handler, installed until
+    close(), interrupts a running query at the deadline, so a runaway query
+    stops holding the database lock. It also charges the time of fetching
+    rows, which SQLite computes after execute() returns. Queries over
+    SLOW_QUERY_THRESHOLD are logged with their plan.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.spent = 0
+        self._budget = False
+        self._explaining = False
+        self._handled = None
+        self._query_start = None
+        self._tick = 0
+
+    @property
+    def budget(self):
+        # The URL is resolved after the first middleware queries may run.
+        if self._budget is False:
+            match = self.request.resolver_match
+            if match is None:
+                return None
+            self._budget = get_budget(match)
+        return self._budget
+
+    def __call__(self, execute, sql, params, many, context):
+        if self._explaining:
+            return execute(sql, params, many, context)
+
+        budget = self.budget
+        if budget is not None and self.spent >= budget:
+            self.exceeded(sql)
+
+        db = context['connection']
+        if budget is not None and db.vendor == 'sqlite' and self._handled is not db.connection:
+            self.close()
+            db.connection.set_progress_handler(self.progress, PROGRESS_HANDLER_INSTRUCTIONS)
+            self._handled = db.connection
+
+        start = self._query_start = time.monotonic()
+        try:
+            return execute(sql, params, many, context)
+        except OperationalError:
+            if self.is_exceeded():
+                self.exceeded(sql)
+            raise
+        finally:
+            self._query_start = None
+            duration = time.monotonic() - start
+            self.spent += duration
+            if duration >= settings.SLOW_QUERY_THRESHOLD:
+                self.log_slow_query(db, sql, params, many, duration)
+
+    def progress(self):
+        """SQLite progress handler, a true value interrupts the statement."""
+        now = time.monotonic()
+        if self._query_start is None and now - self._tick < PROGRESS_HANDLER_GAP:
+            self.spent += now - self._tick
+        self._tick = now
+        return self.is_exceeded()
+
+    def is_exceeded(self):
+        spent = self.spent
+        if self._query_start is not None:
+            spent += time.monotonic() - self._query_start
+        return self.budget is not None and spent > self.budget
+
+    def close(self):
+        """Remove the progress handler."""
+        if self._handled is not None:
+            self._handled.set_progress_handler(None, PROGRESS_HANDLER_INSTRUCTIONS)
+            self._handled = None
+
+    def exceeded(self, sql):
+        logger.warning('Database time budget of %.2fs exceeded by %s: %s',
+                       self.budget, view_name(self.request.resolver_match), sql)
+        raise QueryBudgetExceeded()
+
+    def log_slow_query(self, db, sql, params, many, duration):
+        plan = None
+        if not many and sql.lstrip()[:6].upper() == 'SELECT':
+            self._explaining = True
+            try:
+                with db.cursor() as cursor:
+                    cursor.execute(f'{db.ops.explain_query_prefix()} {sql}', params)
+                    plan = '\n'.join(' '.join(map(str, row)) for row in cursor.fetchall())
+            except Exception:
+                # The query may have been interrupted, or its transaction broken.
+                plan = None
+            finally:
+                self._explaining = False
+
+        logger.warning('Slow query (%.3fs) in %s: %s; params: %r; plan:\n%s',
+                       duration, view_name(self.request.resolver_match), sql, params, plan)
+
+
+class QueryBudgetMiddleware:
+    """
+    Enforce database time budgets of views and log slow queries, see
+    QueryBudget. The queries of a streamed response body count as well.
+    A query interrupted while its rows are fetched fails outside of the
+    execute wrapper, process_exception answers it with 503 too.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        budget = request._query_budget = QueryBudget(request)
+        try:
+            with connection.execute_wrapper(budget):
+                response = self.get_response(request)
+        finally:
+            budget.close()
+
+        if response.streaming and budget.budget is not None:
+            response.streaming_content = self.stream(response.streaming_content, budget)
+        return response
+
+    def stream(self, content, budget):
+        iterator = iter(content)
+        while True:
+            try:
+                with connection.execute_wrapper(budget):
+                    chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                budget.close()
+            yield chunk
+
+    def process_exception(self, request, exception):
+        budget = getattr(request, '_query_budget', None)
+        if isinstance(exception, OperationalError) and budget is not None and budget.is_exceeded():
+            logger.warning('Database time budget of %.2fs exceeded by %s while fetching rows',
+                           budget.budget, view_name(request.resolver_match))
+            return JsonResponse({'detail': QueryBudgetExceeded.default_detail},
+                                status=QueryBudgetExceeded.status_code)
+        return None
@@ -0,0 +1,148 @@
+"""
+Opt-in cache of queryset results, keyed by SQL, parameters and version
+counters of the tables the query reads.
+
+    Category.objects.cached().get(pk=category_id)
+
+Models opt in with `objects = CachingQuerySet.as_manager()`. Every write
+statement to one of their tables, whichever API issued it (save(),
+update(), bulk_create(), bulk_update(), delete() with its cascades or raw
+SQL), is seen by a database execute wrapper and bumps the version of the
+table, so later reads miss. Writes inside a transaction bump it again on
+commit, as other processes may cache the old rows in between. Until then
+the writing transaction reads the changed tables from the database, as
+its uncommitted rows must not be cached.
+
+Only results of iteration are cached, not count(), exists(), aggregates
+or iterator(). Queries reading any table not opted in are not cached.
+"""
+
+import functools
+import hashlib
+import re
+from uuid import uuid4
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import connections, models, transaction
+
+VERSION_KEY = 'catalog:querycache:version'
+RESULT_KEY = 'catalog:querycache:result'
+
+READ_STATEMENTS = ('SELECT', 'EXPLAIN', 'SAVEPOINT', 'RELEASE', 'ROLLBACK', 'BEGIN', 'COMMIT',
+                   'SET', 'SHOW', 'PRAGMA')
+
+
+class CachingQuerySet(models.QuerySet):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._use_cache = False
+
+    def cached(self):
+        """Return a copy of the queryset whose results are cached."""
+        clone = self._chain()
+        clone._use_cache = True
+        return clone
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._use_cache = self._use_cache
+        return clone
+
+    def _fetch_all(self):
+        if self._result_cache is None and self._use_cache:
+            self._result_cache = fetch(self)
+        super()._fetch_all()
+
+
+@functools.lru_cache(maxsize=None)
+def table_patterns():
+    """Regexes matching the names of all tables and of opted in tables."""
+    all_tables = {model._meta.db_table for model in apps.get_models(include_auto_created=True)}
+    cached_tables = {
+        model._meta.db_table for model in apps.get_models()
+        if issubclass(getattr(model._default_manager, '_queryset_class', object), CachingQuerySet)}
+
+    def pattern(tables):
+        names = '|'.join(map(re.escape, sorted(tables, key=len, reverse=True)))
+        return re.compile(rf'\b({names})\b') if tables else None
+
+    return pattern(all_tables), pattern(cached_tables)
+
+
+def version_key(table):
+    return f'{VERSION_KEY}:{table}'
+
+
+def bump_version(tables):
+    cache.set_many({version_key(table): uuid4().hex for table in tables}, None)
+
+
+def get_versions(tables):
+    keys = [version_key(table) for table in sorted(tables)]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            version = uuid4().hex
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+            versions[key] = version
+    return [versions[key] for key in keys]
+
+
+def dirty_tables(connection):
+    """Tables written by the current transaction of the connection."""
+    dirty = connection.__dict__.setdefault('query_cache_dirty', set())
+    if not connection.in_atomic_block:
+        dirty.clear()
+    return dirty
+
+
+def fetch(queryset):
+    connection = connections[queryset.db]
+    try:
+        sql, params = queryset.query.get_compiler(queryset.db).as_sql()
+    except EmptyResultSet:
+        return list(queryset._iterable_class(queryset))
+
+    all_tables, cached_tables = table_patterns()
+    tables = set(all_tables.findall(sql))
+    if (not tables or cached_tables is None
+            or len(set(cached_tables.findall(sql))) != len(tables)
+            or tables & dirty_tables(connection)):
+        return list(queryset._iterable_class(queryset))
+
+    key = hashlib.md5(repr((
+        queryset.db, queryset._iterable_class.__name__, sql, params, get_versions(tables),
+    )).encode()).hexdigest()
+    results = cache.get(f'{RESULT_KEY}:{key}')
+    if results is None:
+        results = list(queryset._iterable_class(queryset))
+        if len(results) <= settings.QUERY_CACHE_MAX_ROWS:
+            cache.set(f'{RESULT_KEY}:{key}', results, settings.QUERY_CACHE_TIMEOUT)
+    return results
+
+
+def invalidate_writes(execute, sql, params, many, context):
+    """Execute wrapper bumping the versions of tables written by a statement."""
+    result = execute(sql, params, many, context)
+    if sql.lstrip()[:9].upper().startswith(READ_STATEMENTS):
+        return result
+
+    _, cached_tables = table_patterns()
+    tables = set(cached_tables.findall(sql)) if cached_tables is not None else set()
+    if tables:
+        bump_version(tables)
+        connection = context['connection']
+        if connection.in_atomic_block:
+            dirty_tables(connection).update(tables)
+            transaction.on_commit(lambda: bump_version(tables), using=connection.alias)
+    return result
+
+
+def install(connection, **kwargs):
+    """connection_created receiver adding the execute wrapper once per connection."""
+    if invalidate_writes not in connection.execute_wrappers:
+        connection.execute_wrappers.append(invalidate_writes)
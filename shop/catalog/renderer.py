@@ -0,0 +1,40 @@
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+
+
+class CatalogRenderer:
+    """Render catalog API responses in-process, without the HTTP stack."""
+
+    def __init__(self, host, secure=False):
+        # Marked internal so that catalog.throttling lets renders through.
+        self.factory = RequestFactory(HTTP_HOST=host, **{'catalog.internal': True})
+        self.secure = secure
+
+    def render(self, path, data=None):
+        request = self.factory.get(path, data, secure=self.secure)
+        match = resolve(path)
+        response = match.func(request, *match.args, **match.kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+    def category_list(self):
+        path = reverse('category-list')
+        return path, self.render(path)
+
+    def product_list_pages(self, category):
+        """Yield (path, page, response) for every page of a category."""
+        path = reverse('product-list', args=[category.slug])
+        page = 1
+        while page is not None:
+            response = self.render(path, {'page': page} if page > 1 else None)
+            yield path, page, response
+
+            if response.status_code != 200:
+                break
+            page = response.data['category']['next_page_number']
+
+    def product_detail(self, product):
+        path = reverse('product-detail', args=[
+                       product.category.slug, product.slug])
+        return path, self.render(path)
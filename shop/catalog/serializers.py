@@ -1,6 +1,6 @@
 from rest_framework import serializers
 
-from catalog.models import Category, Product, ProductItem, ProductImage
+from catalog.models import CatalogChange, Category, Order, OrderLine, Product, ProductItem, ProductImage, SimilarProduct
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -10,7 +10,9 @@ class CategorySerializer(serializers.ModelSerializer):
             'id',
             'name',
             'description',
-            'slug'
+            'slug',
+            'products_count',
+            'in_stock_count'
         ]
 
 
@@ -53,3 +55,95 @@ class ProductSerializer(serializers.ModelSerializer):
             'product_images',
             'product_items'
         ]
+
+
+class SimilarProductSerializer(serializers.ModelSerializer):
+    """Needs select_related('similar__category') and an image_small annotation."""
+    id = serializers.IntegerField(source='similar_id')
+    name = serializers.CharField(source='similar.name')
+    slug = serializers.CharField(source='similar.slug')
+    category_slug = serializers.CharField(source='similar.category.slug')
+    price = serializers.IntegerField(source='similar.price')
+    new_price = serializers.IntegerField(source='similar.new_price')
+    image_small = serializers.SerializerMethodField()
+
+    class Meta:
+        model = SimilarProduct
+        fields = [
+            'id',
+            'name',
+            'slug',
+            'category_slug',
+            'price',
+            'new_price',
+            'image_small',
+            'same_category'
+        ]
+
+    def get_image_small(self, obj):
+        if not obj.image_small:
+            return None
+        url = ProductImage.image_small.field.storage.url(obj.image_small)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request is not None else url
+
+
+class OrderLineSerializer(serializers.ModelSerializer):
+    # Null once the product or its size is deleted.
+    product = serializers.IntegerField(source='product_item.product_id', allow_null=True)
+
+    class Meta:
+        model = OrderLine
+        fields = [
+            'product',
+            'product_name',
+            'size',
+            'price',
+            'quantity'
+        ]
+
+
+class OrderSerializer(serializers.ModelSerializer):
+    order_lines = OrderLineSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Order
+        fields = [
+            'token',
+            'status',
+            'date_created',
+            'reserved_until',
+            'order_lines'
+        ]
+
+
+class OrderLineCreateSerializer(serializers.Serializer):
+    product = serializers.IntegerField(min_value=1)
+    size = serializers.ChoiceField(choices=ProductItem.SIZE_CHOICES)
+    quantity = serializers.IntegerField(min_value=1, max_value=100)
+
+
+class OrderCreateSerializer(serializers.Serializer):
+    MAX_LINES = 50
+
+    order_lines = OrderLineCreateSerializer(many=True, allow_empty=False)
+
+    def validate_order_lines(self, value):
+        if len(value) > self.MAX_LINES:
+            raise serializers.ValidationError(
+                f'Ensure this field has no more than {self.MAX_LINES} elements.')
+        return value
+
+
+class CatalogChangeSerializer(serializers.ModelSerializer):
+    revision = serializers.IntegerField(source='id')
+
+    class Meta:
+        model = CatalogChange
+        fields = [
+            'revision',
+            'object_type',
+            'object_id',
+            'action',
+            'date_created'
+        ]
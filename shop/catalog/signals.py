@@ -0,0 +1,262 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import Signal, receiver
+
+from catalog import cache, events, querycache, sitemaps, slugs, surrogate
+from catalog.models import CatalogChange, Category, Product, ProductImage, ProductItem, SimilarProduct
+
+# Every write statement invalidates the query caches of the tables it writes.
+connection_created.connect(querycache.install)
+
+
+def bump_on_commit(bump_version, *args):
+    """
+    Bump a cache version now and again on commit, as catalog.querycache does
+    for tables. Until the commit other processes still read the old rows and
+    may cache them under the first new version.
+    """
+    bump_version(*args)
+    transaction.on_commit(lambda: bump_version(*args))
+
+
+# Sent with item_ids when stock is changed by queryset updates, which do not
+# send post_save, e.g. by reservations in catalog.stock.
+stock_changed = Signal()
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_category(sender, instance, raw, **kwargs):
+    if raw or instance.pk is None:
+        instance._previous_category_id = None
+        return
+
+    instance._previous_category_id = Product.objects.filter(
+        pk=instance.pk).values_list('category_id', flat=True).first()
+
+
+@receiver(post_save, sender=Product)
+def update_category_counters_on_product_save(sender, instance, raw, **kwargs):
+    if raw:
+        return
+
+    category_ids = {instance.category_id}
+    previous_category_id = getattr(instance, '_previous_category_id', None)
+    if previous_category_id is not None:
+        category_ids.add(previous_category_id)
+    Category.update_counters(category_ids)
+
+
+@receiver(post_delete, sender=Product)
+def update_category_counters_on_product_delete(sender, instance, **kwargs):
+    Category.update_counters([instance.category_id])
+
+
+@receiver(post_save, sender=ProductItem)
+@receiver(post_delete, sender=ProductItem)
+def update_category_counters_on_stock_change(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+
+    Category.update_counters(Product.objects.filter(
+        pk=instance.product_id).values('category_id'))
+
+
+@receiver(stock_changed, sender=ProductItem)
+def update_category_counters_on_bulk_stock_change(sender, item_ids, **kwargs):
+    Category.update_counters(Product.objects.filter(
+        product_items__in=item_ids).values('category_id'))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_slugs(sender, **kwargs):
+    bump_on_commit(slugs.bump_version)
+
+
+def invalidate_cached_products(product_ids, category_ids):
+    """
+    Invalidate cached responses showing the products: their details and
+    listings, details recommending them and the category list.
+    """
+    scopes = {cache.CATEGORIES_SCOPE}
+    scopes.update(map(cache.product_scope, product_ids))
+    scopes.update(map(cache.category_scope, category_ids))
+    scopes.update(map(cache.product_scope, SimilarProduct.objects.filter(
+        similar__in=product_ids).values_list('product_id', flat=True)))
+    bump_on_commit(cache.bump_version, scopes)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_cache_on_category_change(sender, **kwargs):
+    # Category slugs are part of every product URL.
+    bump_on_commit(cache.bump_version)
+
+
+@receiver(post_save, sender=Product)
+@receiver(pre_delete, sender=Product)
+def invalidate_cache_on_product_change(sender, instance, raw=False, **kwargs):
+    # Before a delete, while it is still recommended by other products.
+    if raw:
+        return
+
+    category_ids = {instance.category_id}
+    previous_category_id = getattr(instance, '_previous_category_id', None)
+    if previous_category_id is not None:
+        category_ids.add(previous_category_id)
+    invalidate_cached_products([instance.pk], category_ids)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=ProductItem)
+@receiver(post_delete, sender=ProductItem)
+def invalidate_cache_on_product_part_change(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+
+    invalidate_cached_products([instance.product_id], Product.objects.filter(
+        pk=instance.product_id).values_list('category_id', flat=True))
+
+
+@receiver(stock_changed, sender=ProductItem)
+def invalidate_cache_on_bulk_stock_change(sender, item_ids, **kwargs):
+    products = list(Product.objects.filter(
+        product_items__in=item_ids).values_list('pk', 'category_id').distinct())
+    invalidate_cached_products(
+        [product_id for product_id, _ in products], {category_id for _, category_id in products})
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_sitemaps_on_category_change(sender, **kwargs):
+    # Category slugs are part of every product URL.
+    bump_on_commit(sitemaps.bump_version)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_sitemap(sender, instance, **kwargs):
+    bump_on_commit(sitemaps.bump_version, [instance.pk])
+
+
+@receiver(post_save, sender=ProductItem)
+@receiver(post_delete, sender=ProductItem)
+def invalidate_product_sitemap_on_stock_change(sender, instance, **kwargs):
+    bump_on_commit(sitemaps.bump_version, [instance.product_id])
+
+
+@receiver(stock_changed, sender=ProductItem)
+def invalidate_product_sitemaps_on_bulk_stock_change(sender, item_ids, **kwargs):
+    bump_on_commit(sitemaps.bump_version, list(ProductItem.objects.filter(
+        pk__in=item_ids).values_list('product_id', flat=True).distinct()))
+
+
+@receiver(post_save, sender=ProductItem)
+@receiver(post_delete, sender=ProductItem)
+@receiver(stock_changed, sender=ProductItem)
+def publish_stock_events(sender, **kwargs):
+    # Stock events of this process are sent without waiting for the next poll.
+    transaction.on_commit(events.broadcaster.wake)
+
+
+CHANGE_TYPES = {
+    Category: CatalogChange.TYPE_CATEGORY,
+    Product: CatalogChange.TYPE_PRODUCT,
+    ProductItem: CatalogChange.TYPE_PRODUCT_ITEM,
+    ProductImage: CatalogChange.TYPE_PRODUCT_IMAGE,
+}
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=ProductItem)
+def record_save(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+
+    CatalogChange.objects.create(
+        object_type=CHANGE_TYPES[sender], object_id=instance.pk,
+        product_id=getattr(instance, 'product_id', None),
+        action=CatalogChange.ACTION_CREATED if created else CatalogChange.ACTION_UPDATED)
+
+
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_delete, sender=ProductItem)
+def record_delete(sender, instance, **kwargs):
+    CatalogChange.objects.create(
+        object_type=CHANGE_TYPES[sender], object_id=instance.pk,
+        product_id=getattr(instance, 'product_id', None),
+        action=CatalogChange.ACTION_DELETED)
+
+
+@receiver(stock_changed, sender=ProductItem)
+def record_stock_change(sender, item_ids, **kwargs):
+    CatalogChange.objects.bulk_create([
+        CatalogChange(object_type=CatalogChange.TYPE_PRODUCT_ITEM, object_id=item_id,
+                      product_id=product_id, action=CatalogChange.ACTION_UPDATED)
+        for item_id, product_id in ProductItem.objects.filter(
+            pk__in=item_ids).order_by('pk').values_list('pk', 'product_id')
+    ])
+
+
+def purge(keys):
+    keys = {*keys, surrogate.CHANGES_KEY}
+    transaction.on_commit(lambda: surrogate.purge_queue.add(keys))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def purge_category(sender, instance, **kwargs):
+    if settings.SURROGATE_PURGE_URL:
+        purge([surrogate.category_key(instance.pk), surrogate.CATEGORIES_KEY])
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def purge_product(sender, instance, **kwargs):
+    if not settings.SURROGATE_PURGE_URL:
+        return
+
+    # Listings and category counters of the old and new category change too.
+    keys = [surrogate.product_key(instance.pk), surrogate.category_key(instance.category_id),
+            surrogate.CATEGORIES_KEY]
+    previous_category_id = getattr(instance, '_previous_category_id', None)
+    if previous_category_id is not None:
+        keys.append(surrogate.category_key(previous_category_id))
+    purge(keys)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def purge_product_image(sender, instance, **kwargs):
+    if settings.SURROGATE_PURGE_URL:
+        purge([surrogate.image_key(instance.pk), surrogate.product_key(instance.product_id)])
+
+
+def purge_stock(products):
+    keys = {surrogate.CATEGORIES_KEY}
+    for product_id, category_id in products.values_list('pk', 'category_id'):
+        keys.update([surrogate.product_key(product_id), surrogate.category_key(category_id)])
+    purge(keys)
+
+
+@receiver(post_save, sender=ProductItem)
+@receiver(post_delete, sender=ProductItem)
+def purge_product_item(sender, instance, **kwargs):
+    # In stock products enter and leave category listings.
+    if settings.SURROGATE_PURGE_URL:
+        purge_stock(Product.objects.filter(pk=instance.product_id))
+
+
+@receiver(stock_changed, sender=ProductItem)
+def purge_bulk_stock_change(sender, item_ids, **kwargs):
+    if settings.SURROGATE_PURGE_URL:
+        purge_stock(Product.objects.filter(product_items__in=item_ids).distinct())
@@ -0,0 +1,134 @@
+"""
+Sitemaps of the storefront: an index, one sitemap of every category and
+sitemaps of in-stock products in chunks of SITEMAP_CHUNK_SIZE primary keys.
+
+Sitemaps may only list URLs of their own host and path, so they are served
+at the root of the project for the storefront host at SHOP_URL to proxy:
+
+    location = /sitemap.xml { proxy_pass http://django; }
+    location /sitemaps/ { proxy_pass http://django; }
+
+Product sitemaps are streamed from iterator() queries and cached under a
+version of their chunk, which signals bump when a product of the chunk or
+its stock changes, and under a version of all sitemaps, bumped when a
+category changes since category slugs are part of the product URLs. An
+unchanged chunk is never regenerated however large the catalog grows.
+"""
+
+from uuid import uuid4
+from xml.sax.saxutils import escape
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Exists, F, OuterRef
+
+from catalog import storefront
+from catalog.models import Category, Product, ProductItem
+
+VERSION_KEY = 'catalog:sitemaps:version'
+# The index and the category sitemap change with any chunk.
+INDEX_CHUNK = 'index'
+
+HEADER = '<?xml version="1.0" encoding="UTF-8"?>\n'
+URLSET_OPEN = '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+URLSET_CLOSE = '</urlset>\n'
+INDEX_OPEN = '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+INDEX_CLOSE = '</sitemapindex>\n'
+
+
+def chunk_of(product_id):
+    return product_id // settings.SITEMAP_CHUNK_SIZE
+
+
+def version_key(chunk):
+    return f'{VERSION_KEY}:{chunk}'
+
+
+def bump_version(product_ids=None):
+    """
+    Invalidate the sitemaps of the given products' chunks, or of all
+    chunks when product_ids is None.
+    """
+    if product_ids is None:
+        cache.set(VERSION_KEY, uuid4().hex, None)
+        return
+
+    chunks = {chunk_of(product_id) for product_id in product_ids}
+    cache.set_many({version_key(chunk): uuid4().hex for chunk in [*chunks, INDEX_CHUNK]}, None)
+
+
+def get_version(chunk):
+    keys = [VERSION_KEY, version_key(chunk)]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            version = uuid4().hex
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+            versions[key] = version
+    return '-'.join(versions[key] for key in keys)
+
+
+def get_or_render(name, chunk, render):
+    """Return a sitemap from the cache, rendering it on a miss."""
+    key = f'catalog:sitemaps:{name}:{get_version(chunk)}'
+    content = cache.get(key)
+    if content is None:
+        content = ''.join(render())
+        cache.set(key, content, settings.SITEMAP_CACHE_TIMEOUT)
+    return content
+
+
+def in_stock_products():
+    return Product.objects.filter(Exists(
+        ProductItem.objects.filter(product=OuterRef('pk'), quantity__gt=0)))
+
+
+def url(location):
+    return f'<url><loc>{escape(location)}</loc></url>\n'
+
+
+def product_chunks():
+    """Numbers of the chunks with products in stock."""
+    return in_stock_products().annotate(
+        chunk=F('pk') / settings.SITEMAP_CHUNK_SIZE
+    ).order_by('chunk').values_list('chunk', flat=True).distinct()
+
+
+def get_chunks():
+    """Numbers of the chunks with products in stock, cached as the index."""
+    key = f'catalog:sitemaps:chunks:{get_version(INDEX_CHUNK)}'
+    chunks = cache.get(key)
+    if chunks is None:
+        chunks = list(product_chunks())
+        cache.set(key, chunks, settings.SITEMAP_CACHE_TIMEOUT)
+    return chunks
+
+
+def render_index(chunk_location):
+    yield HEADER
+    yield INDEX_OPEN
+    for location in [chunk_location(None), *map(chunk_location, get_chunks())]:
+        yield f'<sitemap><loc>{escape(location)}</loc></sitemap>\n'
+    yield INDEX_CLOSE
+
+
+def render_categories():
+    yield HEADER
+    yield URLSET_OPEN
+    for slug in Category.objects.values_list('slug', flat=True).iterator():
+        yield url(storefront.category_url(slug))
+    yield URLSET_CLOSE
+
+
+def render_products(chunk):
+    size = settings.SITEMAP_CHUNK_SIZE
+    products = in_stock_products().filter(
+        pk__gte=chunk * size, pk__lt=(chunk + 1) * size
+    ).order_by('pk').values_list('category__slug', 'slug')
+
+    yield HEADER
+    yield URLSET_OPEN
+    for category_slug, slug in products.iterator():
+        yield url(storefront.product_url(category_slug, slug))
+    yield URLSET_CLOSE
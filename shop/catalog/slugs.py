@@ -0,0 +1,72 @@
+import threading
+import time
+from uuid import uuid4
+
+from django.core.cache import cache
+
+from catalog.models import Category, Product
+
+VERSION_KEY = 'catalog:slugs:version'
+
+
+def bump_version():
+    """Invalidate slug caches of all processes sharing the cache backend."""
+    cache.set(VERSION_KEY, uuid4().hex, None)
+
+
+class SlugCache:
+    """
+    Per-process map of slugs to primary key values, shared between threads.
+
+    Every lookup compares the local copy with the version stored in the
+    shared cache, so a bump_version() call from any process drops it.
+    Unknown slugs are remembered for negative_timeout seconds; at most
+    max_size of them are kept to bound memory under scraping.
+    """
+
+    def __init__(self, queryset, fields, negative_timeout=60, max_size=10000):
+        self.queryset = queryset
+        self.fields = fields
+        self.negative_timeout = negative_timeout
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._version = None
+        self._found = {}
+        self._missing = {}
+
+    def resolve(self, slug):
+        version = cache.get(VERSION_KEY)
+        now = time.monotonic()
+
+        with self._lock:
+            if version != self._version:
+                self._version = version
+                self._found.clear()
+                self._missing.clear()
+
+            if slug in self._found:
+                return self._found[slug]
+            if self._missing.get(slug, 0) > now:
+                return None
+
+        value = self.queryset.filter(slug=slug).values_list(
+            *self.fields, flat=len(self.fields) == 1).first()
+
+        with self._lock:
+            if self._version != version:
+                return value
+
+            if value is None:
+                entries, entry = self._missing, now + self.negative_timeout
+            else:
+                entries, entry = self._found, value
+
+            if len(entries) >= self.max_size:
+                entries.clear()
+            entries[slug] = entry
+
+        return value
+
+
+category_slugs = SlugCache(Category.objects.all(), ['id'])
+product_slugs = SlugCache(Product.objects.all(), ['id', 'category_id'])
@@ -0,0 +1,139 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from catalog.models import Order, OrderLine, ProductItem
+from catalog.signals import stock_changed
+
+
+class OutOfStock(Exception):
+    def __init__(self, unavailable):
+        super().__init__(f'Not enough stock for {unavailable}')
+        self.unavailable = unavailable
+
+
+class ReservationExpired(Exception):
+    pass
+
+
+class ReservationLimitExceeded(Exception):
+    def __init__(self, limit):
+        super().__init__(f'At most {limit} units can be reserved')
+        self.limit = limit
+
+
+def reserve(lines, client='', address=''):
+    """
+    Reserve stock for an order of (product_id, size, quantity) lines.
+
+    Stock is taken with conditional UPDATE ... SET quantity = quantity - n
+    WHERE quantity >= n statements, so concurrent buyers never oversell and
+    never hold row locks between reading and writing. Either every line is
+    reserved or, raising OutOfStock, none is.
+
+    A client, the user or session ordering, holds at most
+    ORDER_MAX_RESERVED_UNITS reserved units and a client address at most
+    ORDER_MAX_RESERVED_UNITS_PER_IP, beyond that ReservationLimitExceeded
+    is raised with the exceeded limit.
+    """
+    release_expired()
+
+    quantities = {}
+    for product_id, size, quantity in lines:
+        quantities[product_id, size] = quantities.get(
+            (product_id, size), 0) + quantity
+
+    condition = Q(pk__in=[])
+    for product_id, size in quantities:
+        condition |= Q(product_id=product_id, size=size)
+    item_ids = {}
+    products = {}
+    for item_id, product_id, size, name, price in ProductItem.objects.filter(condition).order_by(
+            'pk').values_list('pk', 'product_id', 'size', 'product__name', 'product__effective_price'):
+        item_ids.setdefault((product_id, size), item_id)
+        products[product_id] = name, price
+
+    unavailable = [line for line in quantities if line not in item_ids]
+    if unavailable:
+        raise OutOfStock(unavailable)
+
+    with transaction.atomic():
+        # Writing first takes the SQLite write lock up front, so concurrent
+        # reservations queue on the busy timeout instead of deadlocking.
+        order = Order.objects.create(
+            client=client, address=address,
+            reserved_until=timezone.now() + timedelta(seconds=settings.ORDER_RESERVATION_TIMEOUT))
+
+        for field, value, limit in [('client', client, settings.ORDER_MAX_RESERVED_UNITS),
+                                    ('address', address, settings.ORDER_MAX_RESERVED_UNITS_PER_IP)]:
+            if not value:
+                continue
+            reserved = OrderLine.objects.filter(**{
+                f'order__{field}': value, 'order__status': Order.STATUS_RESERVED
+            }).aggregate(units=Sum('quantity'))['units'] or 0
+            if reserved + sum(quantities.values()) > limit:
+                raise ReservationLimitExceeded(limit)
+
+        # A stable update order keeps row-locking databases free of deadlocks.
+        for line in sorted(quantities, key=item_ids.get):
+            updated = ProductItem.objects.filter(
+                pk=item_ids[line], quantity__gte=quantities[line]
+            ).update(quantity=F('quantity') - quantities[line])
+            if not updated:
+                unavailable.append(line)
+
+        if unavailable:
+            raise OutOfStock(unavailable)
+
+        OrderLine.objects.bulk_create([
+            OrderLine(order=order, product_item_id=item_ids[line],
+                      product_name=products[line[0]][0], size=line[1],
+                      price=products[line[0]][1], quantity=quantities[line])
+            for line in quantities
+        ])
+        # Receivers update the counters and the change log in this
+        # transaction, caches are invalidated again on commit.
+        stock_changed.send(sender=ProductItem, item_ids=list(item_ids.values()))
+
+    return order
+
+
+def confirm(order):
+    updated = Order.objects.filter(
+        pk=order.pk, status=Order.STATUS_RESERVED, reserved_until__gt=timezone.now()
+    ).update(status=Order.STATUS_CONFIRMED)
+    if not updated:
+        raise ReservationExpired
+    order.status = Order.STATUS_CONFIRMED
+
+
+def release(order):
+    """Return the stock of a reserved order. Returns False if it was not reserved."""
+    with transaction.atomic():
+        updated = Order.objects.filter(
+            pk=order.pk, status=Order.STATUS_RESERVED
+        ).update(status=Order.STATUS_RELEASED)
+        if not updated:
+            return False
+
+        # Deleted items have nothing to return to.
+        lines = list(OrderLine.objects.filter(
+            order_id=order.pk, product_item__isnull=False
+        ).order_by('product_item_id').values_list('product_item_id', 'quantity'))
+        for item_id, quantity in lines:
+            ProductItem.objects.filter(pk=item_id).update(
+                quantity=F('quantity') + quantity)
+        stock_changed.send(sender=ProductItem, item_ids=[
+                           item_id for item_id, _ in lines])
+
+    order.status = Order.STATUS_RELEASED
+    return True
+
+
+def release_expired():
+    expired = Order.objects.filter(
+        status=Order.STATUS_RESERVED, reserved_until__lte=timezone.now())
+    return sum(release(order) for order in list(expired.only('pk')))
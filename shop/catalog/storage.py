@@ -0,0 +1,58 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage which names files by the SHA-256 of their content.
+
+    The directory and the extension of the requested name are kept, the
+    base name is replaced by the digest: ``product_images/ab/abcd….jpg``.
+    Saving bytes which are already stored writes nothing and returns the
+    existing name, so URLs stay stable across re-imports and can be cached
+    forever. Files are never overwritten in place; unreferenced ones are
+    removed by the gc_media command.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is derived from the content in _save().
+        return name
+
+    def _save(self, name, content):
+        directory, base_name = os.path.split(name)
+        extension = os.path.splitext(base_name)[1].lower()
+
+        full_directory = self.path(directory)
+        os.makedirs(full_directory, exist_ok=True)
+
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(
+            dir=full_directory, prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    f.write(chunk)
+
+            hexdigest = digest.hexdigest()
+            name = os.path.join(directory, hexdigest[:2], f'{hexdigest}{extension}')
+            full_path = self.path(name)
+
+            if os.path.exists(full_path):
+                # Refresh the modification time so that gc_media, which only
+                # removes old files, does not race with this new reference.
+                os.utime(full_path)
+                os.unlink(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                os.chmod(tmp_path, self.file_permissions_mode or 0o644)
+                os.replace(tmp_path, full_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        return name.replace('\\', '/')
@@ -0,0 +1,16 @@
+from django.conf import settings
+
+
+def url(path):
+    """URL of a path on the storefront at SHOP_URL."""
+    return f'{settings.SHOP_URL.rstrip("/")}{path}'
+
+
+def category_url(category_slug):
+    """URL of the category page of the storefront at SHOP_URL."""
+    return url(f'/{category_slug}/')
+
+
+def product_url(category_slug, slug):
+    """URL of the product page of the storefront at SHOP_URL."""
+    return f'{category_url(category_slug)}{slug}/'
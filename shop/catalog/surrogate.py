@@ -0,0 +1,112 @@
+import json
+import logging
+import threading
+import time
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES_KEY = 'categories'
+CHANGES_KEY = 'changes'
+
+
+def category_key(category_id):
+    return f'category-{category_id}'
+
+
+def product_key(product_id):
+    return f'product-{product_id}'
+
+
+def image_key(image_id):
+    return f'image-{image_id}'
+
+
+def product_data_keys(products):
+    """Keys of serialized products and their images."""
+    for product in products:
+        yield product_key(product['id'])
+        for image in product['product_images']:
+            yield image_key(image['id'])
+
+
+def set_surrogate_keys(response, keys):
+    header = settings.SURROGATE_KEY_HEADER
+    if header:
+        # Cloudflare separates Cache-Tag values with commas, Fastly and
+        # Varnish xkey use spaces.
+        separator = ',' if header.lower() == 'cache-tag' else ' '
+        response[header] = separator.join(dict.fromkeys(keys))
+    return response
+
+
+class PurgeQueue:
+    """
+    Sends surrogate keys to SURROGATE_PURGE_URL from a background thread.
+
+    Keys added while a batch is being sent, or within SURROGATE_PURGE_DELAY
+    seconds of each other, are merged and deduplicated, then posted as
+    {"keys": [...]} in requests of at most SURROGATE_PURGE_BATCH_SIZE keys.
+    Failed requests are logged, never raised into the saving request.
+    """
+
+    def __init__(self):
+        self._pending = set()
+        self._sending = False
+        self._thread = None
+        self._condition = threading.Condition()
+
+    def add(self, keys):
+        if not settings.SURROGATE_PURGE_URL:
+            return
+
+        with self._condition:
+            self._pending.update(keys)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='surrogate-purge', daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def flush(self, timeout=None):
+        """Wait until every added key has been sent. Returns False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._pending and not self._sending, timeout)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending)
+            time.sleep(settings.SURROGATE_PURGE_DELAY)
+
+            with self._condition:
+                keys = sorted(self._pending)
+                self._pending.clear()
+                self._sending = True
+            try:
+                batch_size = settings.SURROGATE_PURGE_BATCH_SIZE
+                for start in range(0, len(keys), batch_size):
+                    self._send(keys[start:start + batch_size])
+            finally:
+                with self._condition:
+                    self._sending = False
+                    self._condition.notify_all()
+
+    def _send(self, keys):
+        headers = {'Content-Type': 'application/json'}
+        if settings.SURROGATE_PURGE_TOKEN:
+            headers['Authorization'] = f'Bearer {settings.SURROGATE_PURGE_TOKEN}'
+        request = Request(
+            settings.SURROGATE_PURGE_URL, data=json.dumps({'keys': keys}).encode(),
+            headers=headers, method='POST')
+        try:
+            with urlopen(request, timeout=settings.SURROGATE_PURGE_TIMEOUT) as response:
+                response.read()
+        except Exception:
+            logger.exception('Purging %d surrogate keys failed', len(keys))
+
+
+purge_queue = PurgeQueue()
@@ -0,0 +1,121 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog.admin import EstimatedCountPaginator
+from catalog.models import Category, Product, ProductItem
+
+
+class CatalogAdminTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        cls.category = Category.objects.create(
+            name='Test category name', slug='test-category-slug')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def create_products(self, count, start=0):
+        for num in range(start, start + count):
+            product = Product.objects.create(
+                category=self.category, name=f'Test product name {num}', slug=f'test-product-slug-{num}')
+            ProductItem.objects.create(product=product, size=48, quantity=1)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        for model in ['product', 'productitem']:
+            with self.subTest(model=model):
+                ProductItem.objects.all().delete()
+                Product.objects.all().delete()
+                url = reverse(f'admin:catalog_{model}_changelist')
+
+                self.create_products(2)
+                few = self.count_queries(url)
+                self.create_products(20, start=2)
+                self.assertEqual(self.count_queries(url), few)
+
+    def test_changelist_uses_estimated_count(self):
+        self.create_products(3)
+
+        with mock.patch.object(EstimatedCountPaginator, 'EXACT_COUNT_LIMIT', 0), \
+                CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(reverse('admin:catalog_productitem_changelist'))
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertFalse([q for q in queries if 'COUNT(*)' in q['sql']
+                          and 'catalog_productitem' in q['sql']])
+
+    def test_estimated_count(self):
+        self.create_products(3)
+        ProductItem.objects.order_by('pk').first().delete()
+
+        paginator = EstimatedCountPaginator(ProductItem.objects.order_by('pk'), 10)
+        self.assertEqual(paginator.count, 2)
+
+        with mock.patch.object(EstimatedCountPaginator, 'EXACT_COUNT_LIMIT', 0):
+            paginator = EstimatedCountPaginator(ProductItem.objects.order_by('pk'), 10)
+            self.assertEqual(paginator.count, ProductItem.objects.latest('pk').pk)
+
+            paginator = EstimatedCountPaginator(
+                ProductItem.objects.filter(size=48).order_by('pk'), 10)
+            self.assertEqual(paginator.count, 2)
+
+    def test_inline_stock_grid_is_saved_in_bulk(self):
+        product = Product.objects.create(
+            category=self.category, name='Test product name', slug='test-product-slug',
+            description='Description', detail='Detail')
+        items = [ProductItem.objects.create(product=product, size=size, quantity=0)
+                 for size in (48, 50, 52)]
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.in_stock_count, 0)
+
+        data = {
+            'category': self.category.pk,
+            'name': product.name,
+            'slug': product.slug,
+            'description': product.description,
+            'detail': product.detail,
+            'price': 100,
+            'discount': 0,
+            'product_items-TOTAL_FORMS': 4,
+            'product_items-INITIAL_FORMS': 3,
+            'product_images-TOTAL_FORMS': 0,
+            'product_images-INITIAL_FORMS': 0,
+        }
+        for num, item in enumerate(items):
+            data.update({
+                f'product_items-{num}-id': item.pk,
+                f'product_items-{num}-product': product.pk,
+                f'product_items-{num}-size': item.size,
+                f'product_items-{num}-quantity': num + 1,
+            })
+        data['product_items-2-DELETE'] = 'on'
+        data.update({
+            'product_items-3-product': product.pk,
+            'product_items-3-size': 60,
+            'product_items-3-quantity': 7,
+        })
+
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.post(
+                reverse('admin:catalog_product_change', args=[product.pk]), data)
+        self.assertEqual(resp.status_code, 302)
+
+        item_updates = [q for q in queries if q['sql'].startswith('UPDATE "catalog_productitem"')]
+        self.assertEqual(len(item_updates), 1)
+        self.assertEqual(
+            sorted(ProductItem.objects.filter(product=product).values_list('size', 'quantity')),
+            [(48, 1), (50, 2), (60, 7)])
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.in_stock_count, 1)
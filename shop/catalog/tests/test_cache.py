@@ -0,0 +1,219 @@
+import threading
+import time
+from io import StringIO
+from uuid import uuid4
+
+from django.contrib.auth.models import User
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TransactionTestCase
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from catalog.cache import CATEGORIES_SCOPE, TieredCache, catalog_cache, get_version
+from catalog.management.commands.warm_cache import RateLimiter
+from catalog.models import Category, Product, ProductItem
+
+
+class TieredCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.backend = LocMemCache(uuid4().hex, {})
+        self.cache = TieredCache(
+            self.backend, max_entries=2, wait_timeout=2, poll_interval=0.01)
+
+    def test_miss_then_local_hit(self):
+        self.assertEqual(self.cache.get_or_set('key', lambda: 'value', 60), 'value')
+        self.assertEqual(self.cache.get_or_set('key', lambda: 'other', 60), 'value')
+
+        stats = self.cache.stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['local_hits'], 1)
+
+    def test_shared_hit(self):
+        self.cache.get_or_set('key', lambda: 'value', 60)
+
+        other_process = TieredCache(self.backend)
+        self.assertEqual(other_process.get_or_set(
+            'key', lambda: 'other', 60), 'value')
+        self.assertEqual(other_process.stats()['shared_hits'], 1)
+
+    def test_local_entries_are_limited(self):
+        for key in ['a', 'b', 'c']:
+            self.cache.get_or_set(key, lambda: key, 60)
+
+        self.assertEqual(self.cache.stats()['local_entries'], 2)
+        self.assertEqual(self.cache.get_or_set('a', lambda: 'other', 60), 'a')
+        self.assertEqual(self.cache.stats()['shared_hits'], 1)
+
+    def test_single_flight_in_process(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'value'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            self.cache.get_or_set('key', compute, 60))) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results, ['value'] * 10)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.cache.stats()['waits'], 9)
+
+    def test_single_flight_across_processes(self):
+        self.backend.add('key:lock', 1, 10)
+
+        def other_process():
+            time.sleep(0.1)
+            self.backend.set('key', ('value', 0.1, time.time() + 60), 60)
+
+        thread = threading.Thread(target=other_process)
+        thread.start()
+        value = self.cache.get_or_set('key', lambda: 'other', 60)
+        thread.join()
+
+        self.assertEqual(value, 'value')
+        self.assertEqual(self.cache.stats()['waits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 0)
+
+    def test_early_refresh(self):
+        # A value which took long to compute is refreshed well before expiry.
+        self.backend.set('key', ('stale', 10000, time.time() + 1), 60)
+
+        self.assertEqual(self.cache.get_or_set('key', lambda: 'fresh', 60), 'fresh')
+        self.assertEqual(self.cache.stats()['early_refreshes'], 1)
+
+    def test_stale_value_is_served_while_refreshing(self):
+        self.backend.set('key', ('stale', 10, time.time() + 1), 60)
+        self.backend.add('key:lock', 1, 10)
+
+        self.assertEqual(self.cache.get_or_set('key', lambda: 'fresh', 60), 'stale')
+
+    def test_failed_compute_releases_lock(self):
+        def compute():
+            raise ValueError
+
+        with self.assertRaises(ValueError):
+            self.cache.get_or_set('key', compute, 60)
+        self.assertIsNone(self.backend.get('key:lock'))
+        self.assertEqual(self.cache.get_or_set('key', lambda: 'value', 60), 'value')
+
+
+class CachedViewsTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Category.objects.create(name='Test category name', slug='test-slug')
+
+    def test_cached_response(self):
+        self.client.get(reverse('category-list'))
+        with self.assertNumQueries(0):
+            resp = self.client.get(reverse('category-list'))
+        self.assertEqual(resp.data[0]['name'], 'Test category name')
+
+    def test_change_invalidates_cache(self):
+        self.client.get(reverse('category-list'))
+
+        category = Category.objects.get(slug='test-slug')
+        category.name = 'Changed category name'
+        category.save()
+
+        resp = self.client.get(reverse('category-list'))
+        self.assertEqual(resp.data[0]['name'], 'Changed category name')
+
+    def test_change_invalidates_only_responses_showing_it(self):
+        category = Category.objects.get(slug='test-slug')
+        product = Product.objects.create(
+            category=category, name='Test product name', slug='test-product-slug')
+        item = ProductItem.objects.create(product=product, size=48, quantity=1)
+        other = Category.objects.create(name='Other category name', slug='other-slug')
+        other_product = Product.objects.create(
+            category=other, name='Other product name', slug='other-product-slug')
+        ProductItem.objects.create(product=other_product, size=48, quantity=1)
+
+        urls = [reverse('product-list', args=['test-slug']),
+                reverse('product-list', args=['other-slug'])]
+        for url in urls:
+            self.client.get(url)
+
+        item.quantity = 0
+        item.save()
+        resp = self.client.get(urls[0])
+        self.assertEqual(resp.data['category']['products'], [])
+        with self.assertNumQueries(0):
+            self.client.get(urls[1])
+
+    def test_cache_is_invalidated_again_on_commit(self):
+        category = Category.objects.get(slug='test-slug')
+        with self.captureOnCommitCallbacks() as callbacks:
+            category.name = 'Changed category name'
+            category.save()
+        # As if another process cached the category list before the commit.
+        version = get_version(CATEGORIES_SCOPE)
+        self.client.get(reverse('category-list'))
+
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(get_version(CATEGORIES_SCOPE), version)
+
+    def test_stats_require_staff(self):
+        resp = self.client.get(reverse('cache-stats'))
+        self.assertEqual(resp.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_stats(self):
+        user = User.objects.create(username='admin', is_staff=True)
+        self.client.force_authenticate(user)
+
+        resp = self.client.get(reverse('cache-stats'))
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertIn('waits', resp.data)
+
+
+class RateLimiterTest(SimpleTestCase):
+    def test_rate(self):
+        limiter = RateLimiter(100)
+        start = time.monotonic()
+        for _ in range(11):
+            limiter.wait()
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+
+    def test_unlimited(self):
+        limiter = RateLimiter(0)
+        start = time.monotonic()
+        for _ in range(1000):
+            limiter.wait()
+        self.assertLess(time.monotonic() - start, 0.1)
+
+
+class WarmCacheCommandTest(TransactionTestCase):
+    def setUp(self):
+        for category_num in range(1, 3):
+            category = Category.objects.create(
+                name=f'Test category name {category_num}', slug=f'test-category-slug-{category_num}')
+            for product_num in range(1, 21):
+                product = Product.objects.create(
+                    category=category, name=f'Test product name {category_num}-{product_num}',
+                    slug=f'test-product-slug-{category_num}-{product_num}')
+                ProductItem.objects.create(product=product, quantity=1)
+
+    def test_warm_cache(self):
+        out = StringIO()
+        call_command('warm_cache', '--host', 'testserver', '--workers', '3',
+                     '--rate', '0', stdout=out)
+        # The category list, 2 pages per category and 40 products.
+        self.assertIn('warmed 45/45 pages', out.getvalue())
+
+        misses = catalog_cache.stats()['misses']
+        resp = self.client.get(
+            '/api/v1/categories/test-category-slug-2/products/', {'page': 2})
+        self.assertEqual(len(resp.json()['category']['products']), 2)
+        resp = self.client.get(
+            '/api/v1/categories/test-category-slug-1/products/test-product-slug-1-7/')
+        self.assertEqual(resp.json()['name'], 'Test product name 1-7')
+        self.assertEqual(catalog_cache.stats()['misses'], misses)
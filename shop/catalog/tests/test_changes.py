@@ -0,0 +1,110 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from catalog import stock
+from catalog.models import CatalogChange, Category, Product, ProductItem
+
+
+class CatalogChangeTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(
+            name='Test category name', slug='test-category-slug')
+        cls.product = Product.objects.create(
+            category=cls.category, name='Test product name', slug='test-product-slug')
+        cls.item = ProductItem.objects.create(product=cls.product, size=48, quantity=1)
+
+    def changes(self, since=0):
+        return list(CatalogChange.objects.filter(pk__gt=since).values_list(
+            'object_type', 'object_id', 'action'))
+
+    def get(self, **params):
+        resp = self.client.get(reverse('change-list'), params)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        return resp.data
+
+    def test_changes_are_recorded(self):
+        self.assertEqual(self.changes(), [
+            ('category', self.category.id, 'created'),
+            ('product', self.product.id, 'created'),
+            ('product_item', self.item.id, 'created'),
+        ])
+        since = CatalogChange.objects.latest('pk').pk
+
+        product_id = self.product.id
+        self.product.price = 100
+        self.product.save()
+        self.product.delete()
+        self.assertEqual(self.changes(since), [
+            ('product', product_id, 'updated'),
+            ('product_item', self.item.id, 'deleted'),
+            ('product', product_id, 'deleted'),
+        ])
+
+    def test_stock_changes_are_recorded(self):
+        since = CatalogChange.objects.latest('pk').pk
+
+        stock.reserve([(self.product.id, 48, 1)])
+        self.assertEqual(self.changes(since), [
+            ('product_item', self.item.id, 'updated'),
+        ])
+
+    def test_keyset_paging(self):
+        for quantity in range(5):
+            self.item.quantity = quantity
+            self.item.save()
+        revision = CatalogChange.objects.latest('pk').pk
+
+        data = self.get(limit=3)
+        self.assertEqual(data['revision'], revision)
+        self.assertEqual(len(data['changes']), 3)
+        self.assertTrue(data['has_more'])
+        self.assertEqual(data['changes'][0]['object_type'], 'category')
+
+        seen = [change['revision'] for change in data['changes']]
+        while data['has_more']:
+            data = self.get(since=data['next_since'], limit=3)
+            seen += [change['revision'] for change in data['changes']]
+        self.assertEqual(seen, list(CatalogChange.objects.values_list('pk', flat=True)))
+
+        data = self.get(since=revision)
+        self.assertEqual(data['changes'], [])
+        self.assertEqual(data['next_since'], revision)
+        self.assertFalse(data['has_more'])
+
+    def test_page_is_one_query_per_part(self):
+        with self.assertNumQueries(2):
+            self.get(since=1)
+
+    def test_invalid_parameters(self):
+        for params in [{'since': 'x'}, {'since': -1}, {'since': 2 ** 63}, {'limit': 0}, {'limit': 1001}]:
+            with self.subTest(params=params):
+                resp = self.client.get(reverse('change-list'), params)
+                self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CompactChangesCommandTest(APITestCase):
+
+    def test_compact(self):
+        category = Category.objects.create(name='Test category name', slug='test-category-slug')
+        other = Category.objects.create(name='Other category name', slug='other-category-slug')
+        category.save()
+        category.save()
+        CatalogChange.objects.update(date_created=timezone.now() - timedelta(days=8))
+        category.save()
+
+        out = StringIO()
+        call_command('compact_changes', '--days=7', '--batch-size=1', stdout=out)
+        self.assertIn('deleted 3 changes', out.getvalue())
+
+        self.assertEqual(list(CatalogChange.objects.values_list('object_id', 'action')), [
+            (other.id, 'created'),
+            (category.id, 'updated'),
+        ])
@@ -0,0 +1,254 @@
+import asyncio
+import json
+import tracemalloc
+from unittest import mock
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.test import TestCase, override_settings
+
+from catalog import events, stock
+from catalog.events import PATH, broadcaster
+from catalog.models import Category, Product, ProductItem
+from shop.asgi import application
+
+
+class EventStream:
+    """An in-process client of an ASGI event stream."""
+
+    def __init__(self, query, path=PATH, method='GET', client=('10.0.0.1', 50000)):
+        self.scope = {
+            'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(),
+            'headers': [(b'origin', b'http://localhost:3000')], 'client': client,
+        }
+        self.messages = asyncio.Queue()
+        self.disconnected = asyncio.Event()
+        self.task = asyncio.ensure_future(application(self.scope, self.receive, self.send))
+
+    async def receive(self):
+        await self.disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        await self.messages.put(message)
+
+    async def start(self):
+        return await asyncio.wait_for(self.messages.get(), 5)
+
+    async def body(self):
+        return (await asyncio.wait_for(self.messages.get(), 5))['body'].decode()
+
+    async def event(self):
+        body = await self.body()
+        while body.startswith(':'):
+            body = await self.body()
+        event, data = body.strip().split('\n')
+        assert event == 'event: stock', body
+        return json.loads(data[len('data: '):])
+
+    async def close(self):
+        self.disconnected.set()
+        await asyncio.wait_for(self.task, 5)
+
+
+@override_settings(STOCK_EVENTS_POLL_INTERVAL=0.01, STOCK_EVENTS_HEARTBEAT=5)
+class StockEventsTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(
+            name='Test category name', slug='test-category-slug')
+        cls.product = Product.objects.create(
+            category=category, name='Test product name', slug='test-product-slug')
+        cls.other = Product.objects.create(
+            category=category, name='Other product name', slug='other-product-slug')
+        ProductItem.objects.create(product=cls.product, size=50, quantity=1)
+        ProductItem.objects.create(product=cls.product, size=48, quantity=2)
+        ProductItem.objects.create(product=cls.other, size=48, quantity=1)
+
+    def test_stock_changes(self):
+        @async_to_sync
+        async def run():
+            stream = EventStream(f'ids={self.product.id}')
+            start = await stream.start()
+            self.assertEqual(start['status'], 200)
+            self.assertIn((b'content-type', b'text/event-stream; charset=utf-8'), start['headers'])
+            self.assertIn((b'access-control-allow-origin', b'http://localhost:3000'), start['headers'])
+
+            self.assertEqual(await stream.event(), {str(self.product.id): [
+                {'size': 48, 'quantity': 2}, {'size': 50, 'quantity': 1}]})
+
+            # Changes of other products are not sent.
+            await sync_to_async(stock.reserve)([(self.other.id, 48, 1)])
+            await sync_to_async(stock.reserve)([(self.product.id, 50, 1)])
+            self.assertEqual(await stream.event(), {str(self.product.id): [
+                {'size': 48, 'quantity': 2}, {'size': 50, 'quantity': 0}]})
+
+            await stream.close()
+            self.assertEqual(broadcaster.subscribers, {})
+
+        run()
+
+    @override_settings(STOCK_EVENTS_POLL_INTERVAL=5)
+    def test_shared_broadcaster(self):
+        @async_to_sync
+        async def run():
+            streams = [EventStream(f'ids={self.product.id},{self.other.id}') for _ in range(3)]
+            for stream in streams:
+                await stream.start()
+                await stream.event()
+            self.assertEqual(len(broadcaster.subscribers[self.product.id]), 3)
+
+            with mock.patch.object(events, 'read_changes', wraps=events.read_changes) as read_changes:
+                await sync_to_async(stock.reserve)([(self.other.id, 48, 1)])
+                # As on commit of the change.
+                broadcaster.wake()
+                for stream in streams:
+                    self.assertEqual(await stream.event(), {str(self.other.id): [{'size': 48, 'quantity': 0}]})
+            # One poll of the database feeds every connection.
+            self.assertEqual(read_changes.call_count, 1)
+
+            for stream in streams:
+                await stream.close()
+
+        run()
+
+    @override_settings(STOCK_EVENTS_POLL_INTERVAL=5)
+    def test_known_stock_is_sent_without_query(self):
+        @async_to_sync
+        async def run():
+            first = EventStream(f'ids={self.product.id}')
+            await first.start()
+            await first.event()
+
+            with mock.patch.object(events, 'read_changes', wraps=events.read_changes) as read_changes:
+                stream = EventStream(f'ids={self.product.id}')
+                await stream.start()
+                self.assertEqual(await stream.event(), {str(self.product.id): [
+                    {'size': 48, 'quantity': 2}, {'size': 50, 'quantity': 1}]})
+            read_changes.assert_not_called()
+
+            await first.close()
+            await stream.close()
+            self.assertEqual(broadcaster.stock, {})
+
+        run()
+
+    def test_deleted_items(self):
+        @async_to_sync
+        async def run():
+            stream = EventStream(f'ids={self.product.id}')
+            await stream.start()
+            await stream.event()
+
+            await sync_to_async(ProductItem.objects.filter(product=self.product, size=50).delete)()
+            broadcaster.wake()
+            self.assertEqual(await stream.event(), {str(self.product.id): [{'size': 48, 'quantity': 2}]})
+            await stream.close()
+
+        run()
+
+    def test_changes_are_read_in_batches(self):
+        revision = events.read_revision()
+        for quantity in range(3):
+            ProductItem.objects.filter(product=self.other).update(quantity=quantity)
+            stock.stock_changed.send(sender=ProductItem, item_ids=list(
+                ProductItem.objects.filter(product=self.other).values_list('pk', flat=True)))
+
+        with mock.patch.object(events, 'CHANGES_BATCH', 2):
+            revision, changed, _, more = events.read_changes(revision, [self.other.id], [])
+            self.assertEqual(changed, {self.other.id: [{'size': 48, 'quantity': 2}]})
+            self.assertTrue(more)
+            revision, _, _, more = events.read_changes(revision, [self.other.id], [])
+            self.assertFalse(more)
+        self.assertEqual(revision, events.read_revision())
+
+    @override_settings(STOCK_EVENTS_MAX_CONNECTIONS_PER_IP=2)
+    def test_connections_per_address_are_limited(self):
+        @async_to_sync
+        async def run():
+            streams = [EventStream(f'ids={self.product.id}') for _ in range(2)]
+            for stream in streams:
+                self.assertEqual((await stream.start())['status'], 200)
+
+            refused = EventStream(f'ids={self.product.id}')
+            self.assertEqual((await refused.start())['status'], 429)
+            await refused.task
+            other = EventStream(f'ids={self.product.id}', client=('10.0.0.2', 50000))
+            self.assertEqual((await other.start())['status'], 200)
+
+            await streams[0].close()
+            again = EventStream(f'ids={self.product.id}')
+            self.assertEqual((await again.start())['status'], 200)
+            for stream in [*streams[1:], other, again]:
+                await stream.close()
+            self.assertEqual(events.connections, {})
+
+        run()
+
+    @override_settings(THROTTLE_RATES={'anon': '2/min', 'trusted': '2/min'})
+    def test_connections_are_throttled(self):
+        @async_to_sync
+        async def run():
+            streams = [EventStream(f'ids={self.product.id}', client=('10.0.0.3', 50000)) for _ in range(3)]
+            statuses = [(await stream.start())['status'] for stream in streams]
+            self.assertEqual(statuses, [200, 200, 429])
+            for stream in streams[:2]:
+                await stream.close()
+
+        run()
+
+    @override_settings(STOCK_EVENTS_HEARTBEAT=0.01)
+    def test_heartbeat(self):
+        @async_to_sync
+        async def run():
+            stream = EventStream(f'ids={self.product.id}')
+            await stream.start()
+            await stream.event()
+            self.assertEqual(await stream.body(), ': heartbeat\n\n')
+            await stream.close()
+
+        run()
+
+    def test_invalid_ids(self):
+        @async_to_sync
+        async def run():
+            stream = EventStream('ids=a')
+            self.assertEqual((await stream.start())['status'], 400)
+            self.assertEqual(json.loads(await stream.body()), {'ids': 'Must be a comma separated list of integers.'})
+            await stream.task
+
+        run()
+
+    def test_other_paths_are_served_by_django(self):
+        @async_to_sync
+        async def run():
+            with mock.patch('shop.asgi.django_application', new=mock.AsyncMock()) as django_application:
+                stream = EventStream('', path='/api/v1/categories/')
+                await stream.task
+            django_application.assert_awaited_once()
+
+        run()
+
+    @override_settings(STOCK_EVENTS_MAX_CONNECTIONS_PER_IP=1000)
+    def test_idle_connections_are_cheap(self):
+        count = 1000
+
+        @async_to_sync
+        async def run():
+            tracemalloc.start()
+            try:
+                before = tracemalloc.get_traced_memory()[0]
+                streams = [EventStream(f'ids={self.product.id}') for _ in range(count)]
+                for stream in streams:
+                    await stream.start()
+                    await stream.event()
+                per_connection = (tracemalloc.get_traced_memory()[0] - before) / count
+            finally:
+                tracemalloc.stop()
+
+            for stream in streams:
+                await stream.close()
+            return per_connection
+
+        # Bytes per connection, including those of the test client.
+        self.assertLess(run(), 16 * 1024)
@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+from io import StringIO
+from xml.etree import ElementTree
+
+from django.core.management import call_command
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from catalog import feeds
+from catalog.models import Category, Product, ProductImage, ProductItem
+
+
+@override_settings(SHOP_URL='https://shop.example')
+class YmlFeedTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(
+            name='Платья & сарафаны', slug='test-category-slug')
+        cls.product = Product.objects.create(
+            category=cls.category, name='Test product <name>', slug='test-product-slug',
+            description='Silk & lace', price=1000, discount=10)
+        cls.items = [
+            ProductItem.objects.create(product=cls.product, size=50, quantity=0),
+            ProductItem.objects.create(product=cls.product, size=48, quantity=2),
+        ]
+        image = ProductImage.objects.create(product=cls.product)
+        ProductImage.objects.filter(pk=image.pk).update(image_large='product_images/large.jpg')
+
+        for num in range(1, 5):
+            product = Product.objects.create(
+                category=cls.category, name=f'Test product name {num}', slug=f'test-product-slug-{num}',
+                price=500)
+            ProductItem.objects.create(product=product, size=48, quantity=1)
+
+    def parse(self, content):
+        return ElementTree.fromstring(content).find('shop')
+
+    def test_feed(self):
+        resp = self.client.get(reverse('yml-feed'))
+        self.assertTrue(resp.streaming)
+        self.assertEqual(resp['Content-Type'], 'application/xml; charset=utf-8')
+        self.assertEqual(resp['Surrogate-Key'], 'changes')
+
+        shop = self.parse(b''.join(resp.streaming_content))
+        self.assertEqual(shop.find('categories/category').attrib['id'], str(self.category.id))
+        self.assertEqual(shop.find('categories/category').text, 'Платья & сарафаны')
+
+        offers = shop.findall('offers/offer')
+        self.assertEqual(len(offers), 6)
+        # Every size is an offer of the product's group, smallest first.
+        self.assertEqual([offer.attrib for offer in offers[:2]], [
+            {'id': str(self.items[1].id), 'group_id': str(self.product.id), 'available': 'true'},
+            {'id': str(self.items[0].id), 'group_id': str(self.product.id), 'available': 'false'},
+        ])
+
+        offer = offers[0]
+        self.assertEqual(offer.findtext('name'), 'Test product <name>')
+        self.assertEqual(offer.findtext('url'), 'https://shop.example/test-category-slug/test-product-slug/')
+        self.assertEqual(offer.findtext('price'), '900')
+        self.assertEqual(offer.findtext('oldprice'), '1000')
+        self.assertEqual(offer.findtext('picture'), 'http://testserver/media/product_images/large.jpg')
+        self.assertEqual(offer.findtext('description'), 'Silk & lace')
+        self.assertEqual(offer.find('param').attrib, {'name': 'Размер'})
+        self.assertEqual(offer.findtext('param'), '48')
+        self.assertEqual(offer.findtext('count'), '2')
+
+        self.assertIsNone(offers[-1].find('oldprice'))
+        self.assertIsNone(offers[-1].find('picture'))
+
+    def test_queries_per_chunk(self):
+        # Categories, three queries per chunk of two products and the empty chunk ending it.
+        with self.assertNumQueries(1 + 3 * 3 + 1):
+            content = ''.join(feeds.yml_feed(lambda path: path, chunk_size=2))
+        self.assertEqual(len(self.parse(content).findall('offers/offer')), 6)
+
+    def test_export_feed(self):
+        output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, output_dir)
+        output = os.path.join(output_dir, 'feed.yml')
+
+        out = StringIO()
+        call_command('export_feed', output, '--host', 'media.example', '--secure',
+                     '--chunk-size', '2', stdout=out)
+        self.assertIn(f'to {output}', out.getvalue())
+        self.assertEqual(os.listdir(output_dir), ['feed.yml'])
+
+        with open(output, encoding='utf-8') as f:
+            shop = self.parse(f.read())
+        self.assertEqual(shop.find('offers/offer/picture').text,
+                         'https://media.example/media/product_images/large.jpg')
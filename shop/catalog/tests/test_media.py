@@ -0,0 +1,148 @@
+import os
+import shutil
+import tempfile
+
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.utils.http import http_date
+
+from catalog.media import RangeNotSatisfiable, media_urlpatterns, parse_range, serve_media
+
+CONTENT = bytes(range(100))
+
+
+class ParseRangeTest(SimpleTestCase):
+    def test_ranges(self):
+        self.assertEqual(parse_range('bytes=0-9', 100), (0, 9))
+        self.assertEqual(parse_range('bytes=90-', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=-10', 100), (90, 99))
+        self.assertEqual(parse_range('bytes=-200', 100), (0, 99))
+        self.assertEqual(parse_range('bytes=90-200', 100), (90, 99))
+
+    def test_ignored(self):
+        self.assertIsNone(parse_range(None, 100))
+        self.assertIsNone(parse_range('bytes=-', 100))
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 100))
+        self.assertIsNone(parse_range('items=0-1', 100))
+        self.assertIsNone(parse_range('bytes=9-0', 100))
+
+    def test_not_satisfiable(self):
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_range('bytes=100-', 100)
+        with self.assertRaises(RangeNotSatisfiable):
+            parse_range('bytes=-0', 100)
+
+
+class ServeMediaTest(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        os.makedirs(os.path.join(self.root, 'product_images'))
+        self.path = os.path.join(self.root, 'product_images', 'image.jpg')
+        with open(self.path, 'wb') as f:
+            f.write(CONTENT)
+        with open(os.path.join(self.root, 'product_images', '.tmp.tmp'), 'wb') as f:
+            f.write(CONTENT)
+
+    def serve(self, path='product_images/image.jpg', method='get', **headers):
+        request = getattr(RequestFactory(), method)('/media/' + path, **headers)
+        response = serve_media(request, path, document_root=self.root)
+        self.addCleanup(response.close)
+        return response
+
+    def content(self, response):
+        return b''.join(response.streaming_content)
+
+    @override_settings(DEBUG=True, MEDIA_SERVE_MODE='static')
+    def test_static(self):
+        response = self.serve()
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+
+    @override_settings(MEDIA_SERVE_MODE='accel', MEDIA_ACCEL_REDIRECT_PREFIX='/protected/')
+    def test_accel(self):
+        response = self.serve('product_images/../product_images/image.jpg')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected/product_images/image.jpg')
+        self.assertNotIn('Content-Type', response)
+        self.assertEqual(response.content, b'')
+        self.assertIn('immutable', response['Cache-Control'])
+
+    @override_settings(MEDIA_SERVE_MODE='accel')
+    def test_accel_checks_path(self):
+        for path in ('product_images/missing.jpg', 'product_images/.tmp.tmp',
+                     '../etc/passwd', 'product_images'):
+            with self.subTest(path=path), self.assertRaises(Http404):
+                self.serve(path)
+
+        self.assertEqual(self.serve(method='post').status_code, 405)
+
+    @override_settings(MEDIA_SERVE_MODE='sendfile')
+    def test_sendfile(self):
+        response = self.serve()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Content-Length'], '100')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(self.content(response), CONTENT)
+
+    @override_settings(MEDIA_SERVE_MODE='sendfile')
+    def test_sendfile_keeps_fileno(self):
+        response = self.serve(HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.file_to_stream.fileno(),
+                         response.file_to_stream.file.fileno())
+        self.assertEqual(response.file_to_stream.tell(), 10)
+
+    @override_settings(MEDIA_SERVE_MODE='sendfile')
+    def test_range(self):
+        response = self.serve(HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/100')
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(self.content(response), CONTENT[10:20])
+
+        response = self.serve(HTTP_RANGE='bytes=-5')
+        self.assertEqual(self.content(response), CONTENT[95:])
+
+    @override_settings(MEDIA_SERVE_MODE='sendfile')
+    def test_range_not_satisfiable(self):
+        response = self.serve(HTTP_RANGE='bytes=200-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */100')
+
+    @override_settings(MEDIA_SERVE_MODE='sendfile')
+    def test_if_range(self):
+        etag = self.serve()['ETag']
+
+        response = self.serve(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+
+        response = self.serve(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.content(response), CONTENT)
+
+    @override_settings(MEDIA_SERVE_MODE='sendfile')
+    def test_conditional(self):
+        response = self.serve()
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        response = self.serve(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertIn('immutable', response['Cache-Control'])
+
+        response = self.serve(HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        response = self.serve(HTTP_IF_MODIFIED_SINCE=http_date(0))
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(MEDIA_SERVE_MODE='sendfile', MEDIA_URL='/media/')
+    def test_urlpatterns_without_debug(self):
+        self.assertEqual(len(media_urlpatterns()), 1)
+
+    @override_settings(MEDIA_SERVE_MODE='static')
+    def test_static_urlpatterns_only_with_debug(self):
+        self.assertEqual(media_urlpatterns(), [])
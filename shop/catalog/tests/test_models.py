@@ -1,9 +1,14 @@
 import os
 import shutil
+import subprocess
+import sys
+import tempfile
 import uuid
 from PIL import Image
+from unittest import mock
 
-from django.test import TestCase
+from django.core.exceptions import ValidationError
+from django.test import SimpleTestCase, TestCase, override_settings
 from django.db import models
 from django.core.files import File
 from django.core.validators import MaxValueValidator, MinValueValidator
@@ -63,6 +68,11 @@ class CategoryModelTest(TestCase):
         default = category._meta.get_field('sort').default
         self.assertEqual(default, 0)
 
+    def test_sort_db_index(self):
+        category = Category.objects.get(id=1)
+        db_index = category._meta.get_field('sort').db_index
+        self.assertEqual(db_index, True)
+
     def test_ordering(self):
         category = Category.objects.get(id=1)
         ordering = category._meta.ordering
@@ -74,6 +84,63 @@ class CategoryModelTest(TestCase):
         self.assertEqual(str(category), expected_object_name)
 
 
+class CategoryCountersTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(
+            name='Test category name', slug='test-category-slug')
+        cls.other_category = Category.objects.create(
+            name='Other category name', slug='other-category-slug')
+
+    def assertCounters(self, category, products_count, in_stock_count):
+        category.refresh_from_db()
+        self.assertEqual(category.products_count, products_count)
+        self.assertEqual(category.in_stock_count, in_stock_count)
+
+    def test_counters_default(self):
+        self.assertCounters(self.category, 0, 0)
+
+    def test_products_count(self):
+        Product.objects.create(
+            category=self.category, name='Test product name 1', slug='test-product-slug-1')
+        Product.objects.create(
+            category=self.category, name='Test product name 2', slug='test-product-slug-2')
+        self.assertCounters(self.category, 2, 0)
+
+    def test_in_stock_count(self):
+        product = Product.objects.create(
+            category=self.category, name='Test product name', slug='test-product-slug')
+        item = ProductItem.objects.create(product=product, size=48, quantity=1)
+        ProductItem.objects.create(product=product, size=50, quantity=2)
+        self.assertCounters(self.category, 1, 1)
+
+        item.quantity = 0
+        item.save()
+        self.assertCounters(self.category, 1, 1)
+
+        ProductItem.objects.filter(product=product, size=50).delete()
+        self.assertCounters(self.category, 1, 0)
+
+    def test_product_moved_to_other_category(self):
+        product = Product.objects.create(
+            category=self.category, name='Test product name', slug='test-product-slug')
+        ProductItem.objects.create(product=product, quantity=1)
+
+        product.category = self.other_category
+        product.save()
+        self.assertCounters(self.category, 0, 0)
+        self.assertCounters(self.other_category, 1, 1)
+
+    def test_product_deleted(self):
+        product = Product.objects.create(
+            category=self.category, name='Test product name', slug='test-product-slug')
+        ProductItem.objects.create(product=product, quantity=1)
+
+        product.delete()
+        self.assertCounters(self.category, 0, 0)
+
+
 class ProductModelTest(TestCase):
 
     @classmethod
@@ -189,6 +256,34 @@ class ProductModelTest(TestCase):
         product = Product(discount=50, price=1000)
         self.assertEqual(product.new_price, 500)
 
+    def test_effective_price_editable(self):
+        product = Product.objects.get(id=1)
+        editable = product._meta.get_field('effective_price').editable
+        self.assertEqual(editable, False)
+
+    def test_effective_price_is_new_price(self):
+        category = Category.objects.get(id=1)
+        for price, discount in [(1000, 0), (999, 30), (1, 50), (1999, 100), (12345, 17)]:
+            product = Product.objects.create(
+                category=category, name=f'Test product {price} {discount}', slug=f'test-product-{price}-{discount}',
+                price=price, discount=discount)
+            product.refresh_from_db()
+            self.assertEqual(product.effective_price, product.new_price)
+
+    def test_effective_price_is_saved_with_update_fields(self):
+        product = Product.objects.get(id=1)
+        product.price = 1000
+        product.discount = 30
+        product.save(update_fields=['price', 'discount'])
+
+        product.refresh_from_db()
+        self.assertEqual(product.effective_price, 700)
+
+    def test_effective_price_index(self):
+        product = Product.objects.get(id=1)
+        indexes = [index.fields for index in product._meta.indexes]
+        self.assertIn(['category', 'effective_price'], indexes)
+
     def test_ordering(self):
         product = Product.objects.get(id=1)
         ordering = product._meta.ordering
@@ -307,7 +402,12 @@ class ProductImageModelTest(TestCase):
     def test_ordering(self):
         product_image = ProductImage.objects.get(id=1)
         ordering = product_image._meta.ordering
-        self.assertEqual(ordering, ['product__name', 'sort'])
+        self.assertEqual(ordering, ['product_id', 'sort'])
+
+    def test_product_sort_index(self):
+        product_image = ProductImage.objects.get(id=1)
+        indexes = [index.fields for index in product_image._meta.indexes]
+        self.assertIn(['product', 'sort'], indexes)
 
     def test_object_name_is_product_name(self):
         product_image = ProductImage.objects.get(id=1)
@@ -368,6 +468,132 @@ class ProductImageModelTest(TestCase):
                 shutil.rmtree(test_media_location)
 
 
+class ProductImageUploadTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Test category name')
+        cls.product = Product.objects.create(
+            category=category, name='Test product name')
+
+    def setUp(self):
+        storage = ProductImage.image_large.field.storage
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location)
+        self.addCleanup(setattr, storage, 'location', storage.location)
+        storage.location = self.location
+
+    def upload(self, image, name='image.jpg'):
+        path = os.path.join(self.location, name)
+        image.save(path)
+        f = open(path, 'rb')
+        self.addCleanup(f.close)
+        return File(f)
+
+    @override_settings(PRODUCT_IMAGE_MAX_PIXELS=100 * 100)
+    def test_too_many_pixels(self):
+        product_image = ProductImage(
+            product=self.product, image_large=self.upload(Image.new('RGB', (101, 100))))
+
+        with self.assertRaises(ValidationError):
+            product_image.full_clean()
+        with self.assertRaises(ValidationError):
+            product_image.save()
+        self.assertEqual(ProductImage.objects.count(), 0)
+
+    def test_decompression_bomb(self):
+        upload = self.upload(Image.new('RGB', (100, 100)))
+
+        with override_settings(PRODUCT_IMAGE_MAX_PIXELS=10 ** 9), \
+                mock.patch.object(Image, 'MAX_IMAGE_PIXELS', 100 * 100 - 1):
+            with self.assertRaises(ValidationError):
+                ProductImage(product=self.product, image_large=upload).save()
+
+    def test_rgba_image(self):
+        product_image = ProductImage(
+            product=self.product,
+            image_large=self.upload(Image.new('RGBA', (600, 912)), 'image.png'))
+        product_image.save()
+
+        self.assertTrue(product_image.image_large.name.endswith('.png'))
+        self.assertTrue(product_image.image_medium.name.endswith('.jpg'))
+        with Image.open(product_image.image_medium.path) as img:
+            self.assertEqual((img.format, img.mode, img.height), ('JPEG', 'RGB', 466))
+
+    def test_stored_image_is_not_decoded_again(self):
+        product_image = ProductImage(
+            product=self.product, image_large=self.upload(Image.new('RGB', (600, 912))))
+        product_image.save()
+
+        product_image = ProductImage.objects.get(pk=product_image.pk)
+        with mock.patch.object(ProductImage, 'make_thumbnails') as make_thumbnails:
+            product_image.sort = 1
+            product_image.save()
+        make_thumbnails.assert_not_called()
+
+
+INGEST_SCRIPT = """
+import resource, sys, threading
+import django
+from django.conf import settings
+
+settings.DATABASES['default']['NAME'] = sys.argv[1]
+settings.MEDIA_ROOT = sys.argv[2]
+django.setup()
+
+from django.core.files import File
+from django.core.management import call_command
+from django.db import connection
+from catalog.models import Category, Product, ProductImage
+
+call_command('migrate', verbosity=0)
+category = Category.objects.create(name='Test category name', slug='test-category')
+product = Product.objects.create(category=category, name='Test product name', slug='test-product')
+
+def ingest():
+    try:
+        with open(sys.argv[3], 'rb') as f:
+            ProductImage(product=product, image_large=File(f)).save()
+    finally:
+        connection.close()
+
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+threads = [threading.Thread(target=ingest) for _ in range(int(sys.argv[4]))]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(ProductImage.objects.count(), (after - before) // 1024)
+"""
+
+
+class ProductImageMemoryTest(SimpleTestCase):
+    UPLOADS = 4
+    # Decoding one 24 megapixel original at full size takes 72 MB.
+    MAX_RSS_GROWTH_MB = 100
+
+    def test_concurrent_uploads_memory(self):
+        if sys.platform != 'linux':
+            self.skipTest('ru_maxrss is measured in KiB on Linux only.')
+
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        image_file = os.path.join(location, 'image.jpg')
+        Image.new('RGB', (6000, 4000), (200, 100, 50)).save(image_file)
+
+        result = subprocess.run(
+            [sys.executable, '-c', INGEST_SCRIPT, os.path.join(location, 'db.sqlite3'),
+             os.path.join(location, 'media'), image_file, str(self.UPLOADS)],
+            cwd=os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'shop.settings'},
+            capture_output=True, text=True, check=True)
+
+        count, growth = map(int, result.stdout.split())
+        self.assertEqual(count, self.UPLOADS)
+        self.assertLess(growth, self.MAX_RSS_GROWTH_MB, f'RSS grew by {growth} MB')
+
+
 class ProductItemModelTest(TestCase):
 
     @classmethod
@@ -421,6 +647,11 @@ class ProductItemModelTest(TestCase):
         default = product_item._meta.get_field('quantity').default
         self.assertEqual(default, 0)
 
+    def test_product_quantity_index(self):
+        product_item = ProductItem.objects.get(id=1)
+        indexes = [index.fields for index in product_item._meta.indexes]
+        self.assertIn(['product', 'quantity'], indexes)
+
     def test_object_name_is_product_name_colon_size_colon_quantity(self):
         product_item = ProductItem.objects.get(id=1)
         expected_object_name = f'{product_item.product.name} : {product_item.size} : {product_item.quantity}'
@@ -0,0 +1,276 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import timedelta
+
+from django.db import connection
+from django.test import override_settings
+from django.test import TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from catalog import stock
+from catalog.models import Category, Order, OrderLine, Product, ProductItem
+
+
+class StockTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(
+            name='Test category name', slug='test-category-slug')
+        cls.product = Product.objects.create(
+            category=cls.category, name='Test product name', slug='test-product-slug')
+        cls.item_48 = ProductItem.objects.create(
+            product=cls.product, size=48, quantity=2)
+        cls.item_50 = ProductItem.objects.create(
+            product=cls.product, size=50, quantity=1)
+
+    def assertQuantity(self, item, quantity):
+        item.refresh_from_db()
+        self.assertEqual(item.quantity, quantity)
+
+    def test_reserve(self):
+        order = stock.reserve(
+            [(self.product.id, 48, 1), (self.product.id, 50, 1), (self.product.id, 48, 1)])
+
+        self.assertEqual(order.status, Order.STATUS_RESERVED)
+        self.assertQuantity(self.item_48, 0)
+        self.assertQuantity(self.item_50, 0)
+        self.assertEqual(
+            sorted(OrderLine.objects.filter(order=order).values_list('product_item_id', 'quantity')),
+            [(self.item_48.id, 2), (self.item_50.id, 1)])
+
+    def test_reserve_updates_category_counters(self):
+        stock.reserve([(self.product.id, 48, 2), (self.product.id, 50, 1)])
+
+        self.category.refresh_from_db()
+        self.assertEqual(self.category.in_stock_count, 0)
+
+    def test_reserve_is_all_or_nothing(self):
+        with self.assertRaises(stock.OutOfStock) as cm:
+            stock.reserve([(self.product.id, 48, 1), (self.product.id, 50, 2)])
+
+        self.assertEqual(cm.exception.unavailable, [(self.product.id, 50)])
+        self.assertQuantity(self.item_48, 2)
+        self.assertQuantity(self.item_50, 1)
+        self.assertFalse(Order.objects.exists())
+
+    def test_reserve_unknown_size(self):
+        with self.assertRaises(stock.OutOfStock) as cm:
+            stock.reserve([(self.product.id, 60, 1)])
+        self.assertEqual(cm.exception.unavailable, [(self.product.id, 60)])
+
+    def test_release(self):
+        order = stock.reserve([(self.product.id, 48, 2)])
+
+        self.assertTrue(stock.release(order))
+        self.assertQuantity(self.item_48, 2)
+        self.assertFalse(stock.release(order))
+        self.assertQuantity(self.item_48, 2)
+
+    def test_confirm(self):
+        order = stock.reserve([(self.product.id, 48, 2)])
+
+        stock.confirm(order)
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.STATUS_CONFIRMED)
+        self.assertFalse(stock.release(order))
+        self.assertQuantity(self.item_48, 0)
+
+    def test_expired_reservations_are_released(self):
+        order = stock.reserve([(self.product.id, 50, 1)])
+        Order.objects.filter(pk=order.pk).update(
+            reserved_until=timezone.now() - timedelta(seconds=1))
+
+        with self.assertRaises(stock.ReservationExpired):
+            stock.confirm(order)
+
+        stock.reserve([(self.product.id, 50, 1)])
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.STATUS_RELEASED)
+        self.assertQuantity(self.item_50, 0)
+
+    def test_api_create_order(self):
+        # A plain list starts no session.
+        resp = self.client.get(reverse('order-list'))
+        self.assertEqual(resp.data, [])
+        self.assertNotIn('sessionid', resp.cookies)
+
+        resp = self.client.post(reverse('order-list'), {'order_lines': [
+            {'product': self.product.id, 'size': 48, 'quantity': 1}
+        ]}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(resp.data['status'], Order.STATUS_RESERVED)
+        self.assertEqual(resp.data['order_lines'], [
+            {'product': self.product.id, 'product_name': 'Test product name',
+             'size': 48, 'price': 0, 'quantity': 1}])
+
+        resp = self.client.get(reverse('order-detail', args=[resp.data['token']]))
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+        resp = self.client.get(reverse('order-list'))
+        self.assertEqual(len(resp.data), 1)
+
+    def test_api_create_order_starts_session(self):
+        resp = self.client.post(reverse('order-list'), {'order_lines': [
+            {'product': self.product.id, 'size': 48, 'quantity': 1}
+        ]}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertIn('sessionid', resp.cookies)
+        order = Order.objects.get()
+        self.assertTrue(order.client.startswith('session:'))
+        self.assertEqual(order.address, '127.0.0.1')
+
+    @override_settings(ORDER_MAX_RESERVED_UNITS=2)
+    def test_api_reserved_units_are_limited_per_client(self):
+        resp = self.client.post(reverse('order-list'), {'order_lines': [
+            {'product': self.product.id, 'size': 48, 'quantity': 2}
+        ]}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+
+        resp = self.client.post(reverse('order-list'), {'order_lines': [
+            {'product': self.product.id, 'size': 50, 'quantity': 1}
+        ]}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_409_CONFLICT)
+        self.assertQuantity(self.item_50, 1)
+
+        # Another session has a limit of its own.
+        self.client.cookies.clear()
+        resp = self.client.post(reverse('order-list'), {'order_lines': [
+            {'product': self.product.id, 'size': 50, 'quantity': 1}
+        ]}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+
+    @override_settings(ORDER_MAX_RESERVED_UNITS=2, ORDER_MAX_RESERVED_UNITS_PER_IP=2)
+    def test_api_reserved_units_are_limited_per_address(self):
+        resp = self.client.post(reverse('order-list'), {'order_lines': [
+            {'product': self.product.id, 'size': 48, 'quantity': 2}
+        ]}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+
+        # New sessions of the same address share its limit.
+        self.client.cookies.clear()
+        resp = self.client.post(reverse('order-list'), {'order_lines': [
+            {'product': self.product.id, 'size': 50, 'quantity': 1}
+        ]}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_409_CONFLICT)
+        self.assertQuantity(self.item_50, 1)
+
+        resp = self.client.post(reverse('order-list'), {'order_lines': [
+            {'product': self.product.id, 'size': 50, 'quantity': 1}
+        ]}, format='json', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+
+    def test_lines_outlive_deleted_products(self):
+        order = stock.reserve([(self.product.id, 48, 1)])
+        self.product.delete()
+
+        line = OrderLine.objects.get(order=order)
+        self.assertIsNone(line.product_item)
+        self.assertEqual((line.product_name, line.size, line.quantity), ('Test product name', 48, 1))
+        self.assertTrue(stock.release(order))
+
+    def test_api_out_of_stock(self):
+        resp = self.client.post(reverse('order-list'), {'order_lines': [
+            {'product': self.product.id, 'size': 50, 'quantity': 2}
+        ]}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(resp.data['unavailable'], [
+                         {'product': self.product.id, 'size': 50}])
+
+    def test_api_invalid_order(self):
+        resp = self.client.post(
+            reverse('order-list'), {'order_lines': []}, format='json')
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_api_confirm_and_release(self):
+        order = stock.reserve([(self.product.id, 48, 1)])
+
+        resp = self.client.post(reverse('order-confirm', args=[order.token]))
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+        resp = self.client.delete(reverse('order-detail', args=[order.token]))
+        self.assertEqual(resp.status_code, status.HTTP_409_CONFLICT)
+
+    def test_api_release(self):
+        order = stock.reserve([(self.product.id, 48, 1)])
+
+        resp = self.client.delete(reverse('order-detail', args=[order.token]))
+        self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertQuantity(self.item_48, 2)
+
+
+class ConcurrentReservationTest(TransactionTestCase):
+    BUYERS = 40
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Connections to an in-memory database fail on its table locks
+        # instead of waiting, the test runs on a copy in a temporary file.
+        cls.database_dir = None
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            cls.database_dir = tempfile.mkdtemp()
+            path = os.path.join(cls.database_dir, 'db.sqlite3')
+            connection.ensure_connection()
+            target = sqlite3.connect(path)
+            connection.connection.backup(target)
+            target.close()
+
+            cls.memory_connection, connection.connection = connection.connection, None
+            cls.memory_name = connection.settings_dict['NAME']
+            connection.settings_dict['NAME'] = path
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.database_dir is not None:
+            connection.close()
+            connection.settings_dict['NAME'] = cls.memory_name
+            connection.connection = cls.memory_connection
+            shutil.rmtree(cls.database_dir)
+        super().tearDownClass()
+
+    def setUp(self):
+        category = Category.objects.create(
+            name='Test category name', slug='test-category-slug')
+        self.product = Product.objects.create(
+            category=category, name='Test product name', slug='test-product-slug')
+        self.item = ProductItem.objects.create(
+            product=self.product, size=48, quantity=5)
+
+    def test_no_overselling(self):
+        results = []
+        barrier = threading.Barrier(self.BUYERS)
+
+        def buy():
+            barrier.wait()
+            try:
+                stock.reserve([(self.product.id, 48, 1)])
+                results.append(True)
+            except stock.OutOfStock:
+                results.append(False)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=buy) for _ in range(self.BUYERS)]
+        start = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        throughput = self.BUYERS / (time.monotonic() - start)
+
+        self.assertEqual(len(results), self.BUYERS)
+        self.assertEqual(results.count(True), 5)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.quantity, 0)
+        self.assertEqual(
+            sum(OrderLine.objects.values_list('quantity', flat=True)), 5)
+        self.assertGreater(
+            throughput, 5, f'{throughput:.1f} reservation attempts per second')
@@ -0,0 +1,95 @@
+import os
+import pstats
+import shutil
+import tempfile
+
+from django.core import signing
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from catalog.models import Category
+from catalog.profiling import check_token, make_token
+
+
+class TokenTest(APITestCase):
+    def test_valid_token(self):
+        self.assertTrue(check_token(make_token()))
+
+    def test_token_is_single_use(self):
+        token = make_token()
+        self.assertTrue(check_token(token))
+        self.assertFalse(check_token(token))
+
+    def test_tampered_token(self):
+        self.assertFalse(check_token(make_token() + 'x'))
+
+    def test_foreign_signature(self):
+        self.assertFalse(check_token(signing.TimestampSigner().sign('value')))
+
+    @override_settings(PROFILING_TOKEN_MAX_AGE=-1)
+    def test_expired_token(self):
+        self.assertFalse(check_token(make_token()))
+
+
+class ProfilingMiddlewareTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Category.objects.create(name='Test category name', slug='test-slug')
+
+    def setUp(self):
+        self.profiling_root = tempfile.mkdtemp()
+        override = override_settings(PROFILING_ROOT=self.profiling_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(shutil.rmtree, self.profiling_root)
+
+    def test_request_without_token_is_not_profiled(self):
+        resp = self.client.get('/api/v1/categories/')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertNotIn('X-Profile-Stats', resp)
+        self.assertEqual(os.listdir(self.profiling_root), [])
+
+    def test_request_with_invalid_token_is_not_profiled(self):
+        resp = self.client.get(
+            '/api/v1/categories/', HTTP_X_PROFILE_TOKEN='invalid')
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertNotIn('X-Profile-Stats', resp)
+
+    def test_profile_by_header(self):
+        resp = self.client.get(
+            '/api/v1/categories/', HTTP_X_PROFILE_TOKEN=make_token())
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+        stats_path = os.path.join(self.profiling_root, resp['X-Profile-Stats'])
+        stats = pstats.Stats(stats_path)
+        self.assertTrue(stats.total_calls > 0)
+
+        flamegraph_path = os.path.join(
+            self.profiling_root, resp['X-Profile-Flamegraph'])
+        with open(flamegraph_path) as f:
+            for line in f:
+                stack, count = line.rsplit(' ', 1)
+                self.assertTrue(stack)
+                self.assertTrue(int(count) > 0)
+
+    def test_profile_by_query_parameter(self):
+        resp = self.client.get(
+            '/api/v1/categories/test-slug/products/', {'profile': make_token()})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertIn('X-Profile-Stats', resp)
+
+    def test_token_profiles_a_single_request(self):
+        token = make_token()
+        resp = self.client.get('/api/v1/categories/', HTTP_X_PROFILE_TOKEN=token)
+        self.assertIn('X-Profile-Stats', resp)
+        resp = self.client.get('/api/v1/categories/', HTTP_X_PROFILE_TOKEN=token)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertNotIn('X-Profile-Stats', resp)
+        self.assertEqual(len(os.listdir(self.profiling_root)), 2)
+
+    def test_non_catalog_view_is_not_profiled(self):
+        resp = self.client.get(
+            '/admin/login/', HTTP_X_PROFILE_TOKEN=make_token())
+        self.assertNotIn('X-Profile-Stats', resp)
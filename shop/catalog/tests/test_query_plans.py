@@ -0,0 +1,115 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from catalog.cache import bump_version
+from catalog.models import Category, Product, ProductImage, ProductItem
+from catalog.views import ProductList
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[-1] for row in cursor.fetchall()]
+
+
+class QueryPlanTestCase(TestCase):
+    def setUp(self):
+        # Bulk-created test data does not send signals, start with a cold cache.
+        bump_version()
+
+    def capture_plans(self, url, table):
+        """Return the plans of the queries against the table run by a request."""
+        with CaptureQueriesContext(connection) as context:
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+
+        return [explain(query['sql']) for query in context.captured_queries
+                if query['sql'].startswith('SELECT') and f'FROM "{table}"' in query['sql']]
+
+    def assertUsesIndex(self, plan):
+        self.assertFalse(
+            [step for step in plan if 'TEMP B-TREE' in step], plan)
+        self.assertFalse(
+            [step for step in plan if step.startswith('SCAN') and 'INDEX' not in step], plan)
+
+
+class ProductListQueryPlanTest(QueryPlanTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for category_num in range(1, 4):
+            category = Category.objects.create(
+                name=f'Test category name {category_num}', slug=f'test-category-slug-{category_num}')
+
+            Product.objects.bulk_create([
+                Product(category=category, name=f'Test product name {category_num}-{product_num}',
+                        slug=f'test-product-slug-{category_num}-{product_num}',
+                        price=product_num * 10, effective_price=product_num * 9, discount=product_num % 50)
+                for product_num in range(500)
+            ])
+            ProductItem.objects.bulk_create([
+                ProductItem(product=product, size=size, quantity=product.pk % 3)
+                for product in Product.objects.filter(category=category)
+                for size in (48, 50)
+            ])
+            ProductImage.objects.bulk_create([
+                ProductImage(product=product, sort=sort)
+                for product in Product.objects.filter(category=category)
+                for sort in (2, 1)
+            ])
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def test_every_sort_uses_index(self):
+        for sort in ProductList.sort_options:
+            with self.subTest(sort=sort):
+                url = reverse('product-list',
+                              args=['test-category-slug-2']) + f'?sort={sort}&page=3'
+                plans = self.capture_plans(url, 'catalog_product')
+                self.assertTrue(plans)
+                for plan in plans:
+                    self.assertUsesIndex(plan)
+
+    def test_stock_filter_uses_covering_index(self):
+        url = reverse('product-list', args=['test-category-slug-2'])
+        for plan in self.capture_plans(url, 'catalog_product'):
+            self.assertTrue([step for step in plan if 'COVERING INDEX' in step
+                             and '(product_id=? AND quantity>?)' in step], plan)
+
+    def test_product_images_are_not_joined(self):
+        url = reverse('product-list', args=['test-category-slug-2'])
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+
+        queries = [query['sql'] for query in context.captured_queries
+                   if 'FROM "catalog_productimage"' in query['sql']]
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('JOIN', queries[0])
+        self.assertUsesIndex(explain(queries[0]))
+
+    def test_product_detail_uses_indexes(self):
+        url = reverse('product-detail',
+                      args=['test-category-slug-2', 'test-product-slug-2-10'])
+        for table in ['catalog_product', 'catalog_productimage', 'catalog_productitem']:
+            with self.subTest(table=table):
+                for plan in self.capture_plans(url, table):
+                    self.assertUsesIndex(plan)
+
+
+class CategoryListQueryPlanTest(QueryPlanTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Category.objects.bulk_create([
+            Category(name=f'Test category name {category_num}',
+                     slug=f'test-category-slug-{category_num}', sort=category_num % 7)
+            for category_num in range(100)
+        ])
+
+    def test_category_list_uses_sort_index(self):
+        plans = self.capture_plans(reverse('category-list'), 'catalog_category')
+        self.assertEqual(len(plans), 1)
+        self.assertUsesIndex(plans[0])
@@ -0,0 +1,129 @@
+import time
+
+from django.db import OperationalError, connection
+from django.test import RequestFactory, override_settings
+from django.urls import resolve, reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from catalog.models import Category, Product, ProductItem
+from catalog.querybudget import QueryBudget, QueryBudgetExceeded, QueryBudgetMiddleware, get_budget
+
+RUNAWAY_QUERY = '''
+    WITH RECURSIVE numbers(num) AS (
+        SELECT 1 UNION ALL SELECT num + 1 FROM numbers WHERE num < 1000000000
+    ) SELECT count(*) FROM numbers
+'''
+# Its first row is ready at once, the rest is a runaway scan.
+RUNAWAY_FETCH = '''
+    WITH RECURSIVE numbers(num) AS (
+        SELECT 1 UNION ALL SELECT num + 1 FROM numbers WHERE num < 1000000000
+    ) SELECT num FROM numbers WHERE num IN (1, 1000000000)
+'''
+
+
+class QueryBudgetTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(
+            name='Test category name', slug='test-category-slug')
+        cls.product = Product.objects.create(
+            category=category, name='Test product name', slug='test-product-slug')
+        ProductItem.objects.create(product=cls.product, size=48, quantity=1)
+
+    def budget(self, path):
+        request = RequestFactory().get(path)
+        request.resolver_match = resolve(path)
+        budget = QueryBudget(request)
+        self.addCleanup(budget.close)
+        return budget
+
+    @override_settings(DB_TIME_BUDGET=5, DB_TIME_BUDGETS={'product-list': 2})
+    def test_get_budget(self):
+        self.assertEqual(get_budget(resolve(reverse('category-list'))), 5)
+        self.assertEqual(get_budget(resolve(reverse('product-list', args=['test-category-slug']))), 2)
+        self.assertIsNone(get_budget(resolve('/admin/')))
+
+    @override_settings(DB_TIME_BUDGETS={'availability': 0})
+    def test_exceeded(self):
+        with self.assertLogs('catalog.querybudget', 'WARNING') as logs:
+            resp = self.client.get(reverse('availability'), {'ids': self.product.id})
+        self.assertEqual(resp.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(resp.data['detail'].code, 'query_budget_exceeded')
+        self.assertIn('availability', logs.output[0])
+
+    @override_settings(DB_TIME_BUDGETS={'availability': 0.2})
+    def test_runaway_query_is_interrupted(self):
+        start = time.monotonic()
+        with connection.execute_wrapper(self.budget(reverse('availability'))), \
+                self.assertRaises(QueryBudgetExceeded), self.assertLogs('catalog.querybudget', 'WARNING'):
+            with connection.cursor() as cursor:
+                cursor.execute(RUNAWAY_QUERY)
+        self.assertLess(time.monotonic() - start, 2)
+
+        # The connection is usable afterwards.
+        self.assertEqual(Product.objects.count(), 1)
+
+    @override_settings(DB_TIME_BUDGETS={'availability': 0.2})
+    def test_runaway_fetch_is_interrupted(self):
+        budget = self.budget(reverse('availability'))
+        start = time.monotonic()
+        with connection.execute_wrapper(budget):
+            with connection.cursor() as cursor:
+                cursor.execute(RUNAWAY_FETCH)
+                self.assertLess(budget.spent, 0.2)
+                # Rows are fetched outside of the execute wrapper.
+                with self.assertRaises(OperationalError):
+                    cursor.fetchall()
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertTrue(budget.is_exceeded())
+        self.assertGreater(budget.spent, 0.2)
+
+        budget.close()
+        self.assertEqual(Product.objects.count(), 1)
+
+    @override_settings(DB_TIME_BUDGETS={'availability': 0.2})
+    def test_interrupted_fetch_fails_with_503(self):
+        request = RequestFactory().get(reverse('availability'))
+        request.resolver_match = resolve(reverse('availability'))
+        request._query_budget = QueryBudget(request)
+        request._query_budget.spent = 0.3
+
+        middleware = QueryBudgetMiddleware(lambda request: None)
+        with self.assertLogs('catalog.querybudget', 'WARNING'):
+            resp = middleware.process_exception(request, OperationalError('interrupted'))
+        self.assertEqual(resp.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        request._query_budget.spent = 0
+        self.assertIsNone(middleware.process_exception(request, OperationalError('locked')))
+
+    @override_settings(DB_TIME_BUDGETS={'yml-feed': 0})
+    def test_streamed_body_is_budgeted(self):
+        resp = self.client.get(reverse('yml-feed'))
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        with self.assertRaises(QueryBudgetExceeded), self.assertLogs('catalog.querybudget', 'WARNING'):
+            b''.join(resp.streaming_content)
+
+    @override_settings(DB_TIME_BUDGETS={'availability': 0.2})
+    def test_budget_is_per_request(self):
+        budget = self.budget(reverse('availability'))
+        with connection.execute_wrapper(budget):
+            list(Product.objects.all())
+        self.assertGreater(budget.spent, 0)
+        budget.spent = 0.2
+        with connection.execute_wrapper(budget), self.assertRaises(QueryBudgetExceeded), \
+                self.assertLogs('catalog.querybudget', 'WARNING'):
+            list(Product.objects.all())
+
+    @override_settings(SLOW_QUERY_THRESHOLD=0)
+    def test_slow_queries_are_logged_with_plan(self):
+        with self.assertLogs('catalog.querybudget', 'WARNING') as logs:
+            resp = self.client.get(reverse('availability'), {'ids': self.product.id})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+        message = next(line for line in logs.output if 'catalog_productitem' in line)
+        self.assertIn('in availability:', message)
+        self.assertIn(f'params: ({self.product.id},)', message)
+        self.assertIn('plan:\n', message)
+        self.assertRegex(message.split('plan:\n')[1], r'(SEARCH|SCAN).*catalog_productitem')
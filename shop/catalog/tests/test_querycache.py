@@ -0,0 +1,131 @@
+from unittest import mock
+
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+
+from catalog.models import Category, Product, ProductItem
+
+
+class CachingQuerySetTest(TransactionTestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(
+            name='Test category name', slug='test-category-slug')
+        self.product = Product.objects.create(
+            category=self.category, name='Test product name', slug='test-product-slug')
+        self.item = ProductItem.objects.create(product=self.product, size=48, quantity=1)
+
+    def assertCached(self, queryset, expected):
+        with self.assertNumQueries(1):
+            self.assertEqual(list(queryset.cached()), expected)
+        with self.assertNumQueries(0):
+            self.assertEqual(list(queryset.cached()), expected)
+
+    def test_cached(self):
+        self.assertCached(Category.objects.values_list('slug', flat=True), ['test-category-slug'])
+        with self.assertNumQueries(1):
+            self.assertEqual(Category.objects.cached().get(slug='test-category-slug'), self.category)
+            self.assertEqual(Category.objects.cached().get(slug='test-category-slug'), self.category)
+        # Other shapes of the same query are cached separately.
+        self.assertCached(Category.objects.values('slug'), [{'slug': 'test-category-slug'}])
+        # Querysets are cached only when asked to.
+        with self.assertNumQueries(2):
+            list(Category.objects.all())
+            list(Category.objects.all())
+
+    def test_save(self):
+        self.assertCached(Category.objects.values_list('name', flat=True), ['Test category name'])
+        self.category.name = 'Renamed category'
+        self.category.save()
+        self.assertCached(Category.objects.values_list('name', flat=True), ['Renamed category'])
+
+    def test_update(self):
+        queryset = ProductItem.objects.values_list('quantity', flat=True)
+        self.assertCached(queryset, [1])
+        ProductItem.objects.filter(pk=self.item.pk).update(quantity=5)
+        self.assertCached(queryset, [5])
+
+        self.item.quantity = 7
+        ProductItem.objects.bulk_update([self.item], ['quantity'])
+        self.assertCached(queryset, [7])
+
+        ProductItem.objects.bulk_create([ProductItem(product=self.product, size=50)])
+        self.assertCached(queryset.order_by('size'), [7, 0])
+
+    def test_joined_tables(self):
+        in_stock = Product.objects.filter(product_items__quantity__gt=0).values_list('slug', flat=True)
+        self.assertCached(in_stock, ['test-product-slug'])
+        ProductItem.objects.update(quantity=0)
+        self.assertCached(in_stock, [])
+
+    def test_delete_cascades(self):
+        items = ProductItem.objects.values_list('pk', flat=True)
+        self.assertCached(items, [self.item.pk])
+        Category.objects.all().delete()
+        self.assertCached(items, [])
+
+    def test_raw_sql(self):
+        queryset = Category.objects.values_list('sort', flat=True)
+        self.assertCached(queryset, [0])
+        with connection.cursor() as cursor:
+            cursor.execute('UPDATE catalog_category SET sort = 3')
+        self.assertCached(queryset, [3])
+
+    def test_other_tables_stay_cached(self):
+        queryset = Category.objects.values_list('slug', flat=True)
+        self.assertCached(queryset, ['test-category-slug'])
+        ProductItem.objects.update(quantity=0)
+        with self.assertNumQueries(0):
+            list(queryset.cached())
+
+    def test_tables_not_opted_in(self):
+        ordered = Product.objects.filter(product_items__order_lines__isnull=False)
+        with self.assertNumQueries(2):
+            list(ordered.cached())
+            list(ordered.cached())
+
+    @override_settings(QUERY_CACHE_MAX_ROWS=1)
+    def test_large_results(self):
+        Category.objects.create(name='Other category name', slug='other-category-slug')
+        with self.assertNumQueries(2):
+            list(Category.objects.cached())
+            list(Category.objects.cached())
+
+    def test_transaction(self):
+        queryset = Category.objects.values_list('name', flat=True)
+        self.assertCached(queryset, ['Test category name'])
+
+        with transaction.atomic():
+            with self.assertNumQueries(0):
+                list(queryset.cached())
+            Category.objects.update(name='Renamed category')
+            # The transaction reads its own writes, which are not cached.
+            with self.assertNumQueries(2):
+                self.assertEqual(list(queryset.cached()), ['Renamed category'])
+                self.assertEqual(list(queryset.cached()), ['Renamed category'])
+            # Tables the transaction has not written are still cached.
+            self.assertCached(Product.objects.values_list('slug', flat=True), ['test-product-slug'])
+
+        self.assertCached(queryset, ['Renamed category'])
+
+    def test_bumped_on_commit(self):
+        # Other processes may cache the old rows until the transaction commits.
+        with mock.patch('catalog.querycache.bump_version') as bump_version:
+            with transaction.atomic():
+                Category.objects.update(name='Renamed category')
+                bump_version.assert_called_once_with({'catalog_category'})
+            self.assertEqual(bump_version.call_count, 2)
+            bump_version.assert_called_with({'catalog_category'})
+
+
+class CachingQuerySetInTestCaseTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Category.objects.create(name='Test category name', slug='test-category-slug')
+
+    def test_written_tables_are_read_from_the_database(self):
+        # The whole test runs in the transaction which created the category.
+        with self.assertNumQueries(2):
+            list(Category.objects.cached())
+            list(Category.objects.cached())
@@ -17,7 +17,9 @@ class CategorySerializerTestCase(SimpleTestCase):
             'id',
             'name',
             'description',
-            'slug'
+            'slug',
+            'products_count',
+            'in_stock_count'
         ])
 
 
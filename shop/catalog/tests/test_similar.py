@@ -0,0 +1,123 @@
+import sys
+import time
+from random import Random
+import unittest
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from catalog.models import Category, Product, ProductImage, ProductItem, SimilarProduct
+
+try:
+    import numpy  # noqa: F401
+    import scipy  # noqa: F401
+except ImportError:
+    numpy = None
+
+
+@unittest.skipIf(numpy is None, 'numpy and scipy are not installed')
+class BuildSimilarCommandTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.dresses = Category.objects.create(name='Dresses', slug='dresses')
+        cls.suits = Category.objects.create(name='Suits', slug='suits')
+        texts = {
+            'red': (cls.dresses, 'Red silk evening dress with lace'),
+            'red-long': (cls.dresses, 'Long red silk evening dress'),
+            'blue': (cls.dresses, 'Blue cotton summer dress'),
+            'suit': (cls.suits, 'Silk evening suit with red lace'),
+            'sold-out': (cls.dresses, 'Red silk evening dress with lace'),
+        }
+        cls.products = {}
+        for slug, (category, text) in texts.items():
+            product = Product.objects.create(
+                category=category, name=slug, slug=slug, description=text, detail='')
+            ProductItem.objects.create(
+                product=product, size=48, quantity=0 if slug == 'sold-out' else 1)
+            cls.products[slug] = product
+
+    def build(self, *args):
+        out = StringIO()
+        call_command('build_similar', *args, stdout=out)
+        return out.getvalue()
+
+    def similar(self, slug, same_category):
+        return list(SimilarProduct.objects.filter(
+            product=self.products[slug], same_category=same_category
+        ).values_list('similar__slug', flat=True))
+
+    def test_build(self):
+        self.assertIn('for 5 products', self.build())
+
+        self.assertEqual(self.similar('red', True), ['red-long', 'blue'])
+        self.assertEqual(self.similar('red', False), ['suit'])
+        # Products out of stock are not recommended but get recommendations.
+        self.assertEqual(self.similar('sold-out', True), ['red', 'red-long', 'blue'])
+        self.assertNotIn('sold-out', self.similar('red-long', True))
+
+    def test_top_k(self):
+        self.build('--top-k=1', '--chunk-size=2')
+        self.assertEqual(self.similar('red', True), ['red-long'])
+        # The only suit has no other product in its category.
+        self.assertEqual(SimilarProduct.objects.filter(same_category=True).count(), 4)
+
+    def test_common_terms_are_ignored(self):
+        # Terms of more than 70% of the products: red, silk, evening, dress.
+        self.build('--max-df=0.7')
+        self.assertEqual(self.similar('red', True), [])
+        self.assertEqual(self.similar('red', False), ['suit'])
+
+    def test_rebuild_reports_changes(self):
+        self.build()
+        self.assertIn('0 changed', self.build())
+
+    def test_product_detail(self):
+        self.build()
+        image = ProductImage.objects.create(product=self.products['red-long'], sort=1)
+        ProductImage.objects.filter(pk=image.pk).update(image_small='product_images/small.jpg')
+        ProductItem.objects.filter(product=self.products['blue']).update(quantity=0)
+        url = reverse('product-detail', args=['dresses', 'red'])
+
+        with CaptureQueriesContext(connection) as queries:
+            resp = self.client.get(url)
+        self.assertEqual(
+            len([q for q in queries if 'catalog_similarproduct' in q['sql']]), 1)
+
+        similar = resp.data['similar_products']
+        self.assertEqual([(p['slug'], p['same_category']) for p in similar],
+                         [('red-long', True), ('suit', False)])
+        self.assertEqual(similar[0]['category_slug'], 'dresses')
+        self.assertEqual(similar[0]['image_small'], 'http://testserver/media/product_images/small.jpg')
+        self.assertIsNone(similar[1]['image_small'])
+
+    def test_many_products(self):
+        count = 20000
+        words = [f'word{num}' for num in range(5000)]
+        random = Random(1)
+        Product.objects.bulk_create([
+            Product(category=(self.dresses, self.suits)[num % 2], name=f'product {num}', slug=f'product-{num}',
+                    # Words of every product, which are left out.
+                    description=' '.join(['with', 'and', *random.sample(words, 30)]), detail='')
+            for num in range(count)], batch_size=1000)
+        ProductItem.objects.bulk_create([
+            ProductItem(product_id=pk, quantity=1)
+            for pk in Product.objects.values_list('pk', flat=True)], batch_size=1000)
+
+        start = time.monotonic()
+        self.build()
+        self.assertLess(time.monotonic() - start, 15)
+        self.assertGreater(SimilarProduct.objects.count(), count * 6 * 2)
+
+
+class BuildSimilarWithoutNumpyTest(APITestCase):
+    def test_missing_dependencies(self):
+        with mock.patch.dict(sys.modules, {'numpy': None}), \
+                self.assertRaisesMessage(CommandError, 'numpy and scipy'):
+            call_command('build_similar', stdout=StringIO())
@@ -0,0 +1,107 @@
+from xml.etree import ElementTree
+
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from catalog import sitemaps, stock
+from catalog.models import Category, Product, ProductItem
+
+NS = {'sm': 'http://www.sitemaps.org/schemas/sitemap/0.9'}
+
+
+@override_settings(SHOP_URL='https://shop.example', SITEMAP_CHUNK_SIZE=4)
+class SitemapTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(
+            name='Test category name', slug='test-category-slug')
+        Category.objects.create(name='Empty category name', slug='empty-category-slug')
+
+        cls.products = []
+        for num in range(1, 11):
+            product = Product.objects.create(
+                category=cls.category, name=f'Test product name {num}', slug=f'test-product-slug-{num}')
+            ProductItem.objects.create(product=product, size=48, quantity=0 if num == 2 else 1)
+            cls.products.append(product)
+
+    def setUp(self):
+        # Cached sitemaps of other tests may have other chunk sizes.
+        sitemaps.bump_version()
+
+    def locations(self, url):
+        resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp['Content-Type'], 'application/xml; charset=utf-8')
+        return [loc.text for loc in ElementTree.fromstring(resp.content).iterfind('.//sm:loc', NS)]
+
+    def chunk_url(self, product):
+        return reverse('sitemap-products', args=[sitemaps.chunk_of(product.pk)])
+
+    def product_locations(self):
+        chunks = sorted({sitemaps.chunk_of(product.pk) for product in self.products})
+        return [location for chunk in chunks
+                for location in self.locations(reverse('sitemap-products', args=[chunk]))]
+
+    def test_index(self):
+        chunks = sorted({sitemaps.chunk_of(product.pk) for product in self.products})
+        self.assertEqual(reverse('sitemap-index'), '/sitemap.xml')
+        # Sitemaps are served by the storefront host they list URLs of.
+        self.assertEqual(self.locations(reverse('sitemap-index')), [
+            'https://shop.example' + reverse('sitemap-categories'),
+            *('https://shop.example' + reverse('sitemap-products', args=[chunk]) for chunk in chunks)])
+
+    def test_unlisted_chunks_are_not_found(self):
+        last_chunk = sitemaps.chunk_of(self.products[-1].pk)
+        resp = self.client.get(reverse('sitemap-products', args=[last_chunk + 1]))
+        self.assertEqual(resp.status_code, 404)
+
+    def test_categories(self):
+        self.assertEqual(self.locations(reverse('sitemap-categories')), [
+            'https://shop.example/test-category-slug/', 'https://shop.example/empty-category-slug/'])
+
+    def test_products(self):
+        self.assertEqual(self.product_locations(), [
+            f'https://shop.example/test-category-slug/{product.slug}/'
+            for product in self.products if product.slug != 'test-product-slug-2'])
+
+    def test_cached_until_chunk_changes(self):
+        first, last = self.products[0], self.products[-1]
+        self.assertNotEqual(sitemaps.chunk_of(first.pk), sitemaps.chunk_of(last.pk))
+        self.locations(self.chunk_url(first))
+        self.locations(self.chunk_url(last))
+
+        last.slug = 'renamed-slug'
+        last.save()
+        # The list of chunks is read again, the sitemap of the chunk is not.
+        with self.assertNumQueries(1):
+            self.locations(self.chunk_url(first))
+        with self.assertNumQueries(1):
+            self.assertIn('https://shop.example/test-category-slug/renamed-slug/',
+                          self.locations(self.chunk_url(last)))
+
+    def test_stock_change(self):
+        self.locations(self.chunk_url(self.products[0]))
+        stock.reserve([(self.products[0].id, 48, 1)])
+        self.assertNotIn('https://shop.example/test-category-slug/test-product-slug-1/',
+                         self.locations(self.chunk_url(self.products[0])))
+
+    def test_category_change(self):
+        self.product_locations()
+        self.category.slug = 'renamed-category-slug'
+        self.category.save()
+        self.assertTrue(all(location.startswith('https://shop.example/renamed-category-slug/')
+                            for location in self.product_locations()))
+
+    def test_index_follows_stock(self):
+        last = self.products[-1]
+        chunk_url = 'https://shop.example' + self.chunk_url(last)
+        self.assertIn(chunk_url, self.locations(reverse('sitemap-index')))
+
+        # The last chunk has no product in stock left.
+        for product in self.products:
+            if sitemaps.chunk_of(product.pk) == sitemaps.chunk_of(last.pk):
+                ProductItem.objects.filter(product=product).update(quantity=0)
+                sitemaps.bump_version([product.pk])
+        self.assertNotIn(chunk_url, self.locations(reverse('sitemap-index')))
@@ -0,0 +1,87 @@
+from django.core.cache import cache
+from django.test import TestCase
+
+from catalog.models import Category, Product
+from catalog.slugs import SlugCache, VERSION_KEY, bump_version, category_slugs
+
+
+class SlugCacheTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(
+            name='Test category name', slug='test-category-slug')
+        cls.product = Product.objects.create(
+            category=cls.category, name='Test product name', slug='test-product-slug')
+
+    def setUp(self):
+        self.categories = SlugCache(Category.objects.all(), ['id'])
+        self.products = SlugCache(
+            Product.objects.all(), ['id', 'category_id'])
+
+    def test_resolve(self):
+        self.assertEqual(self.categories.resolve(
+            'test-category-slug'), self.category.id)
+        self.assertEqual(self.products.resolve('test-product-slug'),
+                         (self.product.id, self.category.id))
+
+    def test_resolve_is_cached(self):
+        self.categories.resolve('test-category-slug')
+        with self.assertNumQueries(0):
+            self.categories.resolve('test-category-slug')
+
+    def test_missing_slug_is_cached(self):
+        self.assertIsNone(self.categories.resolve('not-exist-slug'))
+        with self.assertNumQueries(0):
+            self.assertIsNone(self.categories.resolve('not-exist-slug'))
+
+    def test_missing_slug_expires(self):
+        categories = SlugCache(
+            Category.objects.all(), ['id'], negative_timeout=0)
+        categories.resolve('not-exist-slug')
+        with self.assertNumQueries(1):
+            categories.resolve('not-exist-slug')
+
+    def test_max_size(self):
+        categories = SlugCache(Category.objects.all(), ['id'], max_size=2)
+        for num in range(5):
+            categories.resolve(f'not-exist-slug-{num}')
+        self.assertLessEqual(len(categories._missing), 2)
+
+    def test_bump_version_invalidates(self):
+        self.categories.resolve('test-category-slug')
+        bump_version()
+        with self.assertNumQueries(1):
+            self.categories.resolve('test-category-slug')
+
+    def test_lost_version_invalidates(self):
+        self.categories.resolve('test-category-slug')
+        cache.delete(VERSION_KEY)
+        with self.assertNumQueries(1):
+            self.categories.resolve('test-category-slug')
+
+    def test_save_invalidates(self):
+        self.assertIsNone(category_slugs.resolve('new-category-slug'))
+        category = Category.objects.create(
+            name='New category name', slug='new-category-slug')
+        self.assertEqual(category_slugs.resolve(
+            'new-category-slug'), category.id)
+
+    def test_slug_change_invalidates(self):
+        category_slugs.resolve('test-category-slug')
+        self.category.slug = 'changed-category-slug'
+        self.category.save()
+        self.assertIsNone(category_slugs.resolve('test-category-slug'))
+
+    def test_slug_change_invalidates_on_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.category.slug = 'changed-category-slug'
+            self.category.save()
+        version = cache.get(VERSION_KEY)
+        category_slugs.resolve('changed-category-slug')
+
+        for callback in callbacks:
+            callback()
+        self.assertNotEqual(cache.get(VERSION_KEY), version)
+        with self.assertNumQueries(1):
+            category_slugs.resolve('changed-category-slug')
@@ -0,0 +1,139 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from catalog.models import Category, Product, ProductItem
+
+
+class ExportSnapshotCommandTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(
+            name='Test category name', slug='test-category-slug')
+
+        for product_num in range(1, 21):
+            product = Product.objects.create(
+                category=category, name=f'Test product name {product_num}', slug=f'test-product-slug-{product_num}')
+            ProductItem.objects.create(product=product, quantity=1)
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir)
+
+    def export(self, *args):
+        out = StringIO()
+        call_command('export_snapshot', self.output_dir,
+                     '--host', 'testserver', *args, stdout=out)
+        return out.getvalue()
+
+    def read(self, *parts):
+        with open(os.path.join(self.output_dir, 'api', 'v1', *parts)) as f:
+            return json.load(f)
+
+    def test_export_all(self):
+        self.assertIn('written 23,', self.export())
+
+        categories = self.read('categories', 'index.json')
+        self.assertEqual(categories[0]['slug'], 'test-category-slug')
+
+        first_page = self.read('categories', 'test-category-slug',
+                               'products', 'index.json')
+        self.assertEqual(len(first_page['category']['products']), 18)
+        self.assertEqual(first_page['category']['next_page_number'], 2)
+
+        second_page = self.read('categories', 'test-category-slug',
+                                'products', 'page-2.json')
+        self.assertEqual(len(second_page['category']['products']), 2)
+
+        product = self.read('categories', 'test-category-slug',
+                            'products', 'test-product-slug-1', 'index.json')
+        self.assertEqual(product['name'], 'Test product name 1')
+
+    def test_unchanged_files_are_not_rewritten(self):
+        self.export()
+        self.assertIn('written 0, unchanged 23, removed 0', self.export())
+
+    def test_export_changed_product(self):
+        self.export()
+
+        product = Product.objects.get(slug='test-product-slug-1')
+        product.name = 'Changed product name'
+        product.save()
+        out = self.export('--product', 'test-product-slug-1')
+        self.assertIn('written 2, unchanged 2, removed 0', out)
+
+        product = self.read('categories', 'test-category-slug',
+                            'products', 'test-product-slug-1', 'index.json')
+        self.assertEqual(product['name'], 'Changed product name')
+
+    def test_export_removes_pages_and_products(self):
+        self.export()
+
+        Product.objects.filter(slug='test-product-slug-20').delete()
+        product_item = ProductItem.objects.get(
+            product__slug='test-product-slug-19')
+        product_item.quantity = 0
+        product_item.save()
+        out = self.export('--product', 'test-product-slug-20',
+                          '--product', 'test-product-slug-19')
+        self.assertIn('removed 2', out)
+
+        products_dir = os.path.join(
+            self.output_dir, 'api', 'v1', 'categories', 'test-category-slug', 'products')
+        self.assertFalse(os.path.exists(
+            os.path.join(products_dir, 'page-2.json')))
+        self.assertFalse(os.path.exists(os.path.join(
+            products_dir, 'test-product-slug-20', 'index.json')))
+
+    def test_full_export_removes_deleted_objects(self):
+        self.export()
+
+        Product.objects.filter(slug='test-product-slug-20').delete()
+        self.assertIn('removed 1', self.export())
+
+    def test_export_deleted_product(self):
+        self.export()
+
+        Product.objects.filter(slug='test-product-slug-20').delete()
+        out = self.export('--product', 'test-product-slug-20')
+        self.assertIn('removed 1', out)
+
+        products_dir = os.path.join(
+            self.output_dir, 'api', 'v1', 'categories', 'test-category-slug', 'products')
+        self.assertFalse(os.path.exists(os.path.join(
+            products_dir, 'test-product-slug-20', 'index.json')))
+        second_page = self.read('categories', 'test-category-slug',
+                                'products', 'page-2.json')
+        slugs = [product['slug'] for product in second_page['category']['products']]
+        self.assertEqual(len(slugs), 1)
+        self.assertNotIn('test-product-slug-20', slugs)
+
+    def test_export_moved_product(self):
+        self.export()
+
+        Category.objects.create(name='Other category name', slug='other-category-slug')
+        product = Product.objects.get(slug='test-product-slug-20')
+        product.category = Category.objects.get(slug='other-category-slug')
+        product.save()
+        self.export('--product', 'test-product-slug-20')
+
+        products_dir = os.path.join(self.output_dir, 'api', 'v1', 'categories')
+        self.assertFalse(os.path.exists(os.path.join(
+            products_dir, 'test-category-slug', 'products', 'test-product-slug-20', 'index.json')))
+        second_page = self.read('categories', 'test-category-slug',
+                                'products', 'page-2.json')
+        self.assertNotIn('test-product-slug-20',
+                         [product['slug'] for product in second_page['category']['products']])
+
+        new_listing = self.read('categories', 'other-category-slug',
+                                'products', 'index.json')
+        self.assertEqual([product['slug'] for product in new_listing['category']['products']],
+                         ['test-product-slug-20'])
+        self.read('categories', 'other-category-slug',
+                  'products', 'test-product-slug-20', 'index.json')
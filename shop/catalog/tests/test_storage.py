@@ -0,0 +1,101 @@
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from catalog.models import Category, Product, ProductImage
+from catalog.storage import ContentAddressedStorage
+
+
+class ContentAddressedStorageTest(SimpleTestCase):
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location)
+        self.storage = ContentAddressedStorage(location=self.location)
+
+    def test_name_is_content_hash(self):
+        name = self.storage.save('product_images/image.JPG', ContentFile(b'image'))
+        self.assertEqual(
+            name, 'product_images/61/6105d6cc76af400325e94d588ce511be5bfdbb73b437dc51eca43917d7a43e3d.jpg')
+        with self.storage.open(name) as f:
+            self.assertEqual(f.read(), b'image')
+
+    def test_same_content_is_stored_once(self):
+        first = self.storage.save('product_images/a.jpg', ContentFile(b'image'))
+        second = self.storage.save('product_images/b.jpg', ContentFile(b'image'))
+
+        self.assertEqual(first, second)
+        directory = os.path.dirname(self.storage.path(first))
+        self.assertEqual(os.listdir(directory), [os.path.basename(first)])
+
+    def test_different_content(self):
+        first = self.storage.save('product_images/a.jpg', ContentFile(b'image'))
+        second = self.storage.save('product_images/a.jpg', ContentFile(b'other'))
+        self.assertNotEqual(first, second)
+
+    def test_existing_file_is_touched(self):
+        name = self.storage.save('product_images/a.jpg', ContentFile(b'image'))
+        os.utime(self.storage.path(name), (0, 0))
+
+        self.storage.save('product_images/b.jpg', ContentFile(b'image'))
+        self.assertGreater(os.path.getmtime(self.storage.path(name)), 0)
+
+    def test_no_temporary_files_are_left(self):
+        self.storage.save('product_images/a.jpg', ContentFile(b'image'))
+        self.storage.save('product_images/b.jpg', ContentFile(b'image'))
+
+        for _, _, files in os.walk(self.location):
+            self.assertFalse([name for name in files if name.endswith('.tmp')])
+
+
+class GcMediaCommandTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Test category name')
+        cls.product = Product.objects.create(
+            category=category, name='Test product name')
+
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location)
+        self.addCleanup(setattr, default_storage, 'location', default_storage.location)
+        default_storage.location = self.location
+
+    def save(self, content, age=0):
+        name = default_storage.save('product_images/image.jpg', ContentFile(content))
+        mtime = time.time() - age
+        os.utime(default_storage.path(name), (mtime, mtime))
+        return name
+
+    def gc(self, *args):
+        out = StringIO()
+        call_command('gc_media', *args, stdout=out)
+        return out.getvalue()
+
+    def test_gc(self):
+        referenced = self.save(b'referenced', age=10 ** 6)
+        unreferenced = self.save(b'unreferenced', age=10 ** 6)
+        recent = self.save(b'recent')
+        image = ProductImage.objects.create(product=self.product)
+        ProductImage.objects.filter(pk=image.pk).update(image_small=referenced)
+
+        self.assertIn('deleted 1 files, 12 bytes', self.gc())
+        self.assertTrue(default_storage.exists(referenced))
+        self.assertFalse(default_storage.exists(unreferenced))
+        self.assertTrue(default_storage.exists(recent))
+
+    def test_dry_run(self):
+        unreferenced = self.save(b'unreferenced', age=10 ** 6)
+
+        out = self.gc('--dry-run')
+        self.assertIn(unreferenced, out)
+        self.assertIn('would delete 1 files', out)
+        self.assertTrue(default_storage.exists(unreferenced))
+
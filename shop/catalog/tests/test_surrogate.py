@@ -0,0 +1,188 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+
+from catalog import stock
+from catalog.models import Category, Product, ProductImage, ProductItem
+from catalog.surrogate import PurgeQueue, purge_queue
+
+
+class PurgeStub:
+    """A local HTTP server recording purge requests, standing in for the proxy."""
+
+    def __init__(self, status=200):
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                stub.requests.append((dict(self.headers), json.loads(body)))
+                self.send_response(status)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_port}/purge'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def keys(self):
+        return {key for _, body in self.requests for key in body['keys']}
+
+
+class SurrogateKeyHeaderTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(
+            name='Test category name', slug='test-category-slug')
+        cls.product = Product.objects.create(
+            category=cls.category, name='Test product name', slug='test-product-slug')
+        ProductItem.objects.create(product=cls.product, size=48, quantity=1)
+        cls.image = ProductImage.objects.create(product=cls.product)
+
+    def keys(self, url, **params):
+        resp = self.client.get(url, params)
+        self.assertEqual(resp.status_code, 200)
+        return resp['Surrogate-Key'].split(' ')
+
+    def test_category_list(self):
+        self.assertEqual(self.keys(reverse('category-list')),
+                         ['categories', f'category-{self.category.id}'])
+
+    def test_product_list(self):
+        url = reverse('product-list', args=[self.category.slug])
+        expected = [f'category-{self.category.id}', f'product-{self.product.id}', f'image-{self.image.id}']
+        self.assertEqual(self.keys(url), expected)
+        # Cached responses carry the same keys.
+        self.assertEqual(self.keys(url), expected)
+
+    def test_product_detail(self):
+        url = reverse('product-detail', args=[self.category.slug, self.product.slug])
+        self.assertEqual(self.keys(url), [
+            f'category-{self.category.id}', f'product-{self.product.id}', f'image-{self.image.id}'])
+
+    def test_product_batch(self):
+        self.assertEqual(self.keys(reverse('product-batch'), ids=f'{self.product.id},999'), [
+            f'product-{self.product.id}', f'image-{self.image.id}', 'product-999'])
+
+    def test_availability(self):
+        self.assertEqual(self.keys(reverse('availability'), ids=f'{self.product.id},999'), [
+            f'product-{self.product.id}', 'product-999'])
+
+    @override_settings(SURROGATE_KEY_HEADER='Cache-Tag')
+    def test_cache_tag_header(self):
+        resp = self.client.get(reverse('category-list'))
+        self.assertEqual(resp['Cache-Tag'], f'categories,category-{self.category.id}')
+        self.assertNotIn('Surrogate-Key', resp)
+
+    @override_settings(SURROGATE_KEY_HEADER='')
+    def test_disabled(self):
+        resp = self.client.get(reverse('category-list'))
+        self.assertNotIn('Surrogate-Key', resp)
+
+
+@override_settings(SURROGATE_PURGE_DELAY=0, SURROGATE_PURGE_TOKEN='secret')
+class PurgeQueueTest(SimpleTestCase):
+    def setUp(self):
+        self.stub = PurgeStub()
+        self.addCleanup(self.stub.close)
+
+    def test_batched_and_deduplicated(self):
+        queue = PurgeQueue()
+        with override_settings(SURROGATE_PURGE_URL=self.stub.url, SURROGATE_PURGE_BATCH_SIZE=2):
+            with queue._condition:
+                # Keys added while the worker is busy are merged.
+                queue.add(['product-1', 'category-1'])
+                queue.add(['product-1', 'product-2'])
+            self.assertTrue(queue.flush(5))
+
+        self.assertEqual([body for _, body in self.stub.requests], [
+            {'keys': ['category-1', 'product-1']},
+            {'keys': ['product-2']},
+        ])
+        self.assertEqual(self.stub.requests[0][0]['Authorization'], 'Bearer secret')
+
+    def test_failures_are_logged(self):
+        self.stub.close()
+        self.stub = PurgeStub(status=500)
+        queue = PurgeQueue()
+
+        with override_settings(SURROGATE_PURGE_URL=self.stub.url), \
+                self.assertLogs('catalog.surrogate', 'ERROR'):
+            queue.add(['product-1'])
+            self.assertTrue(queue.flush(5))
+
+    def test_disabled(self):
+        queue = PurgeQueue()
+        with override_settings(SURROGATE_PURGE_URL=''):
+            queue.add(['product-1'])
+        self.assertIsNone(queue._thread)
+
+
+@override_settings(SURROGATE_PURGE_DELAY=0)
+class PurgeOnChangeTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = Category.objects.create(
+            name='Test category name', slug='test-category-slug')
+        cls.other = Category.objects.create(
+            name='Other category name', slug='other-category-slug')
+        cls.product = Product.objects.create(
+            category=cls.category, name='Test product name', slug='test-product-slug')
+        cls.item = ProductItem.objects.create(product=cls.product, size=48, quantity=1)
+
+    def setUp(self):
+        self.stub = PurgeStub()
+        self.addCleanup(self.stub.close)
+        settings = override_settings(SURROGATE_PURGE_URL=self.stub.url)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def purged(self, change):
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        self.assertTrue(purge_queue.flush(5))
+        return self.stub.keys
+
+    def test_product_moved(self):
+        def change():
+            self.product.category = self.other
+            self.product.save()
+
+        self.assertEqual(self.purged(change), {
+            f'product-{self.product.id}', f'category-{self.category.id}',
+            f'category-{self.other.id}', 'categories', 'changes'})
+
+    def test_image(self):
+        image = ProductImage(product=self.product)
+        keys = self.purged(image.save)
+        self.assertEqual(keys, {f'product-{self.product.id}', f'image-{image.id}', 'changes'})
+
+    def test_stock_change(self):
+        self.assertEqual(self.purged(lambda: stock.reserve([(self.product.id, 48, 1)])), {
+            f'product-{self.product.id}', f'category-{self.category.id}', 'categories', 'changes'})
+
+    def test_nothing_is_sent_before_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.item.save()
+        self.assertTrue(purge_queue.flush(5))
+        self.assertEqual(self.stub.requests, [])
+
+        for callback in callbacks:
+            callback()
+        self.assertTrue(purge_queue.flush(5))
+        self.assertIn(f'product-{self.product.id}', self.stub.keys)
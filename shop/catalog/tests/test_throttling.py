@@ -0,0 +1,133 @@
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from catalog.models import Category
+from catalog.renderer import CatalogRenderer
+from catalog.throttling import TokenBuckets, parse_rate
+
+
+def take_tokens(path, attempts, results):
+    buckets = TokenBuckets(path, 1024)
+    results.put(sum(buckets.take('anon:10.0.0.1', 12, 0.001) == 0 for _ in range(attempts)))
+
+
+class TokenBucketsTest(SimpleTestCase):
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        self.path = os.path.join(location, 'throttle.buckets')
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('120/min'), (120, 2))
+        self.assertEqual(parse_rate('10/s'), (10, 10))
+
+    def test_bucket(self):
+        buckets = TokenBuckets(self.path, 1024)
+        self.addCleanup(buckets.close)
+
+        self.assertEqual([buckets.take('a', 3, 1, now=100) for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(buckets.take('a', 3, 1, now=100), 1)
+        self.assertAlmostEqual(buckets.take('a', 3, 1, now=100.5), 0.5)
+        self.assertEqual(buckets.take('a', 3, 1, now=101), 0)
+        # Another key has its own bucket.
+        self.assertEqual(buckets.take('b', 3, 1, now=101), 0)
+        # Refilling stops at the capacity.
+        self.assertEqual([buckets.take('a', 3, 1, now=200) for _ in range(4)][-1], 1)
+
+    def test_idle_buckets_are_replaced_when_full(self):
+        buckets = TokenBuckets(self.path, 8)
+        self.addCleanup(buckets.close)
+
+        for num in range(8):
+            buckets.take(f'key-{num}', 1, 1, now=100 + num)
+        self.assertEqual(buckets.take('new', 1, 1, now=200), 0)
+        self.assertGreater(buckets.take('new', 1, 1, now=200), 0)
+        # key-0, idle longest, was replaced and starts with a full bucket.
+        self.assertEqual(buckets.take('key-0', 1, 1, now=200), 0)
+        self.assertEqual(os.path.getsize(self.path), 8 * 24)
+
+    def test_shared_between_processes(self):
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        processes = [context.Process(target=take_tokens, args=(self.path, 10, results))
+                     for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        self.assertEqual(sum(results.get() for _ in processes), 12)
+
+
+class TokenBucketThrottleTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        Category.objects.create(name='Test category name', slug='test-category-slug')
+
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        throttle_settings = override_settings(
+            THROTTLE_BUCKETS_FILE=os.path.join(location, 'throttle.buckets'),
+            THROTTLE_RATES={'anon': '2/min', 'trusted': '4/min'},
+            THROTTLE_TRUSTED_IPS=['10.0.0.2'])
+        throttle_settings.enable()
+        self.addCleanup(throttle_settings.disable)
+
+    def statuses(self, count, **extra):
+        return [self.client.get(reverse('category-list'), **extra).status_code
+                for _ in range(count)]
+
+    def test_anonymous(self):
+        self.assertEqual(self.statuses(2, REMOTE_ADDR='10.0.0.1'), [200, 200])
+
+        resp = self.client.get(reverse('category-list'), REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(resp.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(resp['Retry-After'], '30')
+
+        # Other clients are not affected.
+        self.assertEqual(self.statuses(1, REMOTE_ADDR='10.0.0.3'), [200])
+
+    def test_trusted_ip(self):
+        self.assertEqual(self.statuses(5, REMOTE_ADDR='10.0.0.2'), [200] * 4 + [429])
+
+    def test_staff(self):
+        user = User.objects.create_user('staff', password='password', is_staff=True)
+        self.client.force_login(user)
+        self.assertEqual(self.statuses(5, REMOTE_ADDR='10.0.0.1'), [200] * 4 + [429])
+
+    def test_forwarded_for(self):
+        with self.settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1}):
+            self.assertEqual(self.statuses(
+                3, REMOTE_ADDR='127.0.0.1', HTTP_X_FORWARDED_FOR='10.0.0.1'), [200, 200, 429])
+            self.assertEqual(self.statuses(
+                1, REMOTE_ADDR='127.0.0.1', HTTP_X_FORWARDED_FOR='10.0.0.3'), [200])
+
+    def test_forwarded_for_by_local_proxy(self):
+        # Without NUM_PROXIES the entry of a proxy on the same host is used.
+        with self.settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': None}):
+            self.assertEqual(self.statuses(
+                3, REMOTE_ADDR='127.0.0.1', HTTP_X_FORWARDED_FOR='10.0.0.9, 10.0.0.1'), [200, 200, 429])
+            self.assertEqual(self.statuses(
+                1, REMOTE_ADDR='127.0.0.1', HTTP_X_FORWARDED_FOR='10.0.0.3'), [200])
+            # Clients cannot pick their address.
+            self.assertEqual(self.statuses(
+                3, REMOTE_ADDR='10.0.0.4', HTTP_X_FORWARDED_FOR='10.0.0.5'), [200, 200, 429])
+            self.assertEqual(self.statuses(
+                1, REMOTE_ADDR='10.0.0.4', HTTP_X_FORWARDED_FOR='10.0.0.6'), [429])
+
+    def test_internal_renders_are_not_throttled(self):
+        renderer = CatalogRenderer('testserver')
+        for _ in range(5):
+            _, resp = renderer.category_list()
+            self.assertEqual(resp.status_code, 200)
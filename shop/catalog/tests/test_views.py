@@ -4,7 +4,7 @@ from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase
 
-from catalog.models import Category, Product, ProductItem
+from catalog.models import Category, Product, ProductImage, ProductItem
 from catalog.views import CategoryList
 
 
@@ -23,6 +23,20 @@ class CategoryListViewTest(APITestCase):
         resp = self.client.get('/api/v1/categories/')
         self.assertEqual(resp.status_code, status.HTTP_200_OK)
 
+    def test_view_product_counters_in_one_query(self):
+        category = Category.objects.create(name='Test category name')
+        for product_num in range(1, 4):
+            product = Product.objects.create(
+                category=category, name=f'Test product name {product_num}', slug=f'test-product-slug-{product_num}')
+            ProductItem.objects.create(product=product, quantity=product_num - 1)
+
+        with self.assertNumQueries(1):
+            resp = self.client.get(reverse('category-list'))
+
+        categories = json.loads(resp.content)
+        self.assertEqual(categories[0]['products_count'], 3)
+        self.assertEqual(categories[0]['in_stock_count'], 2)
+
     def test_pagination_is_disabled(self):
         self.assertIsNone(CategoryList().pagination_class)
 
@@ -91,6 +105,39 @@ class ProductListViewTest(APITestCase):
             '/api/v1/categories/category-not-exist-slug/products/')
         self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
 
+    def test_view_category_does_not_exist_is_cached(self):
+        self.client.get('/api/v1/categories/category-not-exist-slug/products/')
+
+        with self.assertNumQueries(0):
+            resp = self.client.get(
+                '/api/v1/categories/category-not-exist-slug/products/')
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_sort_options(self):
+        category = Category.objects.get(id=1)
+        Product.objects.filter(id=2).update(
+            price=100, effective_price=70, discount=30)
+        Product.objects.filter(id=3).update(
+            price=50, effective_price=50, discount=0)
+        url = reverse('product-list', args=[category.slug])
+
+        def first_product_id(sort):
+            resp = self.client.get(url, {'sort': sort})
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            return json.loads(resp.content)['category']['products'][0]['id']
+
+        self.assertEqual(first_product_id('newest'), 22)
+        self.assertEqual(first_product_id('price_asc'), 1)
+        self.assertEqual(first_product_id('price_desc'), 2)
+        self.assertEqual(first_product_id('discount'), 2)
+
+    def test_sort_option_not_allowed(self):
+        category = Category.objects.get(id=1)
+
+        resp = self.client.get(
+            reverse('product-list', args=[category.slug]), {'sort': 'name'})
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
 
 class ProductDetailViewTest(APITestCase):
 
@@ -125,7 +172,110 @@ class ProductDetailViewTest(APITestCase):
             '/api/v1/categories/category-not-exist-slug/products/test-product-slug/')
         self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
 
+    def test_view_product_of_other_category(self):
+        Category.objects.create(name='Other category name',
+                                slug='other-category-slug')
+
+        resp = self.client.get(
+            '/api/v1/categories/other-category-slug/products/test-product-slug/')
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_view_product_does_not_exist(self):
         resp = self.client.get(
             '/api/v1/categories/test-category-slug/products/product-not-exist-slug/')
         self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class AvailabilityViewTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(
+            name='Test category name', slug='test-category-slug')
+        for product_num in range(1, 4):
+            product = Product.objects.create(
+                category=category, name=f'Test product name {product_num}', slug=f'test-product-slug-{product_num}')
+            ProductItem.objects.create(product=product, size=50, quantity=product_num)
+            ProductItem.objects.create(product=product, size=48, quantity=0)
+
+    def test_view_by_name(self):
+        with self.assertNumQueries(1):
+            resp = self.client.get(reverse('availability'), {'ids': '2,1,404'})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(json.loads(resp.content), {
+            '2': [{'size': 48, 'quantity': 0}, {'size': 50, 'quantity': 2}],
+            '1': [{'size': 48, 'quantity': 0}, {'size': 50, 'quantity': 1}],
+            '404': [],
+        })
+
+    def test_cache_headers(self):
+        resp = self.client.get(reverse('availability'), {'ids': '1'})
+        self.assertIn('max-age=5', resp['Cache-Control'])
+        self.assertTrue(resp['ETag'])
+
+    def test_not_modified(self):
+        resp = self.client.get(reverse('availability'), {'ids': '1,2'})
+
+        resp = self.client.get(
+            reverse('availability'), {'ids': '1,2'}, HTTP_IF_NONE_MATCH=resp['ETag'])
+        self.assertEqual(resp.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_etag_changes_with_stock(self):
+        etag = self.client.get(reverse('availability'), {'ids': '1'})['ETag']
+        ProductItem.objects.filter(product_id=1, size=50).update(quantity=0)
+
+        resp = self.client.get(
+            reverse('availability'), {'ids': '1'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(resp['ETag'], etag)
+
+    def test_invalid_ids(self):
+        for ids in ['', 'a,b', '0', '1,-2', str(2 ** 63), ','.join(map(str, range(101)))]:
+            with self.subTest(ids=ids):
+                resp = self.client.get(reverse('availability'), {'ids': ids})
+                self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ProductBatchViewTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(
+            name='Test category name', slug='test-category-slug')
+        for product_num in range(1, 31):
+            product = Product.objects.create(
+                category=category, name=f'Test product name {product_num}', slug=f'test-product-slug-{product_num}')
+            ProductItem.objects.create(product=product, quantity=1)
+            ProductImage.objects.create(product=product)
+
+    def test_view_by_ids(self):
+        resp = self.client.get(reverse('product-batch'), {'ids': '3,1,404,2'})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+        data = json.loads(resp.content)
+        self.assertEqual([product['id'] for product in data['products']], [3, 1, 2])
+        self.assertEqual(data['missing'], [404])
+        self.assertEqual(len(data['products'][0]['product_items']), 1)
+        self.assertEqual(len(data['products'][0]['product_images']), 1)
+
+    def test_view_by_slugs(self):
+        resp = self.client.get(reverse('product-batch'), {
+                               'slugs': 'test-product-slug-2,not-exist-slug,test-product-slug-1'})
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+        data = json.loads(resp.content)
+        self.assertEqual([product['id'] for product in data['products']], [2, 1])
+        self.assertEqual(data['missing'], ['not-exist-slug'])
+
+    def test_number_of_queries_is_fixed(self):
+        for ids in ['1', ','.join(map(str, range(1, 31)))]:
+            with self.subTest(ids=ids), self.assertNumQueries(3):
+                self.client.get(reverse('product-batch'), {'ids': ids})
+
+    def test_invalid_request(self):
+        for params in [{}, {'ids': '1', 'slugs': 'a'}, {'slugs': ','.join(f's{num}' for num in range(51))},
+                       {'ids': ','.join(map(str, range(51)))}, {'ids': str(2 ** 63)}, {'ids': '0'}]:
+            with self.subTest(params=params):
+                resp = self.client.get(reverse('product-batch'), params)
+                self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
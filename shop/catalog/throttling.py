@@ -0,0 +1,175 @@
+import fcntl
+import hashlib
+import ipaddress
+import mmap
+import os
+import struct
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+# key hash, tokens, time of the last update
+SLOT = struct.Struct('<Qdd')
+PROBES = 8
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+
+def parse_rate(rate):
+    """'120/min' is a bucket of 120 tokens refilled at 2 per second."""
+    num, period = rate.split('/')
+    return int(num), int(num) / PERIODS[period[0]]
+
+
+def client_address(meta):
+    """
+    Address of the client of a request with these META variables. With
+    NUM_PROXIES set it is taken from X-Forwarded-For as DRF does. Unset,
+    the header is trusted only from a loopback address, i.e. from a reverse
+    proxy on the same host, whose entry is the last one.
+    """
+    remote_addr = meta.get('REMOTE_ADDR')
+    xff = meta.get('HTTP_X_FORWARDED_FOR')
+    num_proxies = api_settings.NUM_PROXIES
+
+    if num_proxies is not None:
+        if num_proxies == 0 or xff is None:
+            return remote_addr
+        addrs = xff.split(',')
+        return addrs[-min(num_proxies, len(addrs))].strip()
+
+    if xff:
+        try:
+            behind_proxy = ipaddress.ip_address(remote_addr).is_loopback
+        except ValueError:
+            behind_proxy = False
+        if behind_proxy:
+            return xff.split(',')[-1].strip()
+    return remote_addr
+
+
+class TokenBuckets:
+    """
+    Token buckets in a memory-mapped file shared by every worker process.
+
+    The file is a fixed open-addressing table of `slots` buckets. A key
+    probes PROBES consecutive slots and, when all are taken by other keys,
+    replaces the one idle longest, so memory stays bounded however many
+    clients appear. Updates hold an fcntl lock on the file, plus a thread
+    lock since fcntl locks are per process.
+    """
+
+    def __init__(self, path, slots):
+        self.path = path
+        self.slots = slots
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        # A mapping inherited over fork() would share the lock of the parent.
+        if self._pid != os.getpid():
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            size = self.slots * SLOT.size
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._fd = fd
+            self._map = mmap.mmap(fd, size)
+            self._pid = os.getpid()
+
+    def close(self):
+        if self._pid == os.getpid():
+            self._map.close()
+            os.close(self._fd)
+        self._pid = None
+
+    def take(self, key, capacity, refill_rate, now=None):
+        """
+        Take a token from the bucket of `key`. Returns 0 if one was
+        available, or else the seconds until one will be.
+        """
+        digest = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') or 1
+        now = time.time() if now is None else now
+
+        with self._lock:
+            self._open()
+            fcntl.lockf(self._fd, fcntl.LOCK_EX)
+            try:
+                slot, tokens, updated = self._find(digest, now, capacity)
+                tokens = min(capacity, tokens + (now - updated) * refill_rate)
+                wait = 0
+                if tokens >= 1:
+                    tokens -= 1
+                else:
+                    wait = (1 - tokens) / refill_rate
+                SLOT.pack_into(self._map, slot * SLOT.size, digest, tokens, now)
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN)
+        return wait
+
+    def _find(self, digest, now, capacity):
+        start = digest % self.slots
+        oldest = None
+        for probe in range(PROBES):
+            slot = (start + probe) % self.slots
+            slot_digest, tokens, updated = SLOT.unpack_from(self._map, slot * SLOT.size)
+            if slot_digest == digest:
+                return slot, tokens, updated
+            if slot_digest == 0:
+                oldest = (slot, 0)
+                break
+            if oldest is None or updated < oldest[1]:
+                oldest = (slot, updated)
+
+        # A new bucket starts full.
+        return oldest[0], capacity, now
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Per-client token bucket throttle with THROTTLE_RATES['anon'] for
+    anonymous clients and THROTTLE_RATES['trusted'] for staff and
+    THROTTLE_TRUSTED_IPS. In-process renders of catalog.renderer are
+    not throttled.
+    """
+    buckets = None
+
+    @staticmethod
+    def get_buckets():
+        cls = TokenBucketThrottle
+        if cls.buckets is None or cls.buckets.path != settings.THROTTLE_BUCKETS_FILE:
+            if cls.buckets is not None:
+                cls.buckets.close()
+            cls.buckets = TokenBuckets(settings.THROTTLE_BUCKETS_FILE, settings.THROTTLE_BUCKETS)
+        return cls.buckets
+
+    @classmethod
+    def take(cls, ident, user=None):
+        """
+        Take a token of a client address or staff user. Returns 0 if one
+        was available, or else the seconds until one will be.
+        """
+        if user is not None and user.is_staff:
+            scope, ident = 'trusted', f'user-{user.pk}'
+        elif ident in settings.THROTTLE_TRUSTED_IPS:
+            scope = 'trusted'
+        else:
+            scope = 'anon'
+
+        capacity, refill_rate = parse_rate(settings.THROTTLE_RATES[scope])
+        return cls.get_buckets().take(f'{scope}:{ident}', capacity, refill_rate)
+
+    def get_ident(self, request):
+        return client_address(request.META)
+
+    def allow_request(self, request, view):
+        if request.META.get('catalog.internal'):
+            return True
+
+        self._wait = self.take(self.get_ident(request), getattr(request, 'user', None))
+        return not self._wait
+
+    def wait(self):
+        return self._wait
@@ -1,6 +1,6 @@
 from django.urls import path
 
-from catalog.views import api_root, CategoryList, ProductList, ProductDetail
+from catalog.views import api_root, cache_stats, Availability, CategoryList, ChangeList, OrderConfirm, OrderDetail, OrderList, ProductBatch, ProductList, ProductDetail, CategorySitemap, ProductSitemap, SitemapIndex, YmlFeed
 
 urlpatterns = [
     path('', api_root),
@@ -10,4 +10,29 @@ urlpatterns = [
          ProductList.as_view(), name='product-list'),
     path('categories/<slug:category_slug>/products/<slug:slug>/',
          ProductDetail.as_view(), name='product-detail'),
+    path('products/',
+         ProductBatch.as_view(), name='product-batch'),
+    path('availability/',
+         Availability.as_view(), name='availability'),
+    path('orders/',
+         OrderList.as_view(), name='order-list'),
+    path('orders/<uuid:token>/',
+         OrderDetail.as_view(), name='order-detail'),
+    path('orders/<uuid:token>/confirm/',
+         OrderConfirm.as_view(), name='order-confirm'),
+    path('changes/',
+         ChangeList.as_view(), name='change-list'),
+    path('feeds/yml/',
+         YmlFeed.as_view(), name='yml-feed'),
+    path('cache/stats/', cache_stats, name='cache-stats'),
+]
+
+# Served at the root, for the storefront host to proxy, see catalog.sitemaps.
+sitemap_urlpatterns = [
+    path('sitemap.xml',
+         SitemapIndex.as_view(), name='sitemap-index'),
+    path('sitemaps/categories.xml',
+         CategorySitemap.as_view(), name='sitemap-categories'),
+    path('sitemaps/products-<int:chunk>.xml',
+         ProductSitemap.as_view(), name='sitemap-products'),
 ]
@@ -1,14 +1,29 @@
-from django.http import Http404
+import hashlib
+import json
 
-from rest_framework import generics
+from django.conf import settings
+from django.db.models import Exists, Max, OuterRef, Subquery
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from rest_framework import generics, status
+from rest_framework.exceptions import ValidationError
 from rest_framework.views import APIView
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
 
-from catalog.models import Category, Product
-from catalog.serializers import CategorySerializer, ProductSerializer
+from catalog import cache, feeds, sitemaps, stock, storefront, surrogate
+from catalog.models import CatalogChange, Category, Order, Product, ProductImage, ProductItem, SimilarProduct
+from catalog.serializers import CatalogChangeSerializer, CategorySerializer, OrderCreateSerializer, OrderSerializer, ProductSerializer, SimilarProductSerializer
 from catalog.pagination import ProductPagination
+from catalog.slugs import category_slugs, product_slugs
+from catalog.throttling import client_address
+
+# The largest primary key the database stores, larger ids fail in queries.
+MAX_ID = 2 ** 63 - 1
 
 
 @api_view(['GET'])
@@ -18,29 +33,111 @@ def api_root(request, format=None):
     })
 
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_stats(request):
+    return Response(cache.catalog_cache.stats())
+
+
+def parse_ids(value, max_count):
+    """Parse a comma separated list of ids, keeping order and dropping duplicates."""
+    try:
+        ids = list(dict.fromkeys(int(id) for id in value.split(',') if id))
+    except ValueError:
+        raise ValidationError({'ids': 'Must be a comma separated list of integers.'})
+    if not ids:
+        raise ValidationError({'ids': 'This parameter is required.'})
+    if not all(1 <= id <= MAX_ID for id in ids):
+        raise ValidationError({'ids': f'Ids must be between 1 and {MAX_ID}.'})
+    if len(ids) > max_count:
+        raise ValidationError(
+            {'ids': f'Ensure there are no more than {max_count} ids.'})
+    return ids
+
+
+def parse_int(params, name, default, min_value=0, max_value=None):
+    try:
+        value = int(params.get(name, default))
+    except ValueError:
+        raise ValidationError({name: 'Must be an integer.'})
+    if value < min_value or (max_value is not None and value > max_value):
+        raise ValidationError({name: f'Must be between {min_value} and {max_value}.'
+                               if max_value is not None else f'Must be at least {min_value}.'})
+    return value
+
+
+def cached(request, compute, scope, *key_parts):
+    """Return response data of a cache scope from the catalog cache, computing it on a miss."""
+    key = ':'.join([
+        'catalog', cache.get_version(scope), request.scheme, request.get_host(),
+        *map(str, key_parts)])
+    return cache.catalog_cache.get_or_set(key, compute, settings.CATALOG_CACHE_TIMEOUT)
+
+
 class CategoryList(generics.ListAPIView):
-    queryset = Category.objects.all()
+    queryset = Category.objects.cached()
     serializer_class = CategorySerializer
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        data = cached(request, self.get_data, cache.CATEGORIES_SCOPE, 'category-list')
+        return surrogate.set_surrogate_keys(Response(data), [
+            surrogate.CATEGORIES_KEY,
+            *(surrogate.category_key(category['id']) for category in data)])
+
+    def get_data(self):
+        serializer = self.get_serializer(self.get_queryset(), many=True)
+        return list(serializer.data)
+
 
 class ProductList(APIView, ProductPagination):
+    # Every ordering is backed by a (category, ...) index on Product, the
+    # primary key tie-breaker is the implicit last column of those indexes.
+    sort_options = {
+        'newest': ['-date_added', '-id'],
+        'price_asc': ['effective_price', 'id'],
+        'price_desc': ['-effective_price', '-id'],
+        'discount': ['-discount', '-id'],
+    }
+    default_sort = 'newest'
+
+    def get_ordering(self, request):
+        sort = request.query_params.get('sort', self.default_sort)
+        if sort not in self.sort_options:
+            raise ValidationError(
+                {'sort': f'Must be one of: {", ".join(self.sort_options)}.'})
+        return self.sort_options[sort]
+
     def get(self, request, category_slug):
-        try:
-            category = Category.objects.get(slug=category_slug)
-        except Category.DoesNotExist:
+        category_id = category_slugs.resolve(category_slug)
+        if category_id is None:
             raise Http404
 
+        ordering = self.get_ordering(request)
+        data = cached(
+            request, lambda: self.get_data(request, category_id, ordering),
+            cache.category_scope(category_id), 'product-list', category_slug, ordering[0],
+            request.query_params.get(self.page_query_param, 1))
+        return surrogate.set_surrogate_keys(Response(data), [
+            surrogate.category_key(category_id),
+            *surrogate.product_data_keys(data['category']['products'])])
+
+    def get_data(self, request, category_id, ordering):
+        category = get_object_or_404(Category.objects.cached(), pk=category_id)
+
+        in_stock = ProductItem.objects.filter(
+            product=OuterRef('pk'), quantity__gt=0)
         products = Product.objects.filter(
-            category__slug=category_slug, product_items__quantity__gt=0
-        ).distinct()
+            Exists(in_stock), category_id=category_id
+        ).order_by(*ordering).prefetch_related(
+            'product_images', 'product_items')
 
         results = self.paginate_queryset(products, request, view=self)
         product_serializer = ProductSerializer(
             results, context={"request": request}, many=True)
         category_serializer = CategorySerializer(category)
 
-        return self.get_paginated_response(product_serializer.data, category_serializer.data)
+        return self.get_paginated_data(product_serializer.data, category_serializer.data)
 
 
 class ProductDetail(generics.RetrieveAPIView):
@@ -48,6 +145,248 @@ class ProductDetail(generics.RetrieveAPIView):
     lookup_field = 'slug'
 
     def get_queryset(self):
-        category_slug = self.kwargs['category_slug']
+        return Product.objects.prefetch_related('product_images', 'product_items')
+
+    def get_object(self):
+        category_id = category_slugs.resolve(self.kwargs['category_slug'])
+        product = product_slugs.resolve(self.kwargs['slug'])
+        if category_id is None or product is None or product[1] != category_id:
+            raise Http404
+
+        obj = get_object_or_404(self.get_queryset(), pk=product[0])
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    def retrieve(self, request, *args, **kwargs):
+        product = product_slugs.resolve(kwargs['slug'])
+        if product is None:
+            raise Http404
+
+        data = cached(
+            request, self.get_data, cache.product_scope(product[0]),
+            'product-detail', kwargs['category_slug'], kwargs['slug'])
+        # The URL contains the category slug.
+        return surrogate.set_surrogate_keys(Response(data), [
+            surrogate.category_key(category_slugs.resolve(kwargs['category_slug'])),
+            *surrogate.product_data_keys([data]),
+            *(surrogate.product_key(similar['id']) for similar in data['similar_products'])])
+
+    def get_data(self):
+        product = self.get_object()
+        return {
+            **self.get_serializer(product).data,
+            'similar_products': SimilarProductSerializer(
+                self.get_similar_products(product), many=True, context=self.get_serializer_context()).data,
+        }
+
+    def get_similar_products(self, product):
+        """In stock recommendations of build_similar, with their first image, in one query."""
+        in_stock = ProductItem.objects.filter(
+            product=OuterRef('similar'), quantity__gt=0)
+        image = ProductImage.objects.filter(
+            product=OuterRef('similar')).order_by('sort').values('image_small')[:1]
+        return SimilarProduct.objects.filter(
+            Exists(in_stock), product=product
+        ).select_related('similar__category').annotate(image_small=Subquery(image))
+
+
+class ProductBatch(APIView):
+    """Products by ids or slugs in the requested order, in a fixed number of queries."""
+    max_products = 50
+
+    def get(self, request):
+        ids = request.query_params.get('ids')
+        slugs = request.query_params.get('slugs')
+        if (ids is None) == (slugs is None):
+            raise ValidationError(
+                {'detail': 'Exactly one of ids or slugs is required.'})
+
+        if ids is not None:
+            keys = parse_ids(ids, self.max_products)
+            field = 'id'
+        else:
+            keys = list(dict.fromkeys(slug for slug in slugs.split(',') if slug))
+            if not keys or len(keys) > self.max_products:
+                raise ValidationError(
+                    {'slugs': f'Ensure there are 1 to {self.max_products} slugs.'})
+            field = 'slug'
+
+        products = Product.objects.filter(**{f'{field}__in': keys}).prefetch_related(
+            'product_images', 'product_items')
+        found = {getattr(product, field): product for product in products}
+
+        serializer = ProductSerializer(
+            [found[key] for key in keys if key in found], context={'request': request}, many=True)
+        missing = [key for key in keys if key not in found]
+        # Products created later with a missing id replace their key too.
+        return surrogate.set_surrogate_keys(Response({
+            'products': serializer.data,
+            'missing': missing,
+        }), [
+            *surrogate.product_data_keys(serializer.data),
+            *(surrogate.product_key(key) for key in missing if field == 'id')])
+
+
+class Availability(APIView):
+    """Sizes and quantities of many products, cheap enough to poll."""
+    max_ids = 100
+
+    def get(self, request):
+        ids = parse_ids(request.query_params.get('ids', ''), self.max_ids)
+
+        data = {str(id): [] for id in ids}
+        items = ProductItem.objects.filter(product_id__in=ids).values_list(
+            'product_id', 'size', 'quantity')
+        for product_id, size, quantity in sorted(items):
+            data[str(product_id)].append({'size': size, 'quantity': quantity})
+
+        etag = '"%s"' % hashlib.md5(json.dumps(
+            data, separators=(',', ':')).encode()).hexdigest()
+        response = get_conditional_response(request, etag=etag) or Response(data)
+        response['ETag'] = etag
+        surrogate.set_surrogate_keys(response, map(surrogate.product_key, ids))
+        patch_cache_control(
+            response, public=True, max_age=settings.AVAILABILITY_MAX_AGE)
+        return response
+
+
+def order_client(request):
+    """The user or the session ordering, None without either."""
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    if request.session.session_key:
+        return f'session:{request.session.session_key}'
+    return None
+
+
+class OrderList(APIView):
+    def get(self, request):
+        """Orders of the client, none without a user or session."""
+        client = order_client(request)
+        if client is None:
+            return Response([])
+
+        orders = Order.objects.filter(client=client).prefetch_related('order_lines__product_item')
+        return Response(OrderSerializer(orders, many=True).data)
+
+    def post(self, request):
+        serializer = OrderCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        client = order_client(request)
+        if client is None:
+            # Sessions start with the first order, every new one is still
+            # limited by the reservations of its address.
+            request.session.save()
+            client = order_client(request)
+
+        try:
+            order = stock.reserve([
+                (line['product'], line['size'], line['quantity'])
+                for line in serializer.validated_data['order_lines']
+            ], client, client_address(request.META) or '')
+        except stock.OutOfStock as e:
+            return Response({'unavailable': [
+                {'product': product, 'size': size} for product, size in e.unavailable
+            ]}, status=status.HTTP_409_CONFLICT)
+        except stock.ReservationLimitExceeded as e:
+            return Response({'detail': f'At most {e.limit} items can be reserved.'},
+                            status=status.HTTP_409_CONFLICT)
+
+        return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
+
+
+class OrderDetail(APIView):
+    def get_object(self, token):
+        return get_object_or_404(
+            Order.objects.prefetch_related('order_lines__product_item'), token=token)
+
+    def get(self, request, token):
+        return Response(OrderSerializer(self.get_object(token)).data)
+
+    def delete(self, request, token):
+        if not stock.release(self.get_object(token)):
+            return Response({'detail': 'Order is not reserved.'}, status=status.HTTP_409_CONFLICT)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class OrderConfirm(APIView):
+    def post(self, request, token):
+        order = get_object_or_404(Order, token=token)
+        try:
+            stock.confirm(order)
+        except stock.ReservationExpired:
+            return Response({'detail': 'Reservation has expired.'}, status=status.HTTP_409_CONFLICT)
+        return Response({'status': order.status})
+
+
+class ChangeList(APIView):
+    """
+    Catalog changes after the `since` revision, oldest first. Clients store
+    `next_since` and repeat while `has_more` is true; a full sync starts
+    from the `revision` read before fetching the listings.
+    """
+    page_size = 100
+    max_page_size = 1000
+
+    def get(self, request):
+        since = parse_int(request.query_params, 'since', 0, max_value=MAX_ID)
+        limit = parse_int(request.query_params, 'limit', self.page_size,
+                          min_value=1, max_value=self.max_page_size)
+
+        changes = list(CatalogChange.objects.filter(pk__gt=since).order_by('pk')[:limit + 1])
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+
+        return surrogate.set_surrogate_keys(Response({
+            'revision': CatalogChange.objects.aggregate(revision=Max('pk'))['revision'] or 0,
+            'changes': CatalogChangeSerializer(changes, many=True).data,
+            'next_since': changes[-1].pk if changes else since,
+            'has_more': has_more,
+        }), [surrogate.CHANGES_KEY])
+
+
+class YmlFeed(APIView):
+    """The YML offer feed of catalog.feeds, streamed as it is generated."""
+
+    def get(self, request):
+        response = StreamingHttpResponse(
+            feeds.yml_feed(request.build_absolute_uri), content_type='application/xml; charset=utf-8')
+        # Every catalog change purges CHANGES_KEY.
+        return surrogate.set_surrogate_keys(response, [surrogate.CHANGES_KEY])
+
+
+class SitemapIndex(APIView):
+    """The storefront sitemap index of catalog.sitemaps."""
+
+    def get(self, request):
+        def chunk_location(chunk):
+            if chunk is None:
+                return storefront.url(reverse('sitemap-categories'))
+            return storefront.url(reverse('sitemap-products', args=[chunk]))
+
+        content = sitemaps.get_or_render(
+            'index', sitemaps.INDEX_CHUNK, lambda: sitemaps.render_index(chunk_location))
+        return sitemap_response(content)
+
+
+class CategorySitemap(APIView):
+    def get(self, request):
+        return sitemap_response(sitemaps.get_or_render(
+            'categories', sitemaps.INDEX_CHUNK, sitemaps.render_categories))
+
+
+class ProductSitemap(APIView):
+    def get(self, request, chunk):
+        # Unlisted chunks would each cache an empty sitemap.
+        if chunk not in sitemaps.get_chunks():
+            raise Http404
+
+        return sitemap_response(sitemaps.get_or_render(
+            f'products:{chunk}', chunk, lambda: sitemaps.render_products(chunk)))
+
 
-        return Product.objects.filter(category__slug=category_slug)
+def sitemap_response(content):
+    # Every catalog change purges CHANGES_KEY.
+    return surrogate.set_surrogate_keys(
+        HttpResponse(content, content_type='application/xml; charset=utf-8'), [surrogate.CHANGES_KEY])
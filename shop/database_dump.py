@@ -10,7 +10,7 @@ from django.conf import settings
 from django.apps import apps
 from django.db import connections
 from django.core.files import File
-from shop.settings import MEDIA_ROOT
+from shop.settings import CATALOG_CACHE_LOCAL_ENTRIES, MEDIA_ROOT, PRODUCT_IMAGE_MAX_PIXELS, SITEMAP_CHUNK_SIZE
 
 CATEGORIES = [
     {'id': 1, 'name': 'Блузки и Жакеты',
@@ -50,6 +50,12 @@ def configure_app(old_db_name, old_db_user, old_db_password):
             'catalog'
         ],
         'MEDIA_ROOT': MEDIA_ROOT,
+        'DEFAULT_FILE_STORAGE': 'catalog.storage.ContentAddressedStorage',
+        'CATALOG_CACHE_LOCAL_ENTRIES': CATALOG_CACHE_LOCAL_ENTRIES,
+        'PRODUCT_IMAGE_MAX_PIXELS': PRODUCT_IMAGE_MAX_PIXELS,
+        # Read by catalog.signals on every save.
+        'SURROGATE_PURGE_URL': '',
+        'SITEMAP_CHUNK_SIZE': SITEMAP_CHUNK_SIZE,
         'DATABASES': {
             'default': {
                 'ENGINE': 'django.db.backends.sqlite3',
@@ -13,4 +13,16 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'shop.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up.
+from catalog.events import PATH as STOCK_EVENTS_PATH, stock_events  # noqa: E402
+
+
+async def application(scope, receive, send):
+    # Server-Sent Events bypass the Django request stack, which would hold a
+    # thread per open connection.
+    if scope['type'] == 'http' and scope['path'] == STOCK_EVENTS_PATH:
+        await stock_events(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
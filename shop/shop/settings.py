@@ -49,6 +49,8 @@ INSTALLED_APPS = [
 CORS_ALLOWED_ORIGINS = [
     'http://localhost:3000',
 ]
+# Orders belong to the session of the storefront.
+CORS_ALLOW_CREDENTIALS = True
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
@@ -59,10 +61,14 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'catalog.profiling.ProfilingMiddleware',
+    'catalog.querybudget.QueryBudgetMiddleware',
 ]
 
 ROOT_URLCONF = 'shop.urls'
 
+TEST_RUNNER = 'shop.test_runner.TestRunner'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -88,9 +94,110 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Concurrent checkouts wait for the write lock instead of failing.
+        'OPTIONS': {
+            'timeout': 20,
+        },
     }
 }
 
+# Django REST framework
+# https://www.django-rest-framework.org/api-guide/settings/
+
+REST_FRAMEWORK = {
+    'DEFAULT_THROTTLE_CLASSES': [
+        'catalog.throttling.TokenBucketThrottle',
+    ],
+    # Set to the number of reverse proxies in front of Django, so clients
+    # are told apart by X-Forwarded-For instead of the proxy address. Unset,
+    # the header of a proxy on the same host is used, see catalog.throttling.
+    'NUM_PROXIES': int(environ['NUM_PROXIES']) if environ.get('NUM_PROXIES') else None,
+}
+
+# Token buckets shared by all workers through this memory-mapped file, see
+# catalog.throttling. A rate 'N/period' allows bursts of N requests.
+THROTTLE_BUCKETS_FILE = environ.get(
+    'THROTTLE_BUCKETS_FILE', default=str(BASE_DIR / 'throttle.buckets'))
+THROTTLE_BUCKETS = 65536
+THROTTLE_RATES = {
+    'anon': environ.get('THROTTLE_ANON_RATE', default='120/min'),
+    'trusted': environ.get('THROTTLE_TRUSTED_RATE', default='1200/min'),
+}
+# Space separated client addresses throttled at the trusted rate.
+THROTTLE_TRUSTED_IPS = environ.get('THROTTLE_TRUSTED_IPS', default='').split()
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# Use a backend shared by all workers in production, e.g.
+# django.core.cache.backends.memcached.PyMemcacheCache.
+
+CACHES = {
+    'default': {
+        'BACKEND': environ.get('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': environ.get('CACHE_LOCATION', default=''),
+    }
+}
+
+CATALOG_CACHE_TIMEOUT = 60 * 15
+CATALOG_CACHE_LOCAL_ENTRIES = 512
+
+# Results of CachingQuerySet.cached(), see catalog.querycache. Larger
+# results are not stored.
+QUERY_CACHE_TIMEOUT = 60 * 15
+QUERY_CACHE_MAX_ROWS = 1000
+
+# Seconds of database time an API request may spend, by URL name or else the
+# db_time_budget of the view, before it fails with 503. On SQLite a running
+# query is interrupted at the deadline. Slower queries are logged with their
+# plan by catalog.querybudget.
+DB_TIME_BUDGET = float(environ.get('DB_TIME_BUDGET', default=5))
+DB_TIME_BUDGETS = {
+    'product-list': 2,
+    # Streamed bodies count too, the feed reads the whole catalog.
+    'yml-feed': 30,
+}
+SLOW_QUERY_THRESHOLD = float(environ.get('SLOW_QUERY_THRESHOLD', default=0.5))
+
+# Catalog responses name the categories, products and images they contain in
+# this header ('Surrogate-Key' for Fastly/Varnish xkey, 'Cache-Tag' for
+# Cloudflare). Changes POST {"keys": [...]} to SURROGATE_PURGE_URL, if set.
+SURROGATE_KEY_HEADER = environ.get('SURROGATE_KEY_HEADER', default='Surrogate-Key')
+SURROGATE_PURGE_URL = environ.get('SURROGATE_PURGE_URL', default='')
+SURROGATE_PURGE_TOKEN = environ.get('SURROGATE_PURGE_TOKEN', default='')
+SURROGATE_PURGE_BATCH_SIZE = 100
+SURROGATE_PURGE_DELAY = 0.5
+SURROGATE_PURGE_TIMEOUT = 5
+
+# Seconds clients and proxies may cache /api/v1/availability/ responses.
+AVAILABILITY_MAX_AGE = 5
+
+# Stock events of catalog.events: seconds between reads of the change log
+# and between heartbeats of idle connections.
+STOCK_EVENTS_POLL_INTERVAL = 1
+STOCK_EVENTS_HEARTBEAT = 15
+# Open connections of one client address per worker. Opening them takes
+# tokens of the throttle as requests do.
+STOCK_EVENTS_MAX_CONNECTIONS_PER_IP = int(environ.get('STOCK_EVENTS_MAX_CONNECTIONS_PER_IP', default=10))
+
+# Storefront, linked from the marketplace feed and the sitemaps.
+
+SHOP_NAME = environ.get('SHOP_NAME', default='Русская леди')
+SHOP_COMPANY = environ.get('SHOP_COMPANY', default='Русская леди')
+SHOP_URL = environ.get('SHOP_URL', default='https://xn----7sbndqhj0bjau2m.xn--p1ai')
+
+# Product sitemaps of catalog.sitemaps cover this many primary keys each,
+# sitemaps may list at most 50000 URLs.
+SITEMAP_CHUNK_SIZE = 10000
+SITEMAP_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Orders
+
+ORDER_RESERVATION_TIMEOUT = 60 * 15
+# Units one user or session may hold in reserved orders at a time.
+ORDER_MAX_RESERVED_UNITS = int(environ.get('ORDER_MAX_RESERVED_UNITS', default=20))
+# Units one client address may hold, higher for customers sharing an address.
+ORDER_MAX_RESERVED_UNITS_PER_IP = int(environ.get('ORDER_MAX_RESERVED_UNITS_PER_IP', default=100))
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -129,7 +236,38 @@ STATIC_URL = '/static/'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media/'
 
+# Store uploads under the hash of their content, see catalog.storage.
+DEFAULT_FILE_STORAGE = 'catalog.storage.ContentAddressedStorage'
+
+# Uploads are always streamed to a temporary file instead of memory.
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+
+# Product images with more pixels are rejected before they are decoded.
+PRODUCT_IMAGE_MAX_PIXELS = int(environ.get('PRODUCT_IMAGE_MAX_PIXELS', default=50_000_000))
+
+# How MEDIA_URL is served, see catalog.media:
+# 'static' - django.views.static.serve, only with DEBUG;
+# 'accel' - Django checks the path, nginx sends the file via X-Accel-Redirect
+#   from an `internal` location at MEDIA_ACCEL_REDIRECT_PREFIX;
+# 'sendfile' - FileResponse with Range and conditional requests, which the
+#   WSGI server's file_wrapper can send with sendfile().
+MEDIA_SERVE_MODE = environ.get('MEDIA_SERVE_MODE', default='static')
+MEDIA_ACCEL_REDIRECT_PREFIX = environ.get(
+    'MEDIA_ACCEL_REDIRECT_PREFIX', default='/protected-media/')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Request profiling
+# Generate a token with `python manage.py profile_token` and pass it in the
+# X-Profile-Token header or the `profile` query parameter. A token profiles
+# one request: used tokens are remembered in the cache, which must be shared
+# by all workers (CACHE_BACKEND) for that to hold across processes.
+
+PROFILING_ROOT = BASE_DIR / 'profiles/'
+PROFILING_TOKEN_MAX_AGE = 60 * 10
+PROFILING_SAMPLE_INTERVAL = 0.001
@@ -0,0 +1,26 @@
+import shutil
+import tempfile
+
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Runs the tests with throttle buckets of their own, in a temporary file
+    instead of the one shared with a running server, and a rate no test
+    reaches. Throttling tests override it.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.throttle_dir = tempfile.mkdtemp()
+        self.throttle_settings = override_settings(
+            THROTTLE_BUCKETS_FILE=f'{self.throttle_dir}/throttle.buckets',
+            THROTTLE_RATES={'anon': '100000/min', 'trusted': '100000/min'})
+        self.throttle_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.throttle_settings.disable()
+        shutil.rmtree(self.throttle_dir)
+        super().teardown_test_environment(**kwargs)
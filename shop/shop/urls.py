@@ -1,9 +1,11 @@
-from django.conf import settings
-from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from catalog.media import media_urlpatterns
+from catalog.urls import sitemap_urlpatterns
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/v1/', include('catalog.urls')),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    *sitemap_urlpatterns,
+] + media_urlpatterns()